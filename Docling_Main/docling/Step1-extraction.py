@@ -1,79 +1,132 @@
+import os
+
 from docling.document_converter import DocumentConverter
+from utils.fetch_cache import FetchCache
+from utils.metrics import metrics
+from utils.parallel_extraction import extract_parallel
 from utils.sitemap import get_sitemap_urls
-
-converter = DocumentConverter()
-
-# --------------------------------------------------------------
-# Basic PDF extraction
-# Document 1
-# Original Document - https://www.safetyforward.com/docs/legal.pdf
-# Document 2
-# https://www.apple.com/newsroom/pdfs/fy2024-q1/FY24_Q1_Consolidated_Financial_Statements.pdf
-# This document is about not using mobile phones while driving a motor vehicle and prohibits disabling its motion restriction features.
-# --------------------------------------------------------------
-
-result = converter.convert("https://www.apple.com/newsroom/pdfs/fy2024-q1/FY24_Q1_Consolidated_Financial_Statements.pdf")
-
-document = result.document
-markdown_output = document.export_to_markdown()
-json_output = document.export_to_dict()
-print(markdown_output)
-
-# --------------------------------------------------------------
-# Basic Excel file  extraction
-# Excel file 
-# --------------------------------------------------------------
-result = converter.convert("your folder path/Docling_Main/docling/uploaded_file.xlsx")
-
-document = result.document
-markdown_output = document.export_to_markdown()
-json_output = document.export_to_dict()
-print(markdown_output)
-
-# --------------------------------------------------------------
-# Basic HTML extraction
-# --------------------------------------------------------------
-
-result = converter.convert("https://python.langchain.com/docs/introduction/")
-
-document = result.document
-markdown_output = document.export_to_markdown()
-print(markdown_output)
-
-# --------------------------------------------------------------
-# Scrape multiple pages using the sitemap
-# --------------------------------------------------------------
-
-sitemap_urls = get_sitemap_urls("https://www.langchain.com/")
-
-# Print the sitemap URLs
-print("\nSitemap URLs from https://www.langchain.com/:")
-for i, url in enumerate(sitemap_urls, 1):
-    print(f"{i}. {url}")
-print(f"\nTotal URLs found: {len(sitemap_urls)}")
-
-conv_results_iter = converter.convert_all(sitemap_urls)
-
-docs = []
-for result in conv_results_iter:
-    if result.document:
-        document = result.document
-        docs.append(document)
-
-# Print information about all collected documents
-print("\nCollected Documents:")
-for i, doc in enumerate(docs, 1):
-    # Print document title or URL if available
-    title = getattr(doc, 'title', None) or getattr(doc, 'url', f"Document {i}")
-    print(f"\n{i}. {title}")
-    
-    # Print document content (markdown format)
-    try:
-        markdown = doc.export_to_markdown()
-        # Print first 200 characters of content as preview
-        preview = markdown[:200] + "..." if len(markdown) > 200 else markdown
-        print(f"Preview: {preview}")
-    except Exception as e:
-        print(f"Could not export document to markdown: {e}")
-
-print(f"\nTotal documents collected: {len(docs)}")
+from utils.spreadsheet import SpreadsheetChunker
+from utils.tokenizer import OpenAICompatibleTokenizerWrapper
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MAX_WORKERS = os.cpu_count()  # Worker processes used to convert the sitemap pages
+# Remote documents are kept here and revalidated with ETag/Last-Modified on later runs
+DOWNLOAD_CACHE_DIR = "data/download_cache"
+# Per-document timings are appended here; totals are written in Prometheus text format
+METRICS_DIR = "data/metrics"
+SPREADSHEET_WINDOW_TOKENS = 512  # Tokens per row window, header row included
+
+
+def main():
+    metrics.configure(os.path.join(METRICS_DIR, "step1.jsonl"))
+    converter = DocumentConverter()
+    fetch_cache = FetchCache(DOWNLOAD_CACHE_DIR)
+
+    # --------------------------------------------------------------
+    # Basic PDF extraction
+    # Document 1
+    # Original Document - https://www.safetyforward.com/docs/legal.pdf
+    # Document 2
+    # https://www.apple.com/newsroom/pdfs/fy2024-q1/FY24_Q1_Consolidated_Financial_Statements.pdf
+    # This document is about not using mobile phones while driving a motor vehicle and prohibits disabling its motion restriction features.
+    # --------------------------------------------------------------
+
+    result = converter.convert(
+        fetch_cache.fetch(
+            "https://www.apple.com/newsroom/pdfs/fy2024-q1/FY24_Q1_Consolidated_Financial_Statements.pdf"
+        ).stream()
+    )
+
+    document = result.document
+    markdown_output = document.export_to_markdown()
+    json_output = document.export_to_dict()
+    print(markdown_output)
+
+    # --------------------------------------------------------------
+    # Excel file extraction
+    # Workbooks are streamed row by row in read-only mode instead of being
+    # converted into one document: every sheet is cut into windows of
+    # consecutive rows under its header row, at most SPREADSHEET_WINDOW_TOKENS
+    # tokens each, so the workbook is never held in memory as a whole.
+    # Step3-embedding.py ingests .xlsx sources the same way.
+    # --------------------------------------------------------------
+
+    spreadsheet_chunker = SpreadsheetChunker(
+        OpenAICompatibleTokenizerWrapper(), max_tokens=SPREADSHEET_WINDOW_TOKENS
+    )
+    windows = 0
+    for window in spreadsheet_chunker.chunk(os.path.join(SCRIPT_DIR, "uploaded_file.xlsx")):
+        if windows == 0:
+            print(window.text)
+        windows += 1
+    print(f"\n{windows} row windows from uploaded_file.xlsx")
+
+    # --------------------------------------------------------------
+    # Basic HTML extraction
+    # --------------------------------------------------------------
+
+    result = converter.convert(
+        fetch_cache.fetch("https://python.langchain.com/docs/introduction/").stream()
+    )
+
+    document = result.document
+    markdown_output = document.export_to_markdown()
+    print(markdown_output)
+
+    # --------------------------------------------------------------
+    # Scrape multiple pages using the sitemap
+    # --------------------------------------------------------------
+
+    sitemap_urls = get_sitemap_urls("https://www.langchain.com/")
+
+    # Print the sitemap URLs
+    print("\nSitemap URLs from https://www.langchain.com/:")
+    for i, url in enumerate(sitemap_urls, 1):
+        print(f"{i}. {url}")
+    print(f"\nTotal URLs found: {len(sitemap_urls)}")
+
+    # --------------------------------------------------------------
+    # Convert the pages in parallel
+    # Each worker process holds its own DocumentConverter; every document is
+    # written to data/extracted/ as JSON as soon as it is converted, and
+    # failures are reported without aborting the batch. Pages that answer
+    # 304 Not Modified keep their JSON from the last run and are not converted.
+    # --------------------------------------------------------------
+
+    succeeded = failed = unchanged = 0
+    with metrics.span("extract_parallel", workers=MAX_WORKERS):
+        for i, extraction in enumerate(
+            extract_parallel(
+                sitemap_urls,
+                output_dir="data/extracted",
+                max_workers=MAX_WORKERS,
+                cache_dir=DOWNLOAD_CACHE_DIR,
+            ),
+            1,
+        ):
+            if extraction.unchanged:
+                unchanged += 1
+                print(f"{i}. {extraction.source} unchanged -> {extraction.path}")
+            elif extraction.ok:
+                succeeded += 1
+                print(f"{i}. {extraction.source} ({extraction.seconds:.1f}s) -> {extraction.path}")
+            else:
+                failed += 1
+                print(f"{i}. {extraction.source} FAILED after {extraction.seconds:.1f}s: {extraction.error}")
+
+    print(f"\nTotal documents converted: {succeeded}, unchanged: {unchanged}, failed: {failed}")
+
+    # --------------------------------------------------------------
+    # Metrics: throughput across all workers, per-document conversion time
+    # --------------------------------------------------------------
+
+    print(f"\nDocuments/s: {metrics.rate('documents_converted', 'extract_parallel'):.2f}")
+    print(f"Pages/s: {metrics.rate('pages_converted', 'extract_parallel'):.2f}")
+    print(metrics.summary())
+    metrics.write_prometheus(os.path.join(METRICS_DIR, "step1.prom"))
+
+
+# Worker processes of the parallel extraction re-import this script,
+# so everything runs under the main guard.
+if __name__ == "__main__":
+    main()
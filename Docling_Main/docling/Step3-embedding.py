@@ -1,19 +1,47 @@
+from itertools import chain
 from typing import List
 
 import lancedb
-from docling.chunking import HybridChunker
 from docling.document_converter import DocumentConverter
 from dotenv import load_dotenv
 from lancedb.embeddings import get_registry
 from lancedb.pydantic import LanceModel, Vector
 from openai import OpenAI
+from utils.embedding_cache import CachedOpenAIEmbeddings  # noqa: F401 (registers "openai-cached")
+from utils.document_store import DocumentStore, converter_options_key
+from utils.embedding_pipeline import EmbeddingPipeline, EmbeddingReport
+from utils.fetch_cache import FetchCache
+from utils.hybrid_search import ensure_fts_index
+from utils.metrics import metrics
+from utils.ingestion import (
+    delete_sources,
+    has_hash_columns,
+    has_metadata_fields,
+    load_source_hashes,
+    plan_ingestion,
+    source_hash,
+)
+from utils.near_duplicates import (
+    ChunkDeduplicator,
+    NearDuplicateIndex,
+    seed_index,
+    sources_sharing_rows,
+)
+from utils.pipeline import run_ingestion, run_spreadsheet_ingestion
+from utils.spreadsheet import SpreadsheetChunker, is_spreadsheet
+from utils.chunking import FastHybridChunker
+from utils.collection_manager import DEFAULT_COLLECTION, CollectionManager, ensure_scalar_indexes
 from utils.tokenizer import OpenAICompatibleTokenizerWrapper
-
-import glob
-import os
+from utils.retrieval import hits_from_arrow, metadata_filter
+from utils.table_export import export_excel_preview, export_table
+from utils.vector_index import ensure_vector_index, vector_search
+from utils.vector_storage import VectorStorage, has_int8_rerank
 
 load_dotenv()
 
+# Stage timings are appended to data/metrics/step3.jsonl as they happen
+metrics.configure("data/metrics/step3.jsonl")
+
 # Initialize OpenAI client (make sure you have OPENAI_API_KEY in your environment variables)
 client = OpenAI()
 
@@ -23,25 +51,50 @@ MAX_TOKENS = 8191  # text-embedding-3-large's maximum context length
 
 
 # --------------------------------------------------------------
-# Extract the data
+# Collections and the sources to ingest into each
+# Every collection (e.g. one per customer) is its own LanceDB table, so
+# searches in Step4-chat.py never read another collection's chunks.
+# Every run compares a content hash of each source against the hash stored
+# in its collection: unchanged sources are skipped entirely, changed ones
+# are re-chunked and only their new chunks are embedded, and sources
+# removed from a list are deleted from the collection.
+# Set REBUILD = True to drop the tables and re-embed everything, and list
+# collections to delete entirely in DROP_COLLECTIONS.
 # --------------------------------------------------------------
 
-converter = DocumentConverter()
-result = converter.convert("https://www.safetyforward.com/docs/legal.pdf")
+COLLECTIONS = {
+    DEFAULT_COLLECTION: [
+        "https://www.safetyforward.com/docs/legal.pdf",
+        # "uploaded_file.xlsx",  # spreadsheets are ingested as row windows
+    ],
+}
+REBUILD = False
+DROP_COLLECTIONS = []
 
+# Remote sources are kept in data/download_cache and revalidated with
+# ETag/Last-Modified: an unchanged source costs one 304 and is never re-downloaded
+fetch_cache = FetchCache("data/download_cache")
 
-# --------------------------------------------------------------
-# Apply hybrid chunking
-# --------------------------------------------------------------
+converter = DocumentConverter()
+# Converted documents are kept in data/documents (keyed by source hash and
+# converter options), so re-chunking with other settings or REBUILD = True
+# never converts an unchanged source again
+document_store = DocumentStore("data/documents", converter_options_key(converter))
 
-chunker = HybridChunker(
+# FastHybridChunker measures spans with the tokenizer's memoized count_tokens
+chunker = FastHybridChunker(
     tokenizer=tokenizer,
     max_tokens=MAX_TOKENS,
     merge_peers=True,
 )
 
-chunk_iter = chunker.chunk(dl_doc=result.document)
-chunks = list(chunk_iter)
+# Spreadsheet sources (.xlsx, .xlsm) are read row by row in read-only mode
+# and cut into windows of consecutive rows under the sheet's header row,
+# each at most SPREADSHEET_WINDOW_TOKENS tokens and recording its sheet and
+# row range, so a workbook is never held in memory as a whole
+SPREADSHEET_WINDOW_TOKENS = 512
+
+spreadsheet_chunker = SpreadsheetChunker(tokenizer, max_tokens=SPREADSHEET_WINDOW_TOKENS)
 
 # --------------------------------------------------------------
 # Create a LanceDB database and table
@@ -49,10 +102,36 @@ chunks = list(chunk_iter)
 
 # Create a LanceDB database
 db = lancedb.connect("data/lancedb")
+collections = CollectionManager(db)
 
+for name in DROP_COLLECTIONS:
+    print(f"Dropping collection '{name}'")
+    collections.drop(name)
 
-# Get the OpenAI embedding function as a function and use text-embedding-3-large model for embedding
-func = get_registry().get("openai").create(name="text-embedding-3-large")
+
+# --------------------------------------------------------------
+# Vector storage mode
+# EMBEDDING_DIMS = None stores the full 3072-dim vectors (~12 KB per chunk).
+# 256 or 1024 stores text-embedding-3-large's shortened vectors instead,
+# and INT8_RERANK = True additionally keeps the full vector as int8 codes
+# (~3 KB) so Step4-chat.py can rerank the top candidates at near full
+# precision. Compare the modes with benchmarks/bench_vector_storage.py.
+# Changing the mode rebuilds the table.
+# --------------------------------------------------------------
+
+EMBEDDING_DIMS = None
+INT8_RERANK = False
+
+storage = VectorStorage(dims=EMBEDDING_DIMS, int8_rerank=INT8_RERANK)
+
+# Get the OpenAI embedding function as a function and use text-embedding-3-large model for embedding.
+# "openai-cached" (utils/embedding_cache.py) keeps every vector in data/embedding_cache.sqlite,
+# so repeated texts - here and in Step4-chat.py's queries - never hit the embedding API twice.
+func = get_registry().get("openai-cached").create(
+    name="text-embedding-3-large", dim=EMBEDDING_DIMS
+)
+# Chunks are always embedded at full size once; storage.encode derives what is stored
+full_func = get_registry().get("openai-cached").create(name="text-embedding-3-large")
 
 #--------------------------------------------------------------
 # Defining a simplified metadata schema 
@@ -60,6 +139,9 @@ func = get_registry().get("openai").create(name="text-embedding-3-large")
 #
 #-   Defines two Pydantic models:
 #    -   `ChunkMetadata`: Stores metadata about each chunk (filename, page numbers, title)
+#        plus the content hashes used for incremental ingestion, where its
+#        near duplicates were found (see the dedup settings below) and, for
+#        spreadsheet row windows, the sheet and row range
 #    -   `Chunks`: Main schema with text content, vector embeddings, and metadata
 #--------------------------------------------------------------
 
@@ -69,8 +151,17 @@ class ChunkMetadata(LanceModel):
     This is a requirement of the Pydantic implementation.
     """
 
+    chunk_hash: str | None
+    duplicate_filenames: List[str] | None
+    duplicate_page_numbers: List[List[int]] | None
+    duplicate_sources: List[str] | None
     filename: str | None
     page_numbers: List[int] | None
+    row_end: int | None
+    row_start: int | None
+    sheet: str | None
+    source: str | None
+    source_hash: str | None
     title: str | None
 
 
@@ -81,124 +172,221 @@ class Chunks(LanceModel):
     metadata: ChunkMetadata
 
 
-table = db.create_table("docling", schema=Chunks, mode="overwrite")
-
-# --------------------------------------------------------------
-# Prepare the chunks for the table
-# --------------------------------------------------------------
-
-# Create table with processed chunks
-processed_chunks = [
-    {
-        "text": chunk.text,
-        "metadata": {
-            "filename": chunk.meta.origin.filename,
-            "page_numbers": [
-                page_no
-                for page_no in sorted(
-                    set(
-                        prov.page_no
-                        for item in chunk.meta.doc_items
-                        for prov in item.prov
-                    )
-                )
-            ]
-            or None,
-            "title": chunk.meta.headings[0] if chunk.meta.headings else None,
-        },
-    }
-    for chunk in chunks
-]
+# Full vector as int8 codes plus the scale to decode them, for reranking
+class ChunksWithInt8(Chunks):
+    vector_q8: bytes
+    vector_scale: float
+
+
+schema = ChunksWithInt8 if INT8_RERANK else Chunks
+
+
+def open_collection(name: str, rebuild: bool):
+    """Opens a collection's table and manifest, rebuilding them if the table is outdated."""
+    if not rebuild and name in collections:
+        table = collections.open(name)
+        if not has_hash_columns(table) or not has_metadata_fields(table, ChunkMetadata.model_fields):
+            # Tables created before incremental ingestion (or dedup, or row
+            # windows) lack metadata fields the pipeline writes
+            print(f"Existing '{name}' table has an outdated schema, rebuilding it...")
+            rebuild = True
+        elif (
+            table.schema.field("vector").type.list_size != func.ndims()
+            or has_int8_rerank(table) != INT8_RERANK
+        ):
+            print(f"Vector storage mode changed, rebuilding the '{name}' table...")
+            rebuild = True
+
+    table = collections.create(name, schema, rebuild=rebuild)
+    # Records which sources were fully written, and with which content hash
+    return table, collections.manifest(name, rebuild=rebuild)
+
+
+# --------------------------------------------------------------
+# Embedding pipeline
+# Chunks are packed into batches of at most EMBED_BATCH_TOKENS tokens,
+# EMBED_CONCURRENCY batches are embedded at once while staying under the
+# API key's tokens-per-minute limit (429s are retried with backoff), and
+# embedded rows are committed to the table every EMBED_COMMIT_EVERY rows.
+# --------------------------------------------------------------
+
+EMBED_BATCH_TOKENS = 100_000
+EMBED_CONCURRENCY = 4
+EMBED_TOKENS_PER_MINUTE = 1_000_000  # Check the limit of your OpenAI usage tier
+EMBED_COMMIT_EVERY = 1000
+
+pipeline = EmbeddingPipeline(
+    full_func if storage.reduces else func,
+    tokenizer,
+    max_batch_tokens=EMBED_BATCH_TOKENS,
+    concurrency=EMBED_CONCURRENCY,
+    tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+    commit_every=EMBED_COMMIT_EVERY,
+    storage=storage if storage.reduces else None,
+)
 
 # --------------------------------------------------------------
-# Add the chunks to the table (automatically embeds the text)
+# Near-duplicate chunks
+# Crawled pages share navigation and footers and legal documents repeat
+# whole clauses. Chunks whose word shingles are at least DEDUP_THRESHOLD
+# similar (MinHash LSH estimate, see utils/near_duplicates.py) to a chunk
+# already stored in the collection are not embedded or stored again; the
+# stored row lists their sources, filenames and pages instead
+# (metadata.duplicate_*). Set DEDUP_THRESHOLD = None to store every chunk.
 # --------------------------------------------------------------
 
-table.add(processed_chunks)
+DEDUP_THRESHOLD = 0.85
 
 # --------------------------------------------------------------
-# Load the table and export to Excel
+# Ingest every collection
+# For each collection, work out which sources changed since the last run,
+# then stream the changed sources through the pipeline:
+# convert -> chunk -> metadata -> embed -> write, with bounded queues
+# between the stages: the next document is converted while the current
+# one is embedded, and rows land in LanceDB as soon as they are embedded.
+# Vectors of chunks that did not change are reused.
 # --------------------------------------------------------------
 
-# Convert to pandas DataFrame
-df = table.to_pandas()
-print(f"Total rows in table: {table.count_rows()}")
+for name, sources in COLLECTIONS.items():
+    table, manifest = open_collection(name, REBUILD)
+
+    # Remote sources are hashed from the download cache; the bytes of changed
+    # sources are read from it again when they are converted
+    source_hashes = {source: source_hash(source, fetch_cache) for source in sources}
+
+    plan = plan_ingestion(source_hashes, load_source_hashes(manifest))
+    print(
+        f"[{name}] Sources changed: {len(plan.changed)}, unchanged: {len(plan.unchanged)}, "
+        f"removed: {len(plan.removed)}"
+    )
+
+    dedup = None
+    if DEDUP_THRESHOLD is not None and (plan.changed or plan.removed):
+        # Sources sharing deduplicated rows with a changed or removed source
+        # are re-ingested with it, so every chunk is stored or listed once
+        shared = sources_sharing_rows(table, plan.changed + plan.removed)
+        also_changed = [s for s in shared if s in plan.unchanged]
+        if also_changed:
+            print(f"[{name}] Re-ingesting {len(also_changed)} sources sharing rows with changed ones")
+            plan.changed += also_changed
+            plan.unchanged = [s for s in plan.unchanged if s not in also_changed]
+    if DEDUP_THRESHOLD is not None and plan.changed:
+        # Seeding reads and MinHashes every stored row, so it only happens
+        # when there is something to ingest
+        index = NearDuplicateIndex(threshold=DEDUP_THRESHOLD)
+        seeded = seed_index(index, table, skip_sources=plan.changed + plan.removed)
+        print(f"[{name}] Dedup index seeded with {seeded} stored chunks")
+        dedup = ChunkDeduplicator(index)
+
+    delete_sources(table, plan.removed, manifest)
+
+    # Workbooks are streamed as row windows instead of being converted whole
+    documents = [s for s in plan.changed if not is_spreadsheet(s)]
+    spreadsheets = [s for s in plan.changed if is_spreadsheet(s)]
+
+    saved = EmbeddingReport()
+    with metrics.span("ingestion", collection=name, sources=len(plan.changed)):
+        for source, report in chain(
+            run_ingestion(
+                documents, converter, chunker, table, pipeline, manifest, source_hashes,
+                fetch_cache=fetch_cache, document_store=document_store, dedup=dedup,
+            ),
+            run_spreadsheet_ingestion(
+                spreadsheets, spreadsheet_chunker, table, pipeline, manifest, source_hashes,
+                fetch_cache=fetch_cache, dedup=dedup,
+            ),
+        ):
+            print(
+                f"[{name}] {source}: {report.rows_written} chunks, {report.embedded} embedded, "
+                f"{report.rows_written - report.embedded} reused, {report.duplicates} duplicates, "
+                f"{report.retries} retries in {report.seconds:.1f}s"
+            )
+            saved.add(report)
+
+    if dedup is not None:
+        print(
+            f"[{name}] Dedup saved {saved.embeddings_saved} embedding inputs "
+            f"({saved.tokens_saved:,} tokens), {saved.duplicates} rows and "
+            f"{saved.bytes_saved / 1e6:.1f} MB in {dedup.seconds:.1f}s"
+        )
 
-# Export DataFrame to Excel
-excel_path = "data/embedded_chunks.xlsx"
-print(f"Exporting data to {excel_path}...")
-df.to_excel(excel_path, index=False)
-print(f"Data successfully exported to {excel_path}")
+# --------------------------------------------------------------
+# Metrics: throughput per stage, tokens embedded and their cost
+# --------------------------------------------------------------
+
+EMBEDDING_PRICE_PER_1M_TOKENS = 0.13  # text-embedding-3-large, USD; check current pricing
+
+print(f"Documents/s (conversion): {metrics.rate('documents_converted', 'convert'):.2f}")
+print(f"Chunks/s (chunking): {metrics.rate('chunks', 'chunk'):.1f}")
+print(f"Tokens/s (end to end): {metrics.rate('tokens_embedded', 'ingestion'):,.0f}")
+tokens_embedded = metrics.counters.get("tokens_embedded", 0)
+print(
+    f"Tokens embedded: {tokens_embedded:,.0f} "
+    f"(~${tokens_embedded / 1e6 * EMBEDDING_PRICE_PER_1M_TOKENS:.4f})"
+)
+print(metrics.summary())
+metrics.write_prometheus("data/metrics/step3.prom")
 
 # --------------------------------------------------------------
-# Search the table
-uri = "data/lancedb"
-db = lancedb.connect(uri)
+# Build or update the indexes of every collection
+# Once a table has INDEX_MIN_ROWS rows an IVF-PQ index is trained so
+# table.search() no longer scans every 3072-dim vector; on later runs the
+# rows added since are merged into the index incrementally. BTREE indexes
+# on metadata.filename and metadata.source keep searches filtered to some
+# files (Step4-chat.py's sidebar) fast however large the collection grows.
+# --------------------------------------------------------------
+
+INDEX_MIN_ROWS = 20_000
+
+for name in COLLECTIONS:
+    table = collections.open(name)
+    print(f"[{name}] Vector index: {ensure_vector_index(table, min_rows=INDEX_MIN_ROWS)}")
+    # Full-text (BM25) index over the chunk text for hybrid retrieval in Step4-chat.py
+    print(f"[{name}] Full-text index: {ensure_fts_index(table)}")
+    print(f"[{name}] Scalar indexes: {ensure_scalar_indexes(table)}")
 
 # --------------------------------------------------------------
-# List all tables in the database
+# Export each collection
+# Rows are streamed in record batches to data/exports/<collection>.parquet
+# (EXPORT_FORMAT = "arrow" writes a memory-mappable Arrow IPC file instead),
+# leaving the vector columns out unless EXPORT_VECTORS = True, plus an
+# Excel preview of the first EXCEL_PREVIEW_ROWS rows' text and metadata
+# (None for no preview). The same export runs standalone with
+# python -m utils.table_export.
 # --------------------------------------------------------------
 
-print("Checking database structure...")
-# Check if the database directory exists
-if os.path.exists("data/lancedb"):
-    print(f"Database directory exists at 'data/lancedb'")
-    
-    # List all directories in the database (potential tables)
-    table_dirs = [d for d in os.listdir("data/lancedb") if os.path.isdir(os.path.join("data/lancedb", d))]
-    print(f"Found directories in database: {table_dirs}")
-    
-    # Check for manifest files which indicate tables
-    manifest_files = glob.glob("data/lancedb/**/*.manifest", recursive=True)
-    print(f"Found manifest files: {manifest_files}")
-else:
-    print("Database directory 'data/lancedb' does not exist!")
-    print("Make sure you've run Step3-embedding.py first to create and populate the database.")
-    exit(1)
+EXPORT_FORMAT = "parquet"
+EXPORT_VECTORS = False
+EXCEL_PREVIEW_ROWS = 1000
+
+for name in COLLECTIONS:
+    table = collections.open(name)
+    print(f"[{name}] Total rows in table: {table.count_rows()}")
+    report = export_table(
+        table, f"data/exports/{name}.{EXPORT_FORMAT}", include_vectors=EXPORT_VECTORS
+    )
+    print(
+        f"[{name}] Exported {report.rows} rows to {report.path} "
+        f"({report.bytes / 1e6:.1f} MB in {report.seconds:.1f}s)"
+    )
+    if EXCEL_PREVIEW_ROWS:
+        preview = export_excel_preview(
+            table, f"data/exports/{name}_preview.xlsx", max_rows=EXCEL_PREVIEW_ROWS
+        )
+        print(f"[{name}] Excel preview of {preview.rows} rows written to {preview.path}")
 
 # --------------------------------------------------------------
-# Try to load the table
+# Search a collection, restricted to one of its files
 # --------------------------------------------------------------
 
-# First try the original table name
-try:
-    print("Attempting to open table 'docling'...")
-    table = db.open_table("docling")
-    print("Successfully opened 'docling' table")
-except ValueError as e:
-    print(f"Error opening 'docling' table: {str(e)}")
-    
-    # If that fails, try to find any available tables
-    try:
-        # Try to list all tables in the database
-        print("Trying to list all tables in the database...")
-        tables = db.table_names()
-        print(f"Available tables: {tables}")
-        
-        if tables:
-            # Try to open the first available table
-            first_table = tables[0]
-            print(f"Attempting to open first available table: '{first_table}'...")
-            table = db.open_table(first_table)
-            print(f"Successfully opened '{first_table}' table")
-        else:
-            print("No tables found in the database.")
-            print("Make sure you've run Step3-embedding.py first to create and populate the table.")
-            exit(1)
-    except Exception as e2:
-        print(f"Error listing tables: {str(e2)}")
-        print("Make sure you've run Step3-embedding.py first to create and populate the table.")
-        exit(1)
-
-# --------------------------------------------------------------
-# Search the table
-# --------------------------------------------------------------
-
-# Only execute this section if the table was successfully opened
-if 'table' in locals():
-    print("\nPerforming vector search...")
-    result = table.search(query="payment of a fee", query_type="vector").limit(5)
+print(f"Collections: {', '.join(collections.list())}")
+table = collections.open(DEFAULT_COLLECTION)
+filenames = collections.filenames(DEFAULT_COLLECTION)
+if filenames:
+    print(f"\nPerforming vector search in '{filenames[0]}'...")
+    result = vector_search(
+        table, "payment of a fee", 5, where=metadata_filter(filenames=filenames[:1])
+    )
     print("\nSearch results:")
-    #print(result.to_pandas())
-    result.to_pandas()
-
+    for hit in hits_from_arrow(result.to_arrow()):
+        print(f"{hit.score:.3f} {hit.source}: {hit.text[:80]}")
@@ -1,8 +1,10 @@
+import html
+import json
 import os
+import requests
 import streamlit as st
-import lancedb
-from openai import OpenAI
 from dotenv import load_dotenv
+from utils.retrieval import RETRIEVAL_MODES, SearchHit
 
 # Load environment variables
 # Get the directory where this script is located
@@ -10,91 +12,74 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 # Load .env file from the script directory
 load_dotenv(os.path.join(script_dir, ".env"))
 
-# Initialize OpenAI client
-client = OpenAI()
+# Retrieval and the OpenAI calls run in the chat service, shared by all sessions:
+#   python -m utils.chat_service --port 8000
+CHAT_BACKEND_URL = os.getenv("CHAT_BACKEND_URL", "http://127.0.0.1:8000")
+CHAT_PRICE_PER_1M_TOKENS = {"prompt": 0.15, "completion": 0.60}  # gpt-4o-mini, USD; check current pricing
 
 
-# Initialize LanceDB connection
 @st.cache_resource
-def init_db():
-    """Initialize database connection.
+def init_session():
+    """HTTP session shared by all Streamlit sessions, so connections to the service are reused.
 
     Returns:
-        LanceDB table object
+        requests.Session object
     """
-    db = lancedb.connect("data/lancedb")
-    return db.open_table("docling")
+    return requests.Session()
 
 
-def get_context(query: str, table, num_results: int = 5) -> str:
-    """Search the database for relevant context.
-
-    Args:
-        query: User's question
-        table: LanceDB table object
-        num_results: Number of results to return
+@st.cache_data(ttl=60)
+def get_collections():
+    """Collections the chat service can search, and the default one.
 
     Returns:
-        str: Concatenated context from relevant chunks with source information
+        (list of names, default name)
     """
-    results = table.search(query).limit(num_results).to_pandas()
-    contexts = []
-
-    for _, row in results.iterrows():
-        # Extract metadata
-        filename = row["metadata"]["filename"]
-        page_numbers = row["metadata"]["page_numbers"]
-        title = row["metadata"]["title"]
-
-        # Build source citation
-        source_parts = []
-        if filename:
-            source_parts.append(filename)
-        if isinstance(page_numbers, (list, tuple)) and len(page_numbers) > 0:
-            source_parts.append(f"p. {', '.join(str(p) for p in page_numbers)}")
-        elif hasattr(page_numbers, 'size') and page_numbers.size > 0:  # For numpy arrays
-            source_parts.append(f"p. {', '.join(str(p) for p in page_numbers)}")
-
-        source = f"\nSource: {' - '.join(source_parts)}"
-        if title:
-            source += f"\nTitle: {title}"
+    data = init_session().get(f"{CHAT_BACKEND_URL}/collections", timeout=5).json()
+    return data["collections"], data["default"]
 
-        contexts.append(f"{row['text']}{source}")
 
-    return "\n\n".join(contexts)
+@st.cache_data(ttl=60)
+def get_files(collection: str):
+    """Filenames in a collection, for the source filter."""
+    return init_session().get(f"{CHAT_BACKEND_URL}/collections/{collection}/files", timeout=10).json()["files"]
 
 
-def get_chat_response(messages, context: str) -> str:
-    """Get streaming response from OpenAI API.
+def chat_events(messages, mode: str, collection: str, filters: dict):
+    """Send the conversation to the chat service and yield its server-sent events.
 
     Args:
-        messages: Chat history
-        context: Retrieved context from database
+        messages: Chat history, ending with the new question
+        mode: Retrieval mode (see RETRIEVAL_MODES)
+        collection: Collection to search
+        filters: {"filenames": [...], "pages": [first, last]} restricting the search
 
-    Returns:
-        str: Model's response
-    """
-    system_prompt = f"""You are a helpful assistant that answers questions based on the provided context.
-    Use only the information from the context to answer questions. If you're unsure or the context
-    doesn't contain the relevant information, say so.
-    
-    Context:
-    {context}
+    Yields:
+        (event, data) tuples: "context" first, then "token"s, then "done" or "error"
     """
-
-    messages_with_context = [{"role": "system", "content": system_prompt}, *messages]
-
-    # Create the streaming response
-    stream = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages_with_context,
-        temperature=0.7,
+    response = init_session().post(
+        f"{CHAT_BACKEND_URL}/chat",
+        json={"messages": messages, "mode": mode, "collection": collection, "filters": filters},
         stream=True,
+        timeout=(5, 300),
     )
+    response.raise_for_status()
+    with response:
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield event, json.loads(line[len("data: "):])
 
-    # Use Streamlit's built-in streaming capability
-    response = st.write_stream(stream)
-    return response
+
+def answer_text(events):
+    """Yield the answer text from the remaining chat events."""
+    for event, data in events:
+        if event == "token":
+            yield data["text"]
+        elif event == "error":
+            yield f"\n\n*Error: {data['message']}*"
 
 
 # Initialize Streamlit app
@@ -104,8 +89,27 @@ st.title("📚 Document Q&A")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Initialize database connection
-table = init_db()
+# Retrieval mode for the next question
+retrieval_mode = st.sidebar.radio("Retrieval mode", RETRIEVAL_MODES)
+
+# Collection to search, optionally restricted to some files and pages
+try:
+    collections, default_collection = get_collections()
+except requests.RequestException:
+    st.error(f"Chat service not reachable at {CHAT_BACKEND_URL}; start it with `python -m utils.chat_service`.")
+    st.stop()
+collection = st.sidebar.selectbox(
+    "Collection",
+    collections,
+    index=collections.index(default_collection) if default_collection in collections else 0,
+)
+filters = {}
+if collection:
+    filters["filenames"] = st.sidebar.multiselect("Only these files", get_files(collection))
+    if st.sidebar.checkbox("Only these pages"):
+        first_page = st.sidebar.number_input("From page", min_value=1, value=1)
+        last_page = st.sidebar.number_input("To page", min_value=int(first_page), value=int(first_page))
+        filters["pages"] = [int(first_page), int(last_page)]
 
 # Display chat messages
 for message in st.session_state.messages:
@@ -121,9 +125,18 @@ if prompt := st.chat_input("Ask a question about the document"):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
 
-    # Get relevant context
+    # The service retrieves the context (from its cache if this question, or a
+    # near-duplicate, was asked before) and streams the answer
+    try:
+        events = chat_events(st.session_state.messages, retrieval_mode, collection, filters)
+        event, data = next(events)
+    except requests.RequestException as e:
+        st.session_state.messages.pop()
+        st.error(f"The chat service at {CHAT_BACKEND_URL} is unavailable or busy ({e}); try again.")
+        st.stop()
+    hits = [SearchHit.from_dict(hit) for hit in data.get("hits", [])]
+
     with st.status("Searching document...", expanded=False) as status:
-        context = get_context(prompt, table)
         st.markdown(
             """
             <style>
@@ -152,18 +165,10 @@ if prompt := st.chat_input("Ask a question about the document"):
         )
 
         st.write("Found relevant sections:")
-        for chunk in context.split("\n\n"):
-            # Split into text and metadata parts
-            parts = chunk.split("\n")
-            text = parts[0]
-            metadata = {
-                line.split(": ")[0]: line.split(": ")[1]
-                for line in parts[1:]
-                if ": " in line
-            }
-
-            source = metadata.get("Source", "Unknown source")
-            title = metadata.get("Title", "Untitled section")
+        for hit in hits:
+            source = html.escape(hit.source or "Unknown source")
+            title = html.escape(hit.title or "Untitled section")
+            text = html.escape(hit.text)
 
             st.markdown(
                 f"""
@@ -180,8 +185,47 @@ if prompt := st.chat_input("Ask a question about the document"):
 
     # Display assistant response first
     with st.chat_message("assistant"):
-        # Get model response with streaming
-        response = get_chat_response(st.session_state.messages, context)
+        if event == "error":
+            response = f"*Error: {data['message']}*"
+            st.markdown(response)
+        else:
+            response = st.write_stream(answer_text(events))
 
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
+
+# Query cache counters, load and latency metrics of the chat service (all sessions)
+try:
+    stats = init_session().get(f"{CHAT_BACKEND_URL}/stats", timeout=2).json()
+except requests.RequestException:
+    st.sidebar.warning(f"Chat service not reachable at {CHAT_BACKEND_URL}")
+    st.stop()
+cache = stats.get("cache")
+if cache:
+    st.sidebar.metric(
+        "Cache hit rate",
+        f"{cache['hit_rate']:.0%}",
+        f"{cache['exact_hits']} exact, {cache['semantic_hits']} semantic",
+    )
+    st.sidebar.metric(
+        "Latency saved", f"{cache['seconds_saved']:.1f} s", f"{cache['answers_reused']} answers reused"
+    )
+
+with st.sidebar.expander("Metrics"):
+    st.write(f"Active chats: {stats['active_chats']}, waiting: {stats['waiting']}, rejected: {stats['rejected']}")
+    search_p = stats["percentiles"]["search_seconds"]
+    ttft_p = stats["percentiles"]["chat_ttft_seconds"]
+    if search_p:
+        st.write(f"Search p50 / p95: {search_p['0.5'] * 1000:.0f} / {search_p['0.95'] * 1000:.0f} ms")
+    if ttft_p:
+        st.write(f"Time to first token p50 / p95: {ttft_p['0.5']:.2f} / {ttft_p['0.95']:.2f} s")
+    prompt_tokens = stats["counters"].get("chat_prompt_tokens", 0)
+    completion_tokens = stats["counters"].get("chat_completion_tokens", 0)
+    cost = (
+        prompt_tokens * CHAT_PRICE_PER_1M_TOKENS["prompt"]
+        + completion_tokens * CHAT_PRICE_PER_1M_TOKENS["completion"]
+    ) / 1e6
+    st.write(f"Chat tokens: {prompt_tokens:,.0f} prompt, {completion_tokens:,.0f} completion (~${cost:.4f})")
+    tokens_saved = stats["counters"].get("prompt_tokens_saved", 0)
+    if tokens_saved:
+        st.write(f"Prompt tokens saved by context packing: {tokens_saved:,.0f}")
@@ -0,0 +1,108 @@
+"""Recall-vs-latency report of ANN search settings against exact search.
+
+Uses stored vectors as queries, so no embedding API calls are made. Run
+from the Docling_Main/docling directory, either on the real table:
+
+    python -m benchmarks.bench_ann_recall --db data/lancedb --table docling
+
+or on a synthetic table of random vectors:
+
+    python -m benchmarks.bench_ann_recall --synthetic 100000 --ndims 3072
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import lancedb
+import numpy as np
+
+from utils.vector_index import ensure_vector_index, vector_search
+
+
+def synthetic_table(num_rows: int, ndims: int, seed: int = 0):
+    """Creates a table of clustered random unit vectors (clusters make ANN search realistic)."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, num_rows // 100), ndims)).astype(np.float32)
+    db = lancedb.connect(tempfile.mkdtemp())
+
+    def batches(batch_size: int = 10_000):
+        for start in range(0, num_rows, batch_size):
+            size = min(batch_size, num_rows - start)
+            vectors = centres[rng.integers(0, len(centres), size)]
+            vectors = vectors + 0.3 * rng.standard_normal((size, ndims)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            yield [{"id": start + i, "vector": v.tolist()} for i, v in enumerate(vectors)]
+
+    iterator = batches()
+    table = db.create_table("bench", data=next(iterator))
+    for batch in iterator:
+        table.add(batch)
+    return table
+
+
+def row_ids(results):
+    return [row.get("_rowid", row.get("id")) for row in results]
+
+
+def timed(search):
+    start = time.perf_counter()
+    results = search.with_row_id(True).to_list()
+    return results, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--synthetic", type=int, help="Benchmark a synthetic table of this many rows instead")
+    parser.add_argument("--ndims", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+    parser.add_argument("--refine-factors", type=int, nargs="+", default=[0, 5, 10])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        table = synthetic_table(args.synthetic, args.ndims)
+    else:
+        table = lancedb.connect(args.db).open_table(args.table)
+
+    print(f"Rows: {table.count_rows():,}")
+    print(f"Index: {ensure_vector_index(table, min_rows=0)}")
+
+    sample = table.search().select(["vector"]).limit(args.queries).to_list()
+    queries = [np.asarray(row["vector"], dtype=np.float32) for row in sample]
+    # Perturb the queries slightly so they are not exact copies of stored rows
+    rng = np.random.default_rng(1)
+    queries = [q + 0.05 * rng.standard_normal(q.shape).astype(np.float32) for q in queries]
+
+    exact_ids, exact_ms = [], []
+    for q in queries:
+        results, ms = timed(vector_search(table, q, args.k, exact=True))
+        exact_ids.append(set(row_ids(results)))
+        exact_ms.append(ms)
+
+    print(f"\n{'nprobes':>8}{'refine':>8}{'recall@' + str(args.k):>11}{'p50 ms':>9}{'p95 ms':>9}")
+    print(
+        f"{'exact':>8}{'-':>8}{1.0:>11.3f}{statistics.median(exact_ms):>9.2f}"
+        f"{np.percentile(exact_ms, 95):>9.2f}"
+    )
+    for nprobes in args.nprobes:
+        for refine_factor in args.refine_factors:
+            recalls, latencies = [], []
+            for q, truth in zip(queries, exact_ids):
+                results, ms = timed(
+                    vector_search(table, q, args.k, nprobes=nprobes, refine_factor=refine_factor or None)
+                )
+                recalls.append(len(truth & set(row_ids(results))) / len(truth))
+                latencies.append(ms)
+            print(
+                f"{nprobes:>8}{refine_factor or '-':>8}{statistics.mean(recalls):>11.3f}"
+                f"{statistics.median(latencies):>9.2f}{np.percentile(latencies, 95):>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Row-dict writes versus columnar Arrow writes of chunk rows into LanceDB.
+
+Builds synthetic chunk objects shaped like docling's (text, doc_items with
+page provenance, headings, origin filename) with precomputed vectors, and
+times turning them into table rows and writing them: once as one dict per
+row, as Step3 used to, and once through ChunkColumns. Peak memory is the
+Python heap as seen by tracemalloc (Arrow buffers are not included), which
+also slows both paths down somewhat. Run from the Docling_Main/docling
+directory:
+
+    python -m benchmarks.bench_arrow_records --chunks 200000 --ndims 3072
+"""
+
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import List
+
+import lancedb
+import numpy as np
+from lancedb.pydantic import LanceModel, Vector
+
+from utils.arrow_records import ChunkColumns, chunk_page_numbers
+from utils.ingestion import hash_text
+
+
+def synthetic_chunks(num_chunks: int, seed: int = 0):
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(num_chunks):
+        items = [
+            SimpleNamespace(prov=[SimpleNamespace(page_no=rng.randint(1, 300))])
+            for _ in range(rng.randint(1, 6))
+        ]
+        meta = SimpleNamespace(
+            doc_items=items,
+            headings=[f"Heading {i // 20}"] if i % 5 else None,
+            origin=SimpleNamespace(filename=f"document-{i // 500}.pdf"),
+        )
+        chunks.append(SimpleNamespace(text=f"chunk {i} " + "lorem ipsum " * rng.randint(20, 200), meta=meta))
+    return chunks
+
+
+def dict_rows(chunks, vectors, source: str):
+    """The previous per-row path: one dict (and nested generators) per chunk."""
+    return [
+        {
+            "text": chunk.text,
+            "vector": vector.tolist(),
+            "metadata": {
+                "chunk_hash": hash_text(chunk.text),
+                "filename": chunk.meta.origin.filename,
+                "page_numbers": [
+                    page_no
+                    for page_no in sorted(
+                        set(prov.page_no for item in chunk.meta.doc_items for prov in item.prov)
+                    )
+                ]
+                or None,
+                "source": source,
+                "source_hash": "hash",
+                "title": chunk.meta.headings[0] if chunk.meta.headings else None,
+            },
+        }
+        for chunk, vector in zip(chunks, vectors)
+    ]
+
+
+def columnar(chunks, vectors, source: str, schema):
+    columns = ChunkColumns()
+    for chunk in chunks:
+        columns.append(chunk, source, "hash")
+    return columns.to_arrow(schema, {"vector": vectors})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--ndims", type=int, default=3072)
+    parser.add_argument("--batch", type=int, default=1000, help="Rows per table.add")
+    args = parser.parse_args()
+
+    class ChunkMetadata(LanceModel):
+        chunk_hash: str | None
+        filename: str | None
+        page_numbers: List[int] | None
+        source: str | None
+        source_hash: str | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str
+        vector: Vector(args.ndims)  # type: ignore
+        metadata: ChunkMetadata
+
+    chunks = synthetic_chunks(args.chunks)
+    vectors = np.random.default_rng(0).standard_normal((args.chunks, args.ndims)).astype(np.float32)
+    db = lancedb.connect(tempfile.mkdtemp())
+    assert chunk_page_numbers(chunks[0]) is not None
+
+    print(f"{args.chunks:,} chunks, {args.ndims}-dim vectors, {args.batch} rows per write\n")
+    print(f"{'path':<10}{'build s':>10}{'write s':>10}{'rows/s':>10}{'py peak MB':>12}")
+    for name in ("dicts", "arrow"):
+        table = db.create_table(name, schema=Chunks)
+        build = write = 0.0
+        tracemalloc.start()
+        for start in range(0, args.chunks, args.batch):
+            batch, batch_vectors = chunks[start : start + args.batch], vectors[start : start + args.batch]
+            t0 = time.perf_counter()
+            if name == "dicts":
+                data = dict_rows(batch, batch_vectors, "bench")
+            else:
+                data = columnar(batch, batch_vectors, "bench", table.schema)
+            t1 = time.perf_counter()
+            table.add(data)
+            build, write = build + t1 - t0, write + time.perf_counter() - t1
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        print(f"{name:<10}{build:>10.2f}{write:>10.2f}{args.chunks / (build + write):>10,.0f}{peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
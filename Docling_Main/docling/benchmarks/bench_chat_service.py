@@ -0,0 +1,187 @@
+"""Load test of the chat service under N concurrent sessions.
+
+Starts the chat service in-process on a synthetic LanceDB table (offline fake
+embeddings with a simulated embedding latency) against the local fake chat
+endpoint, then runs groups of concurrent sessions that each ask a few
+follow-up questions over ``POST /chat``. Reports turns per second, time to
+first token and turn latency percentiles and the requests the service turned
+away. Run from the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_chat_service --sessions 1 8 32 128 --turns 3
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from typing import List
+
+import aiohttp
+import lancedb
+import numpy as np
+from aiohttp import web
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+from openai import AsyncOpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from utils.chat_service import ChatService, create_app
+from utils.collection_manager import DEFAULT_COLLECTION, CollectionManager
+from utils.fake_embeddings import fake_embed
+from utils.hybrid_search import ensure_fts_index
+from utils.query_cache import QueryCache
+
+VOCABULARY = [f"term{i}" for i in range(2000)]
+
+
+def build_table(rows: int, ndims: int, embed_latency: float, seed: int = 0):
+    func = get_registry().get("fake-embeddings").create(ndim=ndims, latency=embed_latency)
+
+    class ChunkMetadata(LanceModel):
+        chunk_hash: str | None
+        filename: str | None
+        page_numbers: List[int] | None
+        source: str | None
+        source_hash: str | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+        metadata: ChunkMetadata
+
+    rng = random.Random(seed)
+    collections = CollectionManager(lancedb.connect(tempfile.mkdtemp(prefix="bench_chat_")))
+    table = collections.create(DEFAULT_COLLECTION, Chunks)
+    texts = [" ".join(rng.choice(VOCABULARY) for _ in range(120)) for _ in range(rows)]
+    # Rows come with their vectors, so the simulated latency only applies to query embeddings
+    table.add(
+        [
+            {
+                "text": text,
+                "vector": fake_embed(text, ndims),
+                "metadata": {
+                    "filename": f"doc{i // 50}.pdf",
+                    "page_numbers": [i % 50 + 1],
+                    "title": f"Section {i}",
+                },
+            }
+            for i, text in enumerate(texts)
+        ]
+    )
+    ensure_fts_index(table)
+    return collections, func
+
+
+async def chat_turn(http: aiohttp.ClientSession, url: str, messages: list, mode: str) -> dict:
+    """One turn: returns the answer, time to first token and turn seconds (or the error)."""
+    start = time.perf_counter()
+    async with http.post(f"{url}/chat", json={"messages": messages, "mode": mode}) as response:
+        if response.status != 200:
+            return {"error": response.status}
+        event, ttft, parts = None, None, []
+        async for raw in response.content:
+            line = raw.decode("utf-8").rstrip("\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "token":
+                    ttft = ttft or time.perf_counter() - start
+                    parts.append(data["text"])
+                elif event == "error":
+                    return {"error": data["message"]}
+    return {"answer": "".join(parts), "ttft": ttft, "seconds": time.perf_counter() - start}
+
+
+async def session(http, url: str, turns: int, mode: str, rng: random.Random) -> List[dict]:
+    messages, results = [], []
+    for _ in range(turns):
+        messages.append({"role": "user", "content": " ".join(rng.sample(VOCABULARY, 6))})
+        result = await chat_turn(http, url, messages, mode)
+        results.append(result)
+        if "error" in result:
+            messages.pop()
+        else:
+            messages.append({"role": "assistant", "content": result["answer"]})
+    return results
+
+
+def percentile_ms(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q) * 1000) if values else float("nan")
+
+
+async def run(args) -> None:
+    collections, func = build_table(args.rows, args.ndims, args.embed_latency)
+    with FakeOpenAIServer(args.chat_ttft, args.chat_tokens_per_second, args.chat_tokens) as llm:
+        service = ChatService(
+            collections,
+            AsyncOpenAI(base_url=llm.base_url, api_key="fake", max_retries=0),
+            QueryCache(embed=lambda q: func.compute_query_embeddings(q)[0]) if args.cache else None,
+            max_concurrent_chats=args.max_concurrent_chats,
+            max_concurrent_searches=args.max_concurrent_searches,
+            max_queue=args.max_queue,
+            queue_timeout=args.queue_timeout,
+        )
+        runner = web.AppRunner(create_app(service))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        url = f"http://{host}:{port}"
+
+        print(
+            f"{args.rows:,} rows, mode {args.mode}, {args.turns} turns per session, "
+            f"chat ttft {args.chat_ttft}s + {args.chat_tokens} tokens at {args.chat_tokens_per_second}/s\n"
+        )
+        print(
+            f"{'sessions':>8}{'turns/s':>10}{'ttft p50':>10}{'ttft p95':>10}"
+            f"{'turn p50':>10}{'turn p95':>10}{'errors':>8}"
+        )
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+            for sessions in args.sessions:
+                rng = random.Random(sessions)
+                start = time.perf_counter()
+                results = await asyncio.gather(
+                    *(
+                        session(http, url, args.turns, args.mode, random.Random(rng.random()))
+                        for _ in range(sessions)
+                    )
+                )
+                elapsed = time.perf_counter() - start
+                turns = [r for rs in results for r in rs if "error" not in r]
+                errors = sum("error" in r for rs in results for r in rs)
+                ttfts = [r["ttft"] for r in turns if r["ttft"] is not None]
+                seconds = [r["seconds"] for r in turns]
+                print(
+                    f"{sessions:>8}{len(turns) / elapsed:>10.1f}"
+                    f"{percentile_ms(ttfts, 50):>8.0f}ms{percentile_ms(ttfts, 95):>8.0f}ms"
+                    f"{percentile_ms(seconds, 50):>8.0f}ms{percentile_ms(seconds, 95):>8.0f}ms{errors:>8}"
+                )
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--turns", type=int, default=3, help="Questions per session")
+    parser.add_argument("--mode", default="hybrid", choices=["hybrid", "vector", "lexical"])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--ndims", type=int, default=256)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Simulated query embedding seconds")
+    parser.add_argument("--cache", action="store_true", help="Enable the query cache")
+    parser.add_argument("--chat-ttft", type=float, default=0.3)
+    parser.add_argument("--chat-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--chat-tokens", type=int, default=50)
+    parser.add_argument("--max-concurrent-chats", type=int, default=32)
+    parser.add_argument("--max-concurrent-searches", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--queue-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Near-duplicate chunk detection: throughput, accuracy and what it saves.
+
+Builds a synthetic chunk corpus shaped like a sitemap crawl plus legal
+PDFs: unique clause chunks (bench_hybrid_search's corpus), navigation and
+footer blocks repeated across pages with one word changed (page title,
+date), and clauses repeated verbatim up to whitespace. Times
+NearDuplicateIndex over all chunks, checks its verdicts against the known
+duplicate groups and estimates the embedding inputs, tokens and bytes
+saved. With ``--write`` the chunks also go through the ingestion write
+stage into LanceDB (offline fake embeddings) with and without the dedup
+stage, comparing rows, embedding inputs, time and size on disk. Run from
+the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_dedup --chunks 100000
+    python -m benchmarks.bench_dedup --chunks 20000 --write
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import List
+
+import lancedb
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+
+from benchmarks.bench_hybrid_search import VOCABULARY, synthetic_corpus
+from utils.embedding_pipeline import EmbeddingPipeline
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.ingestion import hash_text, open_source_manifest
+from utils.near_duplicates import ChunkDeduplicator, NearDuplicateIndex
+from utils.pipeline import write_stage
+from utils.tokenizer import OpenAICompatibleTokenizerWrapper
+
+
+def dedup_corpus(num_chunks: int, duplicate_share: float = 0.4, templates: int = 200, seed: int = 0):
+    """Chunks with the group they belong to; chunks of one group are (near) duplicates.
+
+    Returns:
+        List of (text, group) with the unique, boilerplate and repeated chunks shuffled
+    """
+    rng = random.Random(seed)
+    num_duplicates = int(num_chunks * duplicate_share)
+    unique = [c["text"] for c in synthetic_corpus(num_chunks - num_duplicates, seed=seed)]
+    chunks = [(text, f"unique-{i}") for i, text in enumerate(unique)]
+
+    boilerplate = [
+        "Home Products Pricing Support Contact " + " ".join(rng.choices(VOCABULARY, k=150))
+        for _ in range(templates)
+    ]
+    for _ in range(num_duplicates // 2):
+        t = rng.randrange(templates)
+        words = boilerplate[t].split()
+        words[rng.randrange(5, len(words))] = f"Page{rng.randrange(10**4)}"
+        chunks.append((" ".join(words), f"template-{t}"))
+    for _ in range(num_duplicates - num_duplicates // 2):
+        i = rng.randrange(len(unique))
+        chunks.append((unique[i].replace(". ", ".  ", 1), f"unique-{i}"))
+
+    rng.shuffle(chunks)
+    return chunks
+
+
+def chunk_object(text: str, filename: str, page: int):
+    """A chunk shaped like docling's, as the write stage reads it."""
+    meta = SimpleNamespace(
+        doc_items=[SimpleNamespace(prov=[SimpleNamespace(page_no=page)])],
+        headings=None,
+        origin=SimpleNamespace(filename=filename),
+    )
+    return SimpleNamespace(text=text, meta=meta)
+
+
+def directory_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+
+def write_corpus(corpus, dedup, ndims: int, chunks_per_source: int):
+    func = get_registry().get("fake-embeddings").create(ndim=ndims)
+
+    class Metadata(LanceModel):
+        chunk_hash: str | None
+        duplicate_filenames: List[str] | None
+        duplicate_page_numbers: List[List[int]] | None
+        duplicate_sources: List[str] | None
+        filename: str | None
+        page_numbers: List[int] | None
+        source: str | None
+        source_hash: str | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+        metadata: Metadata
+
+    path = tempfile.mkdtemp()
+    db = lancedb.connect(path)
+    table = db.create_table("bench", schema=Chunks)
+    manifest = open_source_manifest(db, "bench")
+    pipeline = EmbeddingPipeline(func, OpenAICompatibleTokenizerWrapper(), concurrency=4)
+
+    chunks = [
+        (f"page-{i // chunks_per_source}", chunk_object(text, f"page-{i // chunks_per_source}.html", 1))
+        for i, (text, _) in enumerate(corpus)
+    ]
+    source_hashes = {source: hash_text(source) for source, _ in chunks}
+    start = time.perf_counter()
+    reports = [
+        report for _, report in write_stage(chunks, table, pipeline, manifest, source_hashes, dedup=dedup)
+    ]
+    seconds = time.perf_counter() - start
+    # Drop old table versions so only the live rows count towards the size
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        table.optimize(cleanup_older_than=timedelta(0))
+    return table, reports, seconds, directory_bytes(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--duplicate-share", type=float, default=0.4)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--ndims", type=int, default=3072, help="Stored vector size for the savings estimate")
+    parser.add_argument("--write", action="store_true", help="Also write through LanceDB with and without dedup")
+    parser.add_argument("--chunks-per-source", type=int, default=100)
+    args = parser.parse_args()
+
+    corpus = dedup_corpus(args.chunks, args.duplicate_share)
+    index = NearDuplicateIndex(threshold=args.threshold, num_perm=args.num_perm)
+    print(
+        f"{len(corpus):,} chunks, {args.duplicate_share:.0%} duplicates, threshold {args.threshold}, "
+        f"{args.num_perm} permutations ({index.bands} bands x {index.rows} rows)"
+    )
+
+    start = time.perf_counter()
+    flagged = [index.add(i, text, hash_text(text)) is not None for i, (text, _) in enumerate(corpus)]
+    seconds = time.perf_counter() - start
+
+    seen = set()
+    true_positives = false_positives = false_negatives = 0
+    for (_, group), is_flagged in zip(corpus, flagged):
+        is_duplicate = group in seen
+        seen.add(group)
+        true_positives += is_flagged and is_duplicate
+        false_positives += is_flagged and not is_duplicate
+        false_negatives += is_duplicate and not is_flagged
+
+    duplicates = sum(flagged)
+    text_bytes = sum(len(text.encode("utf-8")) for (text, _), f in zip(corpus, flagged) if f)
+    # About 4 characters per token for English text
+    tokens = sum(len(text) // 4 for (text, _), f in zip(corpus, flagged) if f)
+    print(f"Dedup: {seconds:.1f}s, {len(corpus) / seconds:,.0f} chunks/s, {len(index):,} canonical chunks")
+    print(
+        f"Duplicates found: {duplicates:,}, precision "
+        f"{true_positives / max(1, true_positives + false_positives):.3f}, recall "
+        f"{true_positives / max(1, true_positives + false_negatives):.3f}"
+    )
+    print(
+        f"Saved: {duplicates:,} embedding inputs (~{tokens:,} tokens), {duplicates:,} rows, "
+        f"~{(text_bytes + duplicates * args.ndims * 4) / 1e6:,.0f} MB ({args.ndims}-dim float32 vectors)"
+    )
+
+    if args.write:
+        print(f"\n{'write':<10}{'rows':>10}{'embedded':>10}{'seconds':>9}{'on disk':>10}")
+        dedup_index = NearDuplicateIndex(threshold=args.threshold, num_perm=args.num_perm)
+        for name, dedup in (("plain", None), ("dedup", ChunkDeduplicator(dedup_index))):
+            table, reports, seconds, size = write_corpus(corpus, dedup, args.ndims, args.chunks_per_source)
+            rows = sum(r.rows_written for r in reports)
+            embedded = sum(r.embedded for r in reports)
+            print(f"{name:<10}{rows:>10,}{embedded:>10,}{seconds:>8.1f}s{size / 1e6:>8.0f}MB")
+        sample = (
+            table.search()
+            .where("metadata.duplicate_sources IS NOT NULL")
+            .select(["metadata"])
+            .limit(1)
+            .to_list()
+        )
+        if sample:
+            metadata = sample[0]["metadata"]
+            print(
+                f"\nExample row of {metadata['source']} also found in "
+                f"{len(metadata['duplicate_sources'])} places, e.g. {metadata['duplicate_filenames'][:3]}"
+            )
+
+
+if __name__ == "__main__":
+    main()
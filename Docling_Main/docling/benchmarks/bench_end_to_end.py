@@ -0,0 +1,295 @@
+"""End-to-end benchmark: conversion, chunking, ingestion, retrieval and chat.
+
+Generates a deterministic synthetic Markdown corpus, streams it through the
+same pipeline as Step3 (DocumentConverter, FastHybridChunker with the OpenAI
+tokenizer wrapper, EmbeddingPipeline into LanceDB) with the offline fake
+embedding model, runs Step4-style retrieval and streams answers from a local
+fake chat endpoint. Reports throughput, latency percentiles, peak RSS and
+on-disk size as JSON. Run from the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_end_to_end --docs 50 --save-baseline small
+    python -m benchmarks.bench_end_to_end --docs 50 --compare benchmarks/baselines/small.json
+
+Results only compare across runs on the same machine with the same settings;
+the environment is recorded with every result.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import tempfile
+import time
+from importlib.metadata import PackageNotFoundError, version
+from typing import List
+
+import lancedb
+import numpy as np
+from docling.document_converter import DocumentConverter
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from utils.chunking import FastHybridChunker
+from utils.embedding_pipeline import EmbeddingPipeline
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.hybrid_search import ensure_fts_index, hybrid_search, lexical_search
+from utils.ingestion import hash_bytes, open_source_manifest, read_source
+from utils.metrics import metrics
+from utils.pipeline import run_ingestion
+from utils.retrieval import format_context, hits_from_rows
+from utils.tokenizer import OpenAICompatibleTokenizerWrapper
+from utils.vector_index import vector_search
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+VOCABULARY = [f"term{i}" for i in range(5000)]
+PACKAGES = ["docling", "docling-core", "lancedb", "pylance", "pyarrow", "tiktoken", "numpy"]
+
+
+def synthetic_markdown(index: int, sections: int, rng: random.Random) -> str:
+    """One document: headed sections of topic-drawn paragraphs plus a small table."""
+    topic = rng.sample(VOCABULARY, 80)
+    parts = [f"# Document {index}\n"]
+    for s in range(sections):
+        parts.append(f"## Section {index}.{s}\n")
+        for _ in range(rng.randint(2, 5)):
+            words = [rng.choice(topic) for _ in range(rng.randint(40, 160))]
+            parts.append(" ".join(words).capitalize() + ".\n")
+        if s % 3 == 0:
+            parts.append("| item | amount | period |\n|---|---|---|")
+            for r in range(rng.randint(3, 8)):
+                parts.append(f"| {rng.choice(topic)} | {rng.randint(1, 10**6)} | Q{r % 4 + 1} |")
+            parts.append("")
+    return "\n".join(parts)
+
+
+def write_corpus(directory: str, docs: int, sections: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(docs):
+        path = os.path.join(directory, f"doc{i:05d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(synthetic_markdown(i, sections, rng))
+        paths.append(path)
+    return paths
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def latency_stats(seconds: List[float]) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def environment() -> dict:
+    packages = {}
+    for name in PACKAGES:
+        try:
+            packages[name] = version(name)
+        except PackageNotFoundError:
+            pass
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "packages": packages,
+    }
+
+
+def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    db_dir = os.path.join(work_dir, "lancedb")
+    os.makedirs(corpus_dir)
+    sources = write_corpus(corpus_dir, args.docs, args.sections, args.seed)
+    results = {"stages": {}}
+    metrics.reset()
+
+    # Ingestion: convert -> chunk -> embed -> write, exactly as in Step3
+    tokenizer = OpenAICompatibleTokenizerWrapper()
+    chunker = FastHybridChunker(tokenizer=tokenizer, max_tokens=args.max_tokens, merge_peers=True)
+    func = get_registry().get("fake-embeddings").create(ndim=args.ndims)
+
+    class ChunkMetadata(LanceModel):
+        chunk_hash: str | None
+        filename: str | None
+        page_numbers: List[int] | None
+        source: str | None
+        source_hash: str | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+        metadata: ChunkMetadata
+
+    db = lancedb.connect(db_dir)
+    table = db.create_table("bench", schema=Chunks)
+    manifest = open_source_manifest(db, "bench")
+    pipeline = EmbeddingPipeline(func, tokenizer, concurrency=4)
+    source_hashes = {source: hash_bytes(read_source(source)) for source in sources}
+
+    start = time.perf_counter()
+    for _ in run_ingestion(
+        sources, DocumentConverter(), chunker, table, pipeline, manifest, source_hashes
+    ):
+        pass
+    ingest_seconds = time.perf_counter() - start
+    rows = table.count_rows()
+    ensure_fts_index(table)
+
+    results["stages"]["convert"] = {
+        "seconds": metrics.sums.get("convert_seconds", 0.0),
+        "docs_per_s": metrics.rate("documents_converted", "convert"),
+    }
+    results["stages"]["chunk"] = {
+        "seconds": metrics.sums.get("chunk_seconds", 0.0),
+        "chunks_per_s": metrics.rate("chunks", "chunk"),
+    }
+    results["stages"]["ingest"] = {
+        "seconds": ingest_seconds,
+        "docs_per_s": args.docs / ingest_seconds,
+        "rows_per_s": rows / ingest_seconds,
+        "rows": rows,
+        "tokens_embedded": metrics.counters.get("tokens_embedded", 0),
+    }
+    results["peak_rss_mb_after_ingest"] = peak_rss_mb()
+    results["disk_mb"] = directory_size(db_dir) / 1e6
+
+    # Retrieval: queries are word samples from stored chunks
+    rng = random.Random(args.seed + 1)
+    sample = table.search().select(["text"]).limit(args.queries).to_list()
+    queries = []
+    for row in sample:
+        words = row["text"].split()
+        queries.append(" ".join(rng.sample(words, min(8, len(words)))))
+    searches = {
+        "vector": lambda q: vector_search(table, q, 5).to_list(),
+        "lexical": lambda q: lexical_search(table, q, 5),
+        "hybrid": lambda q: hybrid_search(table, q, 5),
+    }
+    for mode, search in searches.items():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            latencies.append(time.perf_counter() - start)
+        results["stages"][f"search_{mode}"] = latency_stats(latencies)
+
+    # Chat: stream answers from the fake endpoint with retrieved context
+    with FakeOpenAIServer(args.chat_ttft, args.chat_tokens_per_second, args.chat_tokens) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+        ttfts, turns = [], []
+        for query in queries[: args.chat_turns]:
+            context = format_context(hits_from_rows(hybrid_search(table, query, 5)))
+            start = time.perf_counter()
+            stream = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": f"Context:\n{context}"},
+                    {"role": "user", "content": query},
+                ],
+                stream=True,
+            )
+            first = None
+            for chunk in stream:
+                if first is None and chunk.choices and chunk.choices[0].delta.content:
+                    first = time.perf_counter() - start
+            ttfts.append(first or 0.0)
+            turns.append(time.perf_counter() - start)
+    chat = {f"ttft_{key}": value for key, value in latency_stats(ttfts).items()}
+    chat["turn_p50_ms"] = statistics.median(turns) * 1000
+    results["stages"]["chat"] = chat
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict) -> None:
+    if baseline.get("config") != current["config"]:
+        print("Warning: baseline was recorded with different settings:", baseline.get("config"))
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\n{'metric':<36}{'baseline':>12}{'current':>12}{'change':>9}")
+    for key in sorted(new):
+        if key in old:
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"{key:<36}{old[key]:>12.2f}{new[key]:>12.2f}{change:>8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--sections", type=int, default=12, help="Sections per document")
+    parser.add_argument("--max-tokens", type=int, default=512, help="Chunker token limit")
+    parser.add_argument("--ndims", type=int, default=256, help="Fake embedding dimensions")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--chat-turns", type=int, default=10)
+    parser.add_argument("--chat-ttft", type=float, default=0.2)
+    parser.add_argument("--chat-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--chat-tokens", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the result JSON here")
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved result")
+    args = parser.parse_args()
+
+    config = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "save_baseline", "compare")
+    }
+    current = {
+        "config": config,
+        "environment": environment(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": run(args),
+    }
+    print(json.dumps(current, indent=2))
+
+    paths = [args.output] if args.output else []
+    if args.save_baseline:
+        paths.append(os.path.join(BASELINE_DIR, f"{args.save_baseline}.json"))
+    for path in paths:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(current, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Exporting a chunk table: to_pandas + to_excel versus streaming Parquet / Arrow IPC.
+
+Writes a synthetic chunk table (bench_dedup's corpus, offline fake
+embeddings) into LanceDB, then exports it each way in a fresh process and
+reports the time, the file size and how far the process' peak resident
+memory grew past what opening the table took (read from /proc, so Linux
+only). The pandas export materializes the whole table, vectors included,
+before Excel gets a row; the streaming exports hold one record batch at a
+time and leave the vectors out. Run from the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_export --chunks 20000 100000
+    python -m benchmarks.bench_export --chunks 100000 --skip-excel
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import lancedb
+
+from benchmarks.bench_dedup import dedup_corpus, write_corpus
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.table_export import export_excel_preview, export_table
+
+
+def _memory_status(field: str) -> int:
+    # Linux only: VmRSS is the resident memory now, VmHWM its peak
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def _reset_peak_rss() -> None:
+    # Writing 5 to clear_refs resets VmHWM to the current resident memory
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def _export(mode: str, db_path: str, path: str):
+    table = lancedb.connect(db_path).open_table("bench")
+    table.count_rows()
+    _reset_peak_rss()
+    baseline = _memory_status("VmRSS")
+    start = time.perf_counter()
+    if mode == "pandas":
+        table.to_pandas().to_excel(path, index=False)
+    elif mode == "preview":
+        export_excel_preview(table, path)
+    else:
+        export_table(table, path)
+    return time.perf_counter() - start, os.path.getsize(path), _memory_status("VmHWM") - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[20_000, 100_000])
+    parser.add_argument("--ndims", type=int, default=1536)
+    parser.add_argument("--skip-excel", action="store_true", help="Leave out the (slow) full pandas Excel export")
+    args = parser.parse_args()
+
+    modes = [("parquet", ".parquet"), ("arrow", ".arrow"), ("preview", "-preview.xlsx")]
+    if not args.skip_excel:
+        modes.insert(0, ("pandas", ".xlsx"))
+    context = multiprocessing.get_context("spawn")
+    print(f"{'chunks':>9}  {'export':<9}{'seconds':>9}{'file':>11}{'peak RSS +':>12}")
+    for chunks in args.chunks:
+        table, _, _, _ = write_corpus(dedup_corpus(chunks), None, args.ndims, chunks_per_source=100)
+        db_path = os.path.dirname(table.uri)
+        directory = tempfile.mkdtemp()
+        for mode, extension in modes:
+            path = os.path.join(directory, f"chunks{extension}")
+            with context.Pool(1) as pool:
+                seconds, size, memory = pool.apply(_export, (mode, db_path, path))
+            print(f"{chunks:>9,}  {mode:<9}{seconds:>8.1f}s{size / 1e6:>9.1f}MB{memory / 1e6:>10.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Latency and hit rate of vector, lexical (BM25) and hybrid retrieval.
+
+Builds a synthetic corpus where every chunk carries a unique clause number
+and account name, then asks two kinds of questions: paraphrase-like ones
+(a bag of the chunk's words) and exact-term ones (its clause number or
+account name). Runs offline with the fake embedding model; ``--latency``
+simulates a slow embedding API. Run from the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_hybrid_search --chunks 20000 --latency 0.05
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+import lancedb
+import numpy as np
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.hybrid_search import ensure_fts_index, hybrid_search, lexical_search
+from utils.vector_index import vector_search
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+
+
+def synthetic_corpus(num_chunks: int, seed: int = 0):
+    """Topic-drawn chunks, each opening with a unique clause number and account name."""
+    rng = random.Random(seed)
+    topics = [rng.sample(VOCABULARY, 50) for _ in range(max(1, num_chunks // 50))]
+    chunks = []
+    for i in range(num_chunks):
+        clause = f"{i // 100}.{i % 100}"
+        account = f"ACCT{rng.randrange(10**6):06d}"
+        topic = rng.choice(topics)
+        body = " ".join(rng.choice(topic) for _ in range(rng.randint(30, 120)))
+        chunks.append(
+            {"text": f"Clause {clause}. Account {account}. {body}", "clause": clause, "account": account}
+        )
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated embedding latency in seconds")
+    parser.add_argument("--vector-timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    func = get_registry().get("fake-embeddings").create(ndim=256, latency=args.latency)
+
+    class Metadata(LanceModel):
+        filename: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+        metadata: Metadata
+
+    corpus = synthetic_corpus(args.chunks)
+    table = lancedb.connect(tempfile.mkdtemp()).create_table("bench", schema=Chunks)
+    for start in range(0, len(corpus), 5000):
+        table.add([{"text": c["text"], "metadata": {"filename": "bench"}} for c in corpus[start : start + 5000]])
+    ensure_fts_index(table)
+
+    rng = random.Random(1)
+    targets = rng.sample(corpus, args.queries)
+    query_sets = {
+        "paraphrase": [(" ".join(rng.sample(c["text"].split()[4:], 10)), c["text"]) for c in targets],
+        "exact term": [
+            (f"What does clause {c['clause']} say?" if i % 2 else f"payments for account {c['account']}", c["text"])
+            for i, c in enumerate(targets)
+        ],
+    }
+
+    modes = {
+        "vector": lambda q: vector_search(table, q, args.k).select(["text"]).to_list(),
+        "lexical": lambda q: lexical_search(table, q, args.k),
+        "hybrid": lambda q: hybrid_search(table, q, args.k, vector_timeout=args.vector_timeout),
+    }
+
+    print(f"{args.chunks:,} chunks, {args.queries} queries per set, k={args.k}, embedding latency {args.latency}s\n")
+    print(f"{'queries':<12}{'mode':<10}{'hit@' + str(args.k):>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for set_name, queries in query_sets.items():
+        for mode, search in modes.items():
+            hits, latencies = 0, []
+            for query, expected in queries:
+                start = time.perf_counter()
+                results = search(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += any(row["text"] == expected for row in results)
+            print(
+                f"{set_name:<12}{mode:<10}{hits / len(queries):>8.2f}"
+                f"{statistics.median(latencies):>9.2f}{np.percentile(latencies, 95):>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
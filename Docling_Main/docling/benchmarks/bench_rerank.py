@@ -0,0 +1,143 @@
+"""Retrieval quality versus end-to-end turn time, with and without reranking.
+
+Compares sending the top k raw search results (k = 5, 10, 20) with
+over-fetching 50 candidates and reranking them down to 5. Quality is the
+hit rate and MRR of the chunk a question was drawn from; cost is the search
+(plus rerank) latency, the prompt size and the turn time against the local
+fake chat endpoint, whose time to first token grows with the prompt like a
+real model's prefill. Uses the synthetic clause/account corpus of
+bench_hybrid_search with the offline fake embeddings. Run from the
+Docling_Main/docling directory:
+
+    python -m benchmarks.bench_rerank --chunks 20000 --mode vector
+    python -m benchmarks.bench_rerank --cross-encoder   # needs sentence-transformers
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from typing import List
+
+import lancedb
+import numpy as np
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+from openai import OpenAI
+
+from benchmarks.bench_hybrid_search import synthetic_corpus
+from benchmarks.fake_openai import FakeOpenAIServer
+from utils.chat_service import SYSTEM_PROMPT, retrieve
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.hybrid_search import ensure_fts_index
+from utils.rerank import CrossEncoderScorer, LexicalScorer, Reranker
+from utils.retrieval import format_context
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--mode", default="vector", choices=["vector", "hybrid", "lexical"])
+    parser.add_argument("--fetch", type=int, default=50, help="Candidates fetched for reranking")
+    parser.add_argument("--latency-budget", type=float, default=0.3, help="Rerank seconds")
+    parser.add_argument("--cross-encoder", action="store_true", help="Also rerank with a local cross-encoder")
+    parser.add_argument("--chat-turns", type=int, default=20, help="Queries also sent to the chat endpoint")
+    parser.add_argument("--chat-ttft", type=float, default=0.2)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000.0)
+    parser.add_argument("--chat-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--chat-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    func = get_registry().get("fake-embeddings").create(ndim=256)
+
+    class Metadata(LanceModel):
+        filename: str | None
+        page_numbers: List[int] | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+        metadata: Metadata
+
+    corpus = synthetic_corpus(args.chunks)
+    table = lancedb.connect(tempfile.mkdtemp()).create_table("bench", schema=Chunks)
+    for start in range(0, len(corpus), 5000):
+        table.add(
+            [
+                {"text": c["text"], "metadata": {"filename": "bench", "page_numbers": [i + start]}}
+                for i, c in enumerate(corpus[start : start + 5000])
+            ]
+        )
+    ensure_fts_index(table)
+
+    rng = random.Random(1)
+    targets = rng.sample(corpus, args.queries)
+    queries = []
+    for i, c in enumerate(targets):
+        if i % 3 == 0:
+            queries.append((f"What does clause {c['clause']} say about {' '.join(rng.sample(c['text'].split()[4:], 3))}?", c["text"]))
+        else:
+            queries.append((" ".join(rng.sample(c["text"].split()[4:], 10)), c["text"]))
+
+    configs = {f"top{k}": dict(num_results=k) for k in (5, 10, 20)}
+    configs[f"fetch{args.fetch}+lexical->5"] = dict(
+        num_results=5,
+        reranker=Reranker(LexicalScorer(), latency_budget=args.latency_budget),
+        rerank_fetch=args.fetch,
+    )
+    if args.cross_encoder:
+        configs[f"fetch{args.fetch}+cross-encoder->5"] = dict(
+            num_results=5,
+            reranker=Reranker(CrossEncoderScorer(), latency_budget=args.latency_budget),
+            rerank_fetch=args.fetch,
+        )
+
+    print(
+        f"{args.chunks:,} chunks, {args.queries} queries, mode {args.mode}, "
+        f"chat ttft {args.chat_ttft}s + prompt at {args.prefill_tokens_per_second:.0f} tokens/s\n"
+    )
+    print(
+        f"{'config':<28}{'hit rate':>9}{'MRR':>7}{'search p50':>12}{'search p95':>12}"
+        f"{'prompt tok':>12}{'turn p50':>10}"
+    )
+    with FakeOpenAIServer(
+        args.chat_ttft,
+        args.chat_tokens_per_second,
+        args.chat_tokens,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+    ) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+        for name, config in configs.items():
+            hits_found, reciprocal_ranks, latencies, prompt_tokens, turns = 0, [], [], [], []
+            for n, (query, expected) in enumerate(queries):
+                start = time.perf_counter()
+                hits = retrieve(table, query, mode=args.mode, **config)
+                latencies.append((time.perf_counter() - start) * 1000)
+                rank = next((r for r, hit in enumerate(hits, 1) if hit.text == expected), None)
+                hits_found += rank is not None
+                reciprocal_ranks.append(1 / rank if rank else 0.0)
+                system_prompt = SYSTEM_PROMPT.format(context=format_context(hits))
+                prompt_tokens.append(len(system_prompt + query) // 4)
+
+                if n < args.chat_turns:
+                    client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": query},
+                        ],
+                    )
+                    turns.append(time.perf_counter() - start)
+            print(
+                f"{name:<28}{hits_found / len(queries):>9.2f}{statistics.mean(reciprocal_ranks):>7.2f}"
+                f"{statistics.median(latencies):>10.1f}ms{np.percentile(latencies, 95):>10.1f}ms"
+                f"{statistics.mean(prompt_tokens):>12,.0f}"
+                f"{statistics.median(turns) * 1000 if turns else float('nan'):>8.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
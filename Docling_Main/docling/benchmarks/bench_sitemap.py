@@ -0,0 +1,100 @@
+"""Throughput and memory of the sitemap crawler against a local stub server.
+
+Serves a synthetic ``sitemap.xml`` index pointing at child sitemaps (every
+other one gzipped) from a local HTTP server, with an optional delay per
+request to mimic a remote site, and crawls it at several concurrency
+levels. Run from the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_sitemap --children 20 --urls 50000 --delay 0.2
+"""
+
+import argparse
+import asyncio
+import gzip
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.sitemap import iter_sitemap_urls
+
+NAMESPACE = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def build_site(base_url: str, children: int, urls_per_child: int) -> dict:
+    """Returns {path: body} for a sitemap index and its child sitemaps."""
+    files = {}
+    entries = []
+    for i in range(children):
+        path = f"/sitemaps/pages-{i}.xml" + (".gz" if i % 2 else "")
+        entries.append(f"<sitemap><loc>{base_url}{path}</loc></sitemap>")
+        body = "".join(
+            f"<url><loc>{base_url}/page/{i}/{j}</loc><lastmod>2024-01-01</lastmod></url>"
+            for j in range(urls_per_child)
+        )
+        xml = f'<?xml version="1.0"?><urlset xmlns="{NAMESPACE}">{body}</urlset>'.encode()
+        files[path] = gzip.compress(xml) if i % 2 else xml
+    files["/sitemap.xml"] = (
+        f'<?xml version="1.0"?><sitemapindex xmlns="{NAMESPACE}">{"".join(entries)}</sitemapindex>'
+    ).encode()
+    return files
+
+
+def serve(files: dict, delay: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def crawl(base_url: str, concurrency: int) -> int:
+    count = 0
+    async for _ in iter_sitemap_urls(base_url, max_concurrency=concurrency):
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--children", type=int, default=20, help="Child sitemaps in the index")
+    parser.add_argument("--urls", type=int, default=50_000, help="Page URLs across all child sitemaps")
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds the server waits per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    # The sitemaps embed the server's address, so fill them in once it is listening
+    files = {}
+    server = serve(files, args.delay)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    files.update(build_site(base_url, args.children, args.urls // args.children))
+
+    print(f"{args.children} child sitemaps, {args.urls:,} URLs, {args.delay}s per request\n")
+    print(f"{'concurrency':>12}{'URLs':>9}{'seconds':>9}{'URLs/s':>10}{'peak MB':>9}")
+    for concurrency in args.concurrency:
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = asyncio.run(crawl(base_url + "/", concurrency))
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        print(f"{concurrency:>12}{count:>9,}{seconds:>9.2f}{count / seconds:>10,.0f}{peak:>9.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Memory and throughput of streaming row-window chunking as workbooks grow.
+
+Writes synthetic transaction workbooks of increasing size (openpyxl
+write-only mode), then cuts each into row windows with SpreadsheetChunker
+and reports rows/s, windows and the peak Python heap (tracemalloc). The
+chunker holds one window and one parsed row at a time, so the peak heap
+should stay flat as the row count grows. With ``--full-load`` the same
+workbooks are also opened the way a whole-workbook conversion reads them
+(openpyxl without read-only mode) for comparison. Run from the
+Docling_Main/docling directory:
+
+    python -m benchmarks.bench_spreadsheet --rows 10000 100000 300000 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from utils.spreadsheet import SpreadsheetChunker
+from utils.tokenizer import OpenAICompatibleTokenizerWrapper
+
+DESCRIPTIONS = [
+    "Online Shopping - Tech Gadgets",
+    "Gas Station Purchase",
+    "Salary Deposit",
+    "ATM Withdrawal - Mountainview ATM",
+    "Restaurant Dining",
+    "Transfer to Sophia Johnson",
+    "Utility Bill Payment",
+]
+
+
+def write_workbook(path: str, rows: int, seed: int = 0) -> None:
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Transactions")
+    sheet.append(["Transaction ID", "Date", "Description", "Debit", "Credit", "Balance", "Account"])
+    balance = 30000.0
+    for i in range(rows):
+        amount = round(rng.uniform(5, 500), 2)
+        debit = rng.random() < 0.8
+        balance += -amount if debit else amount
+        sheet.append(
+            [
+                1000 + i,
+                f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                rng.choice(DESCRIPTIONS),
+                amount if debit else None,
+                None if debit else amount,
+                round(balance, 2),
+                f"ACCT{rng.randrange(10**6):06d}",
+            ]
+        )
+    workbook.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 300_000])
+    parser.add_argument("--window-tokens", type=int, default=512)
+    parser.add_argument("--full-load", action="store_true", help="Also open each workbook fully in memory")
+    args = parser.parse_args()
+
+    chunker = SpreadsheetChunker(OpenAICompatibleTokenizerWrapper(), max_tokens=args.window_tokens)
+    directory = tempfile.mkdtemp()
+    print(f"{'rows':>10}{'file':>9}{'windows':>9}{'rows/s':>10}{'peak heap':>11}{'full load':>11}")
+    for rows in args.rows:
+        path = os.path.join(directory, f"transactions-{rows}.xlsx")
+        write_workbook(path, rows)
+
+        start = time.perf_counter()
+        windows = sum(1 for _ in chunker.chunk(path))
+        seconds = time.perf_counter() - start
+
+        # Tracing slows the chunker down, so memory is measured in a second pass
+        tracemalloc.start()
+        for _ in chunker.chunk(path):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        full = float("nan")
+        if args.full_load:
+            from openpyxl import load_workbook
+
+            tracemalloc.start()
+            load_workbook(path).close()
+            full = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+        print(
+            f"{rows:>10,}{os.path.getsize(path) / 1e6:>7.1f}MB{windows:>9,}{rows / seconds:>10,.0f}"
+            f"{peak / 1e6:>9.1f}MB{full:>9.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
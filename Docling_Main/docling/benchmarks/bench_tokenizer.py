@@ -0,0 +1,112 @@
+"""Microbenchmark: HybridChunker with and without the tokenizer's count-only fast path.
+
+Run from the Docling_Main/docling directory:
+
+    python -m benchmarks.bench_tokenizer --sections 2000
+"""
+
+import argparse
+import random
+import time
+from io import BytesIO
+
+from docling.chunking import HybridChunker
+from docling.datamodel.base_models import DocumentStream
+from docling.document_converter import DocumentConverter
+from transformers.tokenization_utils_base import PreTrainedTokenizerBase
+
+from utils.chunking import FastHybridChunker
+from utils.tokenizer import OpenAICompatibleTokenizerWrapper
+
+WORDS = (
+    "agreement party payment fee notice term clause liability revenue quarter "
+    "statement income operating net total shares period fiscal device driver "
+    "vehicle motion restriction feature license software warranty"
+).split()
+
+
+class LegacyTokenizerWrapper(OpenAICompatibleTokenizerWrapper):
+    """The wrapper as it was before the fast path: no encode shortcut, vocab rebuilt per call."""
+
+    encode = PreTrainedTokenizerBase.encode
+
+    def count_tokens(self, text):
+        return len(self.tokenize(text))
+
+    def get_vocab(self):
+        return dict(enumerate(range(self.vocab_size)))
+
+
+def synthetic_markdown(sections: int, seed: int = 0) -> str:
+    """Builds a long markdown document with many short sections, which makes the chunker merge peers a lot."""
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sections):
+        parts.append(f"## Section {i}\n")
+        for _ in range(rng.randint(1, 4)):
+            parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))) + "\n")
+    return "\n".join(parts)
+
+
+def time_chunking(chunker, document, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        num_chunks = sum(1 for _ in chunker.chunk(dl_doc=document))
+        best = min(best, time.perf_counter() - start)
+    return best, num_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    markdown = synthetic_markdown(args.sections)
+    document = DocumentConverter().convert(
+        DocumentStream(name="bench.md", stream=BytesIO(markdown.encode("utf-8")))
+    ).document
+    print(f"Document: {args.sections} sections, {len(markdown):,} characters")
+
+    before = HybridChunker(
+        tokenizer=LegacyTokenizerWrapper(), max_tokens=args.max_tokens, merge_peers=True
+    )
+    after = FastHybridChunker(
+        tokenizer=OpenAICompatibleTokenizerWrapper(), max_tokens=args.max_tokens, merge_peers=True
+    )
+
+    before_seconds, before_chunks = time_chunking(before, document, args.repeat)
+    after_seconds, after_chunks = time_chunking(after, document, args.repeat)
+
+    print(f"{'':<28}{'seconds':>10}{'chunks':>10}")
+    print(f"{'before (tokenize + len)':<28}{before_seconds:>10.3f}{before_chunks:>10}")
+    print(f"{'after (count_tokens)':<28}{after_seconds:>10.3f}{after_chunks:>10}")
+    print(f"Speed-up: {before_seconds / after_seconds:.2f}x")
+
+    # Count-only micro-benchmark on the same spans
+    spans = [markdown[i : i + 2000] for i in range(0, len(markdown), 500)]
+    legacy, fast = LegacyTokenizerWrapper(), OpenAICompatibleTokenizerWrapper()
+
+    start = time.perf_counter()
+    legacy_total = sum(len(legacy.tokenize(span)) for span in spans)
+    tokenize_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_total = sum(fast.count_tokens_batch(spans))
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cached_total = sum(fast.count_tokens(span) for span in spans)
+    cached_seconds = time.perf_counter() - start
+
+    assert legacy_total == batch_total == cached_total
+    print(f"\nCounting {len(spans)} overlapping spans ({legacy_total:,} tokens):")
+    print(f"  len(tokenize(text))     {tokenize_seconds:.4f}s")
+    print(f"  count_tokens_batch      {batch_seconds:.4f}s")
+    print(f"  count_tokens (memoized) {cached_seconds:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
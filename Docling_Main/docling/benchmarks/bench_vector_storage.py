@@ -0,0 +1,117 @@
+"""Disk size, search latency and recall@k of each vector storage mode on the same corpus.
+
+Runs offline with the deterministic fake embedding model. Unlike
+text-embedding-3, the fake model is not trained to front-load information
+into the first dimensions, so its recall for shortened vectors is a lower
+bound; disk size and latency carry over. Run from the Docling_Main/docling
+directory:
+
+    python -m benchmarks.bench_vector_storage --chunks 20000 --ndims 3072
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+from lancedb.embeddings import get_registry
+
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.vector_index import ensure_vector_index, vector_search
+from utils.vector_storage import VectorStorage, search_with_int8_rerank, truncate_embedding
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+
+
+def synthetic_corpus(num_chunks: int, seed: int = 0):
+    """Chunks drawn from overlapping topics, so nearest neighbours are meaningful."""
+    rng = random.Random(seed)
+    topics = [rng.sample(VOCABULARY, 50) for _ in range(max(1, num_chunks // 50))]
+    return [
+        " ".join(rng.choice(rng.choice(topics)) for _ in range(rng.randint(30, 120)))
+        for _ in range(num_chunks)
+    ]
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def build_table(db, name: str, texts, full_vectors, storage: VectorStorage):
+    columns = [storage.encode(vector) for vector in full_vectors]
+    data = {"id": list(range(len(texts))), "text": texts}
+    dims = len(columns[0]["vector"])
+    data["vector"] = pa.array([c["vector"] for c in columns], type=pa.list_(pa.float32(), dims))
+    if storage.int8_rerank:
+        data["vector_q8"] = pa.array([c["vector_q8"] for c in columns], type=pa.binary())
+        data["vector_scale"] = [c["vector_scale"] for c in columns]
+    return db.create_table(name, data=pa.table(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--ndims", type=int, default=3072)
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=50, help="Candidates reranked in int8 mode")
+    parser.add_argument("--index", action="store_true", help="Search through an IVF-PQ index instead of exact scans")
+    args = parser.parse_args()
+
+    func = get_registry().get("fake-embeddings").create(ndim=args.ndims)
+    texts = synthetic_corpus(args.chunks)
+    full_vectors = np.stack(func.generate_embeddings(texts))
+
+    rng = random.Random(1)
+    queries = [" ".join(rng.sample(text.split(), 8)) for text in rng.sample(texts, args.queries)]
+    query_vectors = np.stack(func.generate_embeddings(queries))
+    # Ground truth: exact top-k over the full-size vectors
+    truth = [set(np.argsort(-(full_vectors @ q))[: args.k].tolist()) for q in query_vectors]
+
+    modes = [("full", VectorStorage())]
+    for dims in args.dims:
+        modes.append((f"reduced-{dims}", VectorStorage(dims=dims)))
+        modes.append((f"reduced-{dims}+int8", VectorStorage(dims=dims, int8_rerank=True)))
+
+    db_path = tempfile.mkdtemp()
+    db = lancedb.connect(db_path)
+    print(f"{args.chunks:,} chunks, {args.ndims}-dim embeddings, {args.queries} queries, k={args.k}\n")
+    print(f"{'mode':<22}{'disk MB':>10}{'p50 ms':>9}{'p95 ms':>9}{'recall@' + str(args.k):>11}")
+
+    for name, storage in modes:
+        table_name = name.replace("+", "_").replace("-", "_")
+        table = build_table(db, table_name, texts, full_vectors, storage)
+        if args.index:
+            ensure_vector_index(table, min_rows=0)
+        size_mb = directory_size(os.path.join(db_path, f"{table_name}.lance")) / 1e6
+
+        latencies, recalls = [], []
+        for query, query_vector, expected in zip(queries, query_vectors, truth):
+            start = time.perf_counter()
+            if storage.int8_rerank:
+                rows = search_with_int8_rerank(table, func, query, args.k, candidates=args.candidates)
+            else:
+                rows = vector_search(
+                    table, truncate_embedding(query_vector, storage.dims), args.k
+                ).select(["id"]).to_list()
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & {row["id"] for row in rows}) / args.k)
+
+        print(
+            f"{name:<22}{size_mb:>10.1f}{statistics.median(latencies):>9.2f}"
+            f"{np.percentile(latencies, 95):>9.2f}{statistics.mean(recalls):>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
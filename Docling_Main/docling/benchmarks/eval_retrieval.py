@@ -0,0 +1,128 @@
+"""Offline retrieval evaluation: recall@k, MRR, latency and batch throughput per mode.
+
+Builds the synthetic clause/account corpus of bench_hybrid_search as one
+"file" whose chunks are one page each, embedded with the offline fake
+embeddings, and a labelled question set over it: paraphrase-like
+questions (a bag of a chunk's words), exact-term questions (its clause
+number or account name) and questions comparing two clauses (two relevant
+chunks). Then runs utils/retrieval_eval.py's evaluate for every retrieval
+mode. ``--latency`` simulates a slow embedding API, which single-query
+retrieval pays per question and retrieve_batch once per
+BATCH_EMBED_SIZE questions. ``--write-questions`` saves the generated
+questions in the format ``python -m utils.retrieval_eval`` reads, and
+``--questions`` evaluates a saved set instead. Run from the
+Docling_Main/docling directory:
+
+    python -m benchmarks.eval_retrieval --chunks 20000 --questions-per-kind 1000
+    python -m benchmarks.eval_retrieval --latency 0.05 --index --results data/eval/results.jsonl
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from typing import List
+
+import lancedb
+from lancedb.embeddings import get_registry
+from lancedb.pydantic import LanceModel, Vector
+
+from benchmarks.bench_hybrid_search import synthetic_corpus
+from utils.fake_embeddings import FakeEmbeddings  # noqa: F401 (registers "fake-embeddings")
+from utils.hybrid_search import ensure_fts_index
+from utils.retrieval_eval import (
+    LabelledQuestion,
+    RelevantChunk,
+    evaluate,
+    format_reports,
+    load_questions,
+    save_questions,
+    write_results,
+)
+from utils.vector_index import ensure_vector_index
+
+FILENAME = "clauses.pdf"
+
+
+def labelled_questions(corpus, per_kind: int, seed: int = 1) -> List[LabelledQuestion]:
+    """Paraphrase, exact-term and two-clause questions, labelled with the pages answering them."""
+    rng = random.Random(seed)
+    questions = []
+    for page in rng.sample(range(len(corpus)), per_kind):
+        words = corpus[page]["text"].split()[4:]
+        questions.append(LabelledQuestion(" ".join(rng.sample(words, 10)), [RelevantChunk(FILENAME, (page,))]))
+    for i, page in enumerate(rng.sample(range(len(corpus)), per_kind)):
+        chunk = corpus[page]
+        query = f"What does clause {chunk['clause']} say?" if i % 2 else f"payments for account {chunk['account']}"
+        questions.append(LabelledQuestion(query, [RelevantChunk(FILENAME, (page,))]))
+    for _ in range(per_kind):
+        first, second = rng.sample(range(len(corpus)), 2)
+        questions.append(
+            LabelledQuestion(
+                f"Compare clause {corpus[first]['clause']} with clause {corpus[second]['clause']}",
+                [RelevantChunk(FILENAME, (first,)), RelevantChunk(FILENAME, (second,))],
+            )
+        )
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--questions-per-kind", type=int, default=500)
+    parser.add_argument("--questions", help="Evaluate these labelled questions instead of generated ones")
+    parser.add_argument("--write-questions", help="Save the generated questions to this .jsonl")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid", "lexical"])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated embedding latency in seconds")
+    parser.add_argument("--latency-sample", type=int, default=200, help="Questions timed one at a time")
+    parser.add_argument("--index", action="store_true", help="Build the IVF_PQ index (otherwise exact search)")
+    parser.add_argument("--results", help="Write per-question ranks and latency to this .jsonl")
+    args = parser.parse_args()
+
+    func = get_registry().get("fake-embeddings").create(ndim=256, latency=args.latency)
+
+    class Metadata(LanceModel):
+        filename: str | None
+        page_numbers: List[int] | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+        metadata: Metadata
+
+    corpus = synthetic_corpus(args.chunks)
+    table = lancedb.connect(tempfile.mkdtemp()).create_table("eval", schema=Chunks)
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), 5000):
+        table.add(
+            [
+                {"text": c["text"], "metadata": {"filename": FILENAME, "page_numbers": [offset + i]}}
+                for i, c in enumerate(corpus[offset : offset + 5000])
+            ]
+        )
+    ensure_fts_index(table)
+    if args.index:
+        ensure_vector_index(table, min_rows=0)
+    print(f"Indexed {len(corpus):,} chunks in {time.perf_counter() - start:.1f}s")
+
+    if args.questions:
+        questions = load_questions(args.questions)
+    else:
+        questions = labelled_questions(corpus, args.questions_per_kind)
+        if args.write_questions:
+            save_questions(questions, args.write_questions)
+    print(
+        f"{len(questions):,} questions, embedding latency {args.latency}s, "
+        f"{'IVF_PQ index' if args.index else 'exact search'}\n"
+    )
+
+    reports = [evaluate(table, questions, mode, args.k, args.latency_sample) for mode in args.modes]
+    print(format_reports(reports))
+    if args.results:
+        write_results(reports, args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Streams a deterministic answer over server-sent events, with a configurable
+time to first token (optionally growing with the prompt length, like a real
+model's prefill) and token rate, and reports usage in the final chunk
+like the real API does with ``stream_options={"include_usage": True}``.
+Point an ``OpenAI`` client at ``server.base_url`` to use it. Can also run on
+its own:
+
+    python -m benchmarks.fake_openai --port 8001 --ttft 0.3 --tokens-per-second 80
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = "the context says that this clause applies to the party named above".split()
+
+
+def fake_answer(prompt: str, num_tokens: int) -> list:
+    """Deterministic answer tokens derived from the prompt."""
+    seed = sum(prompt.encode("utf-8")) % len(WORDS)
+    return [WORDS[(seed + i) % len(WORDS)] + " " for i in range(num_tokens)]
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server answering ``POST /v1/chat/completions``.
+
+    Args:
+        ttft: Seconds before the first token is sent
+        tokens_per_second: Rate at which the remaining tokens are streamed
+        answer_tokens: Number of tokens in every answer
+        port: Port to listen on (0 picks a free one)
+        prefill_tokens_per_second: If set, the first token is delayed by a further
+            prompt_tokens / prefill_tokens_per_second seconds
+    """
+
+    def __init__(
+        self,
+        ttft: float = 0.2,
+        tokens_per_second: float = 100.0,
+        answer_tokens: int = 50,
+        port: int = 0,
+        prefill_tokens_per_second: float | None = None,
+    ):
+        self.ttft = ttft
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def first_token_delay(self, prompt_tokens: int) -> float:
+        if not self.prefill_tokens_per_second:
+            return self.ttft
+        return self.ttft + prompt_tokens / self.prefill_tokens_per_second
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests += 1
+                prompt = "".join(str(m.get("content", "")) for m in body["messages"])
+                tokens = fake_answer(prompt, server.answer_tokens)
+                usage = {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": len(prompt) // 4 + len(tokens),
+                }
+                if body.get("stream"):
+                    self._stream(body, tokens, usage)
+                else:
+                    time.sleep(
+                        server.first_token_delay(usage["prompt_tokens"])
+                        + len(tokens) / server.tokens_per_second
+                    )
+                    self._send_json(
+                        {
+                            "id": "chatcmpl-fake",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": body.get("model", "fake"),
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": "".join(tokens)},
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                            "usage": usage,
+                        }
+                    )
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, payload) -> None:
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                chunk = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, body, tokens, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def chunk(delta, finish_reason=None, usage=None):
+                    return {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": (
+                            []
+                            if usage
+                            else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                        ),
+                        "usage": usage,
+                    }
+
+                time.sleep(server.first_token_delay(usage["prompt_tokens"]))
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(1 / server.tokens_per_second)
+                    delta = {"content": token}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    self._event(chunk(delta))
+                self._event(chunk({}, finish_reason="stop"))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._event(chunk(None, usage=usage))
+                self._event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.ttft, args.tokens_per_second, args.answer_tokens, args.port)
+    print(f"Serving fake chat completions at {server.base_url}")
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+
+from utils.ingestion import hash_text
+
+METADATA_FIELDS = (
+    "chunk_hash",
+    "filename",
+    "page_numbers",
+    "row_end",
+    "row_start",
+    "sheet",
+    "source",
+    "source_hash",
+    "title",
+)
+
+
+def chunk_page_numbers(chunk) -> Optional[List[int]]:
+    """Sorted page numbers a chunk's items come from, or None if it has no provenance."""
+    pages = {prov.page_no for item in chunk.meta.doc_items for prov in item.prov}
+    return sorted(pages) or None
+
+
+class ChunkColumns:
+    """Column buffers for one batch of chunk rows.
+
+    Chunks are appended straight into per-column lists (text plus each
+    metadata field), and ``to_arrow`` turns them into a single Arrow table
+    in the table's schema, so no dict or pydantic model is built per row.
+    """
+
+    def __init__(self):
+        self.text: List[str] = []
+        self.metadata: Dict[str, list] = {name: [] for name in METADATA_FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @property
+    def chunk_hashes(self) -> List[str]:
+        return self.metadata["chunk_hash"]
+
+    def append(self, chunk, source: str, source_hash: str, chunk_hash: Optional[str] = None) -> None:
+        text = chunk.text
+        headings = chunk.meta.headings
+        metadata = self.metadata
+        self.text.append(text)
+        metadata["chunk_hash"].append(chunk_hash or hash_text(text))
+        metadata["filename"].append(chunk.meta.origin.filename)
+        metadata["page_numbers"].append(chunk_page_numbers(chunk))
+        # Row windows of spreadsheets (utils/spreadsheet.py) also record where they come from
+        metadata["row_end"].append(getattr(chunk.meta, "row_end", None))
+        metadata["row_start"].append(getattr(chunk.meta, "row_start", None))
+        metadata["sheet"].append(getattr(chunk.meta, "sheet", None))
+        metadata["source"].append(source)
+        metadata["source_hash"].append(source_hash)
+        metadata["title"].append(headings[0] if headings else None)
+
+    def to_arrow(
+        self,
+        schema: pa.Schema,
+        vectors: Dict[str, Sequence],
+        keep: Optional[Sequence[int]] = None,
+    ) -> pa.Table:
+        """Builds the rows as an Arrow table matching ``schema``.
+
+        Args:
+            schema: Schema of the LanceDB table the rows are written to
+            vectors: Values of each vector column in the schema (``vector`` and,
+                in int8 rerank mode, ``vector_q8`` and ``vector_scale``), one per row
+            keep: Indices of the rows to keep (e.g. leaving out failed embeddings),
+                None for all
+        """
+        metadata_type = schema.field("metadata").type
+        empty = [None] * len(self)
+        metadata = pa.StructArray.from_arrays(
+            [
+                pa.array(self.metadata.get(field.name, empty), type=field.type)
+                for field in metadata_type
+            ],
+            fields=list(metadata_type),
+        )
+        text = pa.array(self.text, type=pa.string())
+        if keep is not None and len(keep) < len(self):
+            indices = pa.array(keep, type=pa.int64())
+            text, metadata = text.take(indices), metadata.take(indices)
+            vectors = {name: [values[i] for i in keep] for name, values in vectors.items()}
+
+        arrays = {"text": text, "metadata": metadata}
+        for name, values in vectors.items():
+            field_type = schema.field(name).type
+            if pa.types.is_fixed_size_list(field_type):
+                arrays[name] = vectors_to_arrow(values, field_type)
+            else:
+                arrays[name] = pa.array(values, type=field_type)
+        schema = schema.remove_metadata()
+        return pa.Table.from_arrays([arrays[name] for name in schema.names], schema=schema)
+
+
+def vectors_to_arrow(vectors: Sequence, field_type: pa.DataType) -> pa.FixedSizeListArray:
+    """Packs equal-length vectors into a fixed-size list array without per-row conversion."""
+    matrix = np.asarray(vectors, dtype=field_type.value_type.to_pandas_dtype())
+    values = pa.array(matrix.reshape(-1))
+    return pa.FixedSizeListArray.from_arrays(values, field_type.list_size)
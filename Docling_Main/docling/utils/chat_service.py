@@ -0,0 +1,713 @@
+"""Asynchronous chat backend: retrieval and streamed answers over HTTP.
+
+Serves every Streamlit session (and any other client) from one process:
+
+- ``POST /retrieve`` ``{"query", "collection", "mode", "num_results", "filters"}``
+  returns the hits as JSON
+- ``POST /retrieve/batch`` ``{"queries", "collection", "mode", "num_results", "filters"}``
+  returns one list of hits per query, searched together (see retrieve_batch)
+- ``POST /chat`` ``{"messages", "collection", "mode", "num_results", "filters"}``
+  streams server-sent events: ``context`` (the hits for the last user
+  message), ``token`` (answer text as it arrives), then ``done`` (timings and
+  token usage) or ``error``
+- ``GET /collections`` lists the collections, ``GET /collections/{name}/files``
+  the filenames in one
+- ``GET /stats`` returns query cache counters, load and latency percentiles
+- ``GET /metrics`` returns all metrics in the Prometheus text format
+
+``filters`` (``{"filenames": [...], "pages": [first, last]}``) restrict the
+search before ranking; see metadata_filter.
+
+Searches run in a bounded thread pool (LanceDB and the embedding calls are
+blocking); answers stream from one pooled ``AsyncOpenAI`` client. Both are
+capped by semaphores, and requests waiting for a slot form a bounded queue:
+when it is full, or a request waits longer than ``queue_timeout``, the
+service answers 503 with ``Retry-After`` instead of piling up work. Run it
+from the Docling_Main/docling directory:
+
+    python -m utils.chat_service --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from datetime import timedelta
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from utils.collection_manager import DEFAULT_COLLECTION, CollectionManager, CollectionNotFoundError
+from utils.context_packer import ContextPacker
+from utils.hybrid_search import hybrid_search, lexical_search, reciprocal_rank_fusion
+from utils.metrics import metrics
+from utils.query_cache import QueryCache
+from utils.rerank import CrossEncoderScorer, LexicalScorer, Reranker
+from utils.retrieval import (
+    RETRIEVAL_MODES,
+    VECTOR_RESULT_COLUMNS,
+    SearchHit,
+    format_context,
+    hits_from_arrow,
+    hits_from_rows,
+    metadata_filter,
+)
+from utils.vector_index import vector_search
+from utils.near_duplicates import has_duplicate_columns
+from utils.vector_storage import (
+    has_int8_rerank,
+    rerank_int8,
+    search_with_int8_rerank,
+    truncate_embedding,
+)
+
+# ANN search knobs (only used once Step3 has built the vector index).
+# See benchmarks/bench_ann_recall.py for the recall/latency trade-off.
+NPROBES = 20  # IVF partitions scanned per query
+REFINE_FACTOR = 5  # Re-rank num_results * REFINE_FACTOR candidates with full vectors
+
+# Tables stored with Step3's INT8_RERANK search shortened vectors first, then rerank
+# RERANK_CANDIDATES of them against a full-size query embedding
+RERANK_CANDIDATES = 50
+
+# Rerank stage: over-fetch RERANK_FETCH candidates, re-order them with a cheap
+# scorer ("lexical" BM25 over the candidates, or a local "cross-encoder" model,
+# which needs sentence-transformers) and keep the best num_results. Scoring stops
+# after RERANK_LATENCY_BUDGET seconds. See benchmarks/bench_rerank.py.
+RERANKER = "lexical"  # "lexical", "cross-encoder" or None
+RERANK_FETCH = 50
+RERANK_LATENCY_BUDGET = 0.3  # seconds
+
+# Hybrid retrieval falls back to BM25 alone past this (see RETRIEVAL_MODES)
+VECTOR_TIMEOUT = 5.0  # seconds
+
+# Query cache: repeated questions reuse their retrieved context, and first questions
+# of a conversation also their answer. Near-duplicates (cosine similarity of the query
+# embeddings >= SEMANTIC_CACHE_THRESHOLD) count as repeats, except in lexical mode,
+# which never makes embedding calls. Entries are dropped when the table changes.
+SEMANTIC_CACHE_THRESHOLD = 0.95
+CACHE_ANSWERS = True
+# How often the open table checks for a newer version written by Step3
+READ_CONSISTENCY_INTERVAL = timedelta(seconds=10)
+
+# Batch retrieval (POST /retrieve/batch, utils/retrieval_eval.py): queries are embedded
+# BATCH_EMBED_SIZE per embedding call, and in vector mode BATCH_SEARCH_SIZE of them go
+# to LanceDB as one multi-vector search. Batches are not cached.
+BATCH_EMBED_SIZE = 256
+BATCH_SEARCH_SIZE = 64
+MAX_BATCH_QUERIES = 1000
+
+# Prompt tokens per turn: retrieved chunks (deduplicated, long ones trimmed to
+# their passages most relevant to the question) take up to CONTEXT_SHARE of it,
+# the newest history turns that fit take the rest. See utils/context_packer.py.
+PROMPT_TOKEN_BUDGET = 6000
+CONTEXT_SHARE = 0.6
+MAX_CHUNK_TOKENS = 800
+
+SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on the provided context.
+    Use only the information from the context to answer questions. If you're unsure or the context
+    doesn't contain the relevant information, say so.
+
+    Context:
+    {context}
+    """
+
+
+def retrieve(
+    table,
+    query: str,
+    num_results: int = 5,
+    mode: str = "vector",
+    nprobes: Optional[int] = NPROBES,
+    refine_factor: Optional[int] = REFINE_FACTOR,
+    full_func=None,
+    reranker: Optional[Reranker] = None,
+    rerank_fetch: int = RERANK_FETCH,
+    where: Optional[str] = None,
+) -> List[SearchHit]:
+    """Searches the table for chunks relevant to ``query``.
+
+    Args:
+        table: LanceDB table object
+        query: User's question
+        num_results: Number of results to return
+        mode: "vector", "hybrid" or "lexical" (see RETRIEVAL_MODES)
+        nprobes: Number of IVF partitions to search (higher = better recall, slower)
+        refine_factor: Re-rank this many times num_results candidates with full vectors
+        full_func: Full-size embedding function for tables stored with int8 rerank vectors
+        reranker: Re-orders ``rerank_fetch`` candidates before the best are kept, or None
+        rerank_fetch: Candidates fetched for the reranker
+        where: SQL filter applied before ranking (see metadata_filter)
+
+    Returns:
+        Relevant chunks with their source information, best first
+    """
+    limit = max(num_results, rerank_fetch) if reranker is not None else num_results
+    with metrics.span("search", mode=mode):
+        if mode == "lexical":
+            hits = hits_from_rows(lexical_search(table, query, limit, where=where))
+        elif mode == "hybrid":
+            hits = hits_from_rows(
+                hybrid_search(
+                    table,
+                    query,
+                    limit,
+                    candidates=max(20, limit),
+                    vector_timeout=VECTOR_TIMEOUT,
+                    where=where,
+                    nprobes=nprobes,
+                    refine_factor=refine_factor,
+                )
+            )
+        elif full_func is not None and has_int8_rerank(table):
+            hits = hits_from_rows(
+                search_with_int8_rerank(
+                    table,
+                    full_func,
+                    query,
+                    limit,
+                    candidates=max(RERANK_CANDIDATES, limit),
+                    nprobes=nprobes,
+                    refine_factor=refine_factor,
+                    where=where,
+                )
+            )
+        else:
+            hits = hits_from_arrow(
+                vector_search(
+                    table, query, limit, nprobes=nprobes, refine_factor=refine_factor, where=where
+                )
+                .select(VECTOR_RESULT_COLUMNS)
+                .to_arrow()
+            )
+    if reranker is None:
+        return hits
+    return reranker.rerank(query, hits, num_results)
+
+
+def embed_queries(func, queries: Sequence[str], batch_size: int = BATCH_EMBED_SIZE) -> List:
+    """Embeds queries ``batch_size`` per call to the embedding function."""
+    vectors = []
+    for start in range(0, len(queries), batch_size):
+        batch = list(queries[start : start + batch_size])
+        with metrics.span("batch_embed", queries=len(batch)):
+            vectors.extend(func.compute_source_embeddings(batch))
+    return vectors
+
+
+def _split_by_query(results: pa.Table, num_queries: int) -> List[pa.Table]:
+    """Splits a multi-vector search result into one table per query, in query order."""
+    if "query_index" not in results.column_names:
+        # LanceDB leaves the column out when a single vector was searched
+        return [results] if num_queries == 1 else [results.slice(0, 0)] * num_queries
+    results = results.sort_by([("query_index", "ascending"), ("_distance", "ascending")])
+    bounds = np.searchsorted(results.column("query_index").to_numpy(), np.arange(num_queries + 1))
+    return [results.slice(start, end - start) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _vector_search_batch(
+    table,
+    vectors: Sequence,
+    limit: int,
+    nprobes: Optional[int],
+    refine_factor: Optional[int],
+    where: Optional[str],
+    columns: Optional[List[str]] = VECTOR_RESULT_COLUMNS,
+    with_row_id: bool = False,
+) -> List[pa.Table]:
+    """Runs BATCH_SEARCH_SIZE vector searches at a time as one multi-vector search.
+
+    Returns:
+        The result rows of each vector, in vector order, best first
+    """
+    groups = []
+    for start in range(0, len(vectors), BATCH_SEARCH_SIZE):
+        batch = [np.asarray(v, dtype=np.float32) for v in vectors[start : start + BATCH_SEARCH_SIZE]]
+        query = vector_search(
+            table, batch, limit, nprobes=nprobes, refine_factor=refine_factor, where=where
+        )
+        if columns is not None:
+            query = query.select(columns)
+        groups.extend(_split_by_query(query.with_row_id(with_row_id).to_arrow(), len(batch)))
+    return groups
+
+
+def retrieve_batch(
+    table,
+    queries: Sequence[str],
+    num_results: int = 5,
+    mode: str = "vector",
+    nprobes: Optional[int] = NPROBES,
+    refine_factor: Optional[int] = REFINE_FACTOR,
+    full_func=None,
+    reranker: Optional[Reranker] = None,
+    rerank_fetch: int = RERANK_FETCH,
+    where: Optional[str] = None,
+    max_workers: int = 8,
+) -> List[List[SearchHit]]:
+    """Searches the table for many queries at once, e.g. a labelled question set.
+
+    Queries are embedded BATCH_EMBED_SIZE per call instead of one call each,
+    and their vector searches go to LanceDB BATCH_SEARCH_SIZE at a time as
+    one multi-vector search. The BM25 searches of hybrid and lexical mode,
+    one per query, run on ``max_workers`` threads; hybrid mode then fuses
+    each query's two result lists as hybrid_search does. The arguments are
+    those of ``retrieve``, and so are the hits of each query (hybrid mode
+    never falls back to BM25 alone, the embeddings being computed up front).
+
+    Returns:
+        One list of hits per query, in query order, best first
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    limit = max(num_results, rerank_fetch) if reranker is not None else num_results
+    int8_rerank = mode == "vector" and full_func is not None and has_int8_rerank(table)
+
+    vectors = None
+    if mode != "lexical":
+        func = full_func if int8_rerank else table.embedding_functions["vector"].function
+        vectors = embed_queries(func, queries)
+
+    with metrics.span("batch_search", mode=mode, queries=len(queries)):
+        if mode == "vector" and int8_rerank:
+            # Full-size embeddings: search with their shortened prefix, rerank with all of them
+            dims = table.schema.field("vector").type.list_size
+            groups = _vector_search_batch(
+                table,
+                [truncate_embedding(v, dims) for v in vectors],
+                max(RERANK_CANDIDATES, limit),
+                nprobes,
+                refine_factor,
+                where,
+                columns=None,
+            )
+            hits = [
+                hits_from_rows(rerank_int8(vector, group.to_pylist(), limit))
+                for vector, group in zip(vectors, groups)
+            ]
+        elif mode == "vector":
+            groups = _vector_search_batch(table, vectors, limit, nprobes, refine_factor, where)
+            hits = [hits_from_arrow(group) for group in groups]
+        else:
+            candidates = limit if mode == "lexical" else max(20, limit)
+            with ThreadPoolExecutor(max_workers, thread_name_prefix="retrieve-batch") as executor:
+                lexical = list(
+                    executor.map(
+                        lambda query: lexical_search(table, query, candidates, where=where), queries
+                    )
+                )
+            if mode == "lexical":
+                hits = [hits_from_rows(rows) for rows in lexical]
+            else:
+                groups = _vector_search_batch(
+                    table, vectors, candidates, nprobes, refine_factor, where, with_row_id=True
+                )
+                hits = [
+                    hits_from_rows(reciprocal_rank_fusion([group.to_pylist(), rows])[:limit])
+                    for group, rows in zip(groups, lexical)
+                ]
+    if reranker is None:
+        return hits
+    return [reranker.rerank(query, found, num_results) for query, found in zip(queries, hits)]
+
+
+def make_reranker(name: Optional[str], latency_budget: Optional[float] = RERANK_LATENCY_BUDGET):
+    """Builds the reranker named in RERANKER ("lexical", "cross-encoder" or None)."""
+    if not name or name == "none":
+        return None
+    scorer = CrossEncoderScorer() if name == "cross-encoder" else LexicalScorer()
+    return Reranker(scorer, latency_budget=latency_budget)
+
+
+def sse_event(event: str, data) -> bytes:
+    """Encodes one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+class ChatService:
+    """Retrieval and answer streaming shared by all sessions.
+
+    Args:
+        collections: CollectionManager of the collections to search
+        client: Async OpenAI client for chat completions (one pooled client)
+        query_cache: Cache of retrieved context and first answers, or None
+        full_func: Full-size embedding function for int8 rerank tables, or None
+        packer: Fits context and history into a token budget, or None to send everything
+        reranker: Re-orders over-fetched candidates (see make_reranker), or None
+        model: Chat model
+        max_concurrent_chats: Answers streamed at the same time
+        max_concurrent_searches: Searches (threads) run at the same time
+        max_queue: Requests allowed to wait for a slot before 503s are returned
+        queue_timeout: Seconds a request may wait for a slot
+    """
+
+    def __init__(
+        self,
+        collections: CollectionManager,
+        client: AsyncOpenAI,
+        query_cache: Optional[QueryCache] = None,
+        full_func=None,
+        packer: Optional[ContextPacker] = None,
+        reranker: Optional[Reranker] = None,
+        model: str = "gpt-4o-mini",
+        max_concurrent_chats: int = 32,
+        max_concurrent_searches: int = 8,
+        max_queue: int = 256,
+        queue_timeout: float = 30.0,
+    ):
+        self.collections = collections
+        self.client = client
+        self.query_cache = query_cache
+        self.full_func = full_func
+        self.packer = packer
+        self.reranker = reranker
+        self.model = model
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.active_chats = 0
+        self.rejected = 0
+        self._chat_slots = asyncio.Semaphore(max_concurrent_chats)
+        self._search_slots = asyncio.Semaphore(max_concurrent_searches)
+        self._executor = ThreadPoolExecutor(max_concurrent_searches, thread_name_prefix="retrieve")
+
+    @asynccontextmanager
+    async def _slot(self, semaphore: asyncio.Semaphore, name: str):
+        """Waits in the queue for a free slot, or raises 503 when the queue is full or too slow."""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            metrics.count("requests_rejected")
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "1"}, text="queue full")
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            metrics.count("requests_rejected")
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "1"}, text="queue timeout")
+        finally:
+            self.waiting -= 1
+        metrics.observe(f"{name}_queue_seconds", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    async def _run(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def search(self, query: str, params: dict):
+        """Returns ``(hits, cache entry or None, cached)`` for a query.
+
+        ``params`` are the request's collection, mode, num_results and filters.
+        """
+        collection = params.get("collection") or DEFAULT_COLLECTION
+        mode = params.get("mode", "hybrid")
+        num_results = int(params.get("num_results", 5))
+        filters = params.get("filters") or {}
+        async with self._slot(self._search_slots, "search"):
+            try:
+                return await self._run(self._search, query, collection, mode, num_results, filters)
+            except CollectionNotFoundError as e:
+                raise web.HTTPNotFound(text=str(e.args[0]))
+
+    def _search(self, query: str, collection: str, mode: str, num_results: int, filters: dict):
+        # Runs in the thread pool: the cache lookup may embed the query and
+        # reading the table version touches storage
+        table = self.collections.open(collection)
+        # In deduplicated collections a file also matches rows its chunks were merged into
+        where = metadata_filter(
+            filters.get("filenames"),
+            filters.get("pages"),
+            include_duplicates=has_duplicate_columns(table),
+        )
+        if self.query_cache is None:
+            return self._retrieve(table, query, num_results, mode, where), None, False
+
+        scope = self.query_cache.scope(table, f"{mode}:{num_results}:{where or ''}")
+        entry, vector = self.query_cache.lookup(query, scope, semantic=mode != "lexical")
+        if entry is not None:
+            return entry.context, entry, True
+        start = time.perf_counter()
+        hits = self._retrieve(table, query, num_results, mode, where)
+        entry = self.query_cache.store(query, scope, hits, time.perf_counter() - start, vector=vector)
+        return hits, entry, False
+
+    async def search_batch(self, queries: List[str], params: dict) -> List[List[SearchHit]]:
+        """Returns one list of hits per query; ``params`` as for ``search``."""
+        collection = params.get("collection") or DEFAULT_COLLECTION
+        mode = params.get("mode", "hybrid")
+        num_results = int(params.get("num_results", 5))
+        filters = params.get("filters") or {}
+        async with self._slot(self._search_slots, "search"):
+            try:
+                return await self._run(
+                    self._search_batch, queries, collection, mode, num_results, filters
+                )
+            except CollectionNotFoundError as e:
+                raise web.HTTPNotFound(text=str(e.args[0]))
+
+    def _search_batch(
+        self, queries: List[str], collection: str, mode: str, num_results: int, filters: dict
+    ) -> List[List[SearchHit]]:
+        table = self.collections.open(collection)
+        where = metadata_filter(
+            filters.get("filenames"),
+            filters.get("pages"),
+            include_duplicates=has_duplicate_columns(table),
+        )
+        return retrieve_batch(
+            table,
+            queries,
+            num_results,
+            mode,
+            full_func=self.full_func,
+            reranker=self.reranker,
+            where=where,
+        )
+
+    def _retrieve(self, table, query: str, num_results: int, mode: str, where: Optional[str]):
+        return retrieve(
+            table,
+            query,
+            num_results,
+            mode,
+            full_func=self.full_func,
+            reranker=self.reranker,
+            where=where,
+        )
+
+    async def handle_retrieve(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        hits, _, cached = await self.search(body["query"], body)
+        return web.json_response({"hits": [asdict(hit) for hit in hits], "cached": cached})
+
+    async def handle_retrieve_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        queries = body["queries"]
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise web.HTTPRequestEntityTooLarge(
+                max_size=MAX_BATCH_QUERIES,
+                actual_size=len(queries),
+                text=f"at most {MAX_BATCH_QUERIES} queries per batch",
+            )
+        start = time.perf_counter()
+        hits = await self.search_batch(queries, body)
+        return web.json_response(
+            {
+                "results": [[asdict(hit) for hit in query_hits] for query_hits in hits],
+                "seconds": time.perf_counter() - start,
+            }
+        )
+
+    async def handle_collections(self, request: web.Request) -> web.Response:
+        names = await self._run(self.collections.list)
+        return web.json_response({"collections": names, "default": DEFAULT_COLLECTION})
+
+    async def handle_files(self, request: web.Request) -> web.Response:
+        try:
+            files = await self._run(self.collections.filenames, request.match_info["name"])
+        except CollectionNotFoundError as e:
+            raise web.HTTPNotFound(text=str(e.args[0]))
+        return web.json_response({"files": files})
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body["messages"]
+        query = next(m["content"] for m in reversed(messages) if m["role"] == "user")
+        # Cached answers only stand in for first questions; later ones depend on the chat history
+        first_question = len(messages) == 1
+        start = time.perf_counter()
+        hits, entry, cached = await self.search(query, body)
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        await response.write(
+            sse_event("context", {"hits": [asdict(hit) for hit in hits], "cached": cached})
+        )
+        try:
+            if CACHE_ANSWERS and first_question and entry is not None and entry.answer is not None:
+                await response.write(sse_event("token", {"text": entry.answer}))
+                await response.write(sse_event("done", {"answer_cached": True}))
+                self.query_cache.answer_reused(entry)
+                return response
+
+            async with self._slot(self._chat_slots, "chat"):
+                self.active_chats += 1
+                try:
+                    answer, done = await self._stream_answer(response, messages, hits, start)
+                finally:
+                    self.active_chats -= 1
+            if CACHE_ANSWERS and first_question and entry is not None:
+                self.query_cache.store_answer(entry, answer, done["seconds"])
+            await response.write(sse_event("done", done))
+        except web.HTTPServiceUnavailable as e:
+            await response.write(sse_event("error", {"message": e.text, "retry_after": 1}))
+        except ConnectionResetError:
+            # The client went away; nothing left to send
+            metrics.count("chat_disconnects")
+        except Exception as e:
+            metrics.count("chat_errors")
+            await response.write(sse_event("error", {"message": str(e)}))
+        return response
+
+    async def _stream_answer(self, response, messages, hits, start: float):
+        """Streams the answer as token events; returns the answer and the done payload."""
+        packing = {}
+        if self.packer is None:
+            system_prompt = SYSTEM_PROMPT.format(context=format_context(hits))
+            messages = [{"role": "system", "content": system_prompt}, *messages]
+        else:
+            # Tokenizing the context is CPU work; keep it off the event loop
+            packed = await self._run(self.packer.pack, hits, messages, SYSTEM_PROMPT)
+            messages = packed.messages
+            metrics.count("prompt_tokens_saved", packed.tokens_saved)
+            metrics.observe("packed_prompt_tokens", packed.prompt_tokens)
+            packing = {
+                "prompt_tokens": packed.prompt_tokens,
+                "tokens_saved": packed.tokens_saved,
+                "dropped_turns": packed.dropped_turns,
+                "duplicate_chunks": packed.duplicate_chunks,
+                "trimmed_chunks": packed.trimmed_chunks,
+                "dropped_chunks": packed.dropped_chunks,
+            }
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        parts, ttft, usage = [], None, None
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage.model_dump()
+                    metrics.count("chat_prompt_tokens", chunk.usage.prompt_tokens)
+                    metrics.count("chat_completion_tokens", chunk.usage.completion_tokens)
+                    metrics.observe("chat_tokens_per_turn", chunk.usage.total_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        metrics.observe("chat_ttft_seconds", ttft)
+                    parts.append(text)
+                    await response.write(sse_event("token", {"text": text}))
+        finally:
+            await stream.close()
+        seconds = time.perf_counter() - start
+        metrics.observe("chat_turn_seconds", seconds)
+        metrics.count("chat_turns")
+        return "".join(parts), {"ttft": ttft, "seconds": seconds, "usage": usage, "packing": packing}
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        stats = {
+            "active_chats": self.active_chats,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "counters": dict(metrics.counters),
+            "percentiles": {
+                name: metrics.percentiles(name)
+                for name in ("search_seconds", "chat_ttft_seconds", "chat_turn_seconds")
+            },
+        }
+        if self.query_cache is not None:
+            cache = self.query_cache.stats
+            stats["cache"] = {**asdict(cache), "hit_rate": cache.hit_rate}
+        return web.json_response(stats)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.to_prometheus(), content_type="text/plain")
+
+    async def close(self, app=None) -> None:
+        await self.client.close()
+        self._executor.shutdown(wait=False)
+
+
+def create_app(service: ChatService) -> web.Application:
+    app = web.Application()
+    app.add_routes(
+        [
+            web.post("/retrieve", service.handle_retrieve),
+            web.post("/retrieve/batch", service.handle_retrieve_batch),
+            web.post("/chat", service.handle_chat),
+            web.get("/collections", service.handle_collections),
+            web.get("/collections/{name}/files", service.handle_files),
+            web.get("/stats", service.handle_stats),
+            web.get("/metrics", service.handle_metrics),
+        ]
+    )
+    app.on_cleanup.append(service.close)
+    return app
+
+
+def main():
+    import lancedb
+    from dotenv import load_dotenv
+    from lancedb.embeddings import get_registry
+
+    from utils.embedding_cache import CachedOpenAIEmbeddings  # noqa: F401 (registers "openai-cached")
+    from utils.tokenizer import OpenAICompatibleTokenizerWrapper
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", default="data/lancedb")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--reranker", default=RERANKER, choices=["lexical", "cross-encoder", "none"])
+    parser.add_argument("--rerank-latency-budget", type=float, default=RERANK_LATENCY_BUDGET)
+    parser.add_argument("--prompt-token-budget", type=int, default=PROMPT_TOKEN_BUDGET)
+    parser.add_argument("--max-concurrent-chats", type=int, default=32)
+    parser.add_argument("--max-concurrent-searches", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--queue-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+    metrics.configure("data/metrics/chat_service.jsonl")
+
+    db = lancedb.connect(args.db, read_consistency_interval=READ_CONSISTENCY_INTERVAL)
+    full_func = get_registry().get("openai-cached").create(name="text-embedding-3-large")
+
+    async def build() -> web.Application:
+        # The client is created inside the running loop so its connection pool belongs to it
+        service = ChatService(
+            CollectionManager(db),
+            AsyncOpenAI(),
+            QueryCache(
+                embed=lambda query: full_func.compute_query_embeddings(query)[0],
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                embed_timeout=VECTOR_TIMEOUT,
+            ),
+            full_func=full_func,
+            reranker=make_reranker(args.reranker, args.rerank_latency_budget),
+            packer=ContextPacker(
+                OpenAICompatibleTokenizerWrapper(),
+                budget=args.prompt_token_budget,
+                context_share=CONTEXT_SHARE,
+                max_chunk_tokens=MAX_CHUNK_TOKENS,
+            ),
+            model=args.model,
+            max_concurrent_chats=args.max_concurrent_chats,
+            max_concurrent_searches=args.max_concurrent_searches,
+            max_queue=args.max_queue,
+            queue_timeout=args.queue_timeout,
+        )
+        return create_app(service)
+
+    web.run_app(build(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
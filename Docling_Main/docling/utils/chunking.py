@@ -0,0 +1,38 @@
+from typing import List, Optional, Union
+
+from docling.chunking import HybridChunker
+
+
+class FastHybridChunker(HybridChunker):
+    """HybridChunker that measures text with the tokenizer's count-only fast path.
+
+    HybridChunker counts tokens with ``len(tokenizer.tokenize(text))``, which
+    for OpenAICompatibleTokenizerWrapper builds a list of token strings on
+    every call, and it re-measures overlapping spans many times while merging
+    peers. When the tokenizer offers ``count_tokens`` (memoized, no string
+    allocation) it is used instead; any other tokenizer falls back to the
+    default behaviour.
+    """
+
+    def _counting_tokenizer(self):
+        # Not ``or``: PreTrainedTokenizerBase.__len__ raises for the tiktoken wrapper
+        tokenizer = getattr(self, "_tokenizer", None)
+        if tokenizer is None:
+            tokenizer = self.tokenizer
+        return tokenizer if hasattr(tokenizer, "count_tokens") else None
+
+    def _count_text_tokens(self, text: Optional[Union[str, List[str]]]):
+        tokenizer = self._counting_tokenizer()
+        if tokenizer is None:
+            return super()._count_text_tokens(text)
+        if text is None:
+            return 0
+        if isinstance(text, list):
+            return sum(tokenizer.count_tokens_batch(text))
+        return tokenizer.count_tokens(text)
+
+    def _count_chunk_tokens(self, doc_chunk):
+        tokenizer = self._counting_tokenizer()
+        if tokenizer is None:
+            return super()._count_chunk_tokens(doc_chunk=doc_chunk)
+        return tokenizer.count_tokens(self.serialize(chunk=doc_chunk))
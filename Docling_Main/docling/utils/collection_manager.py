@@ -0,0 +1,135 @@
+import re
+import threading
+from typing import Dict, List, Sequence
+
+import pyarrow.compute as pc
+
+DEFAULT_COLLECTION = "docling"
+COLLECTION_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+MANIFEST_SUFFIX = "_sources"
+# Columns searches are filtered on; BTREE indexes let a filtered search read only matching rows
+SCALAR_INDEX_COLUMNS = ("metadata.filename", "metadata.source")
+
+
+class CollectionNotFoundError(KeyError):
+    pass
+
+
+def validate_collection_name(name: str) -> str:
+    if not COLLECTION_NAME_RE.match(name) or name.endswith(MANIFEST_SUFFIX):
+        raise ValueError(
+            f"Invalid collection name {name!r}: use letters, digits, '_' and '-' "
+            f"(at most 64, not ending in {MANIFEST_SUFFIX!r})"
+        )
+    return name
+
+
+class CollectionManager:
+    """Collections of documents (e.g. one per customer), each in its own LanceDB table.
+
+    A collection is a chunk table named after it plus its ``<name>_sources``
+    manifest (see open_source_manifest), so every collection is ingested,
+    indexed, searched and dropped independently and a search never reads
+    another collection's rows. Opened tables are kept for reuse.
+
+    Args:
+        db: LanceDB connection
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._tables: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def list(self) -> List[str]:
+        """Names of all collections, sorted."""
+        names = set(self.db.table_names())
+        return sorted(
+            name
+            for name in names
+            if not (name.endswith(MANIFEST_SUFFIX) and name[: -len(MANIFEST_SUFFIX)] in names)
+        )
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.db.table_names()
+
+    def create(self, name: str, schema, rebuild: bool = False):
+        """Opens the collection's table, creating it (or recreating it with ``rebuild``) first."""
+        validate_collection_name(name)
+        with self._lock:
+            if rebuild or name not in self.db.table_names():
+                table = self.db.create_table(name, schema=schema, mode="overwrite")
+            else:
+                table = self.db.open_table(name)
+            self._tables[name] = table
+        return table
+
+    def open(self, name: str):
+        """Returns the collection's table; raises CollectionNotFoundError if there is none."""
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                if name not in self.db.table_names():
+                    raise CollectionNotFoundError(
+                        f"No collection {name!r}; available: {', '.join(self.list()) or 'none'}"
+                    )
+                table = self._tables[name] = self.db.open_table(name)
+        return table
+
+    def manifest(self, name: str, rebuild: bool = False):
+        """The collection's source manifest table."""
+        # Imported here so searching collections does not need docling installed
+        from utils.ingestion import open_source_manifest
+
+        return open_source_manifest(self.db, name, rebuild=rebuild)
+
+    def drop(self, name: str) -> None:
+        """Deletes the collection's table and manifest."""
+        with self._lock:
+            self._tables.pop(name, None)
+            self.db.drop_table(name, ignore_missing=True)
+            self.db.drop_table(f"{name}{MANIFEST_SUFFIX}", ignore_missing=True)
+
+    def filenames(self, name: str) -> List[str]:
+        """Distinct ``metadata.filename`` values of a collection (for filter pickers)."""
+        table = self.open(name)
+        column = (
+            table.search()
+            .select({"filename": "metadata.filename"})
+            .limit(None)
+            .to_arrow()
+            .column("filename")
+        )
+        return sorted(v for v in pc.unique(column).to_pylist() if v is not None)
+
+
+def ensure_scalar_indexes(table, columns: Sequence[str] = SCALAR_INDEX_COLUMNS) -> Dict[str, str]:
+    """Creates BTREE indexes on the metadata columns searches are filtered on.
+
+    Filters on indexed columns are resolved from the index, so a search
+    pre-filtered to a few files stays fast however large the table grows.
+    Rows added after an index was built are folded in with ``table.optimize()``.
+    Page ranges (``array_min`` / ``array_max`` of ``metadata.page_numbers``)
+    are checked on the rows left after the indexed filters.
+
+    Returns:
+        Column -> "created", "optimized" or "up to date"
+    """
+    indexes = {
+        column: index.name
+        for index in table.list_indices()
+        for column in index.columns
+        if getattr(index, "index_type", None) == "BTree"
+    }
+    actions = {}
+    for column in columns:
+        if column not in indexes:
+            table.create_scalar_index(column, index_type="BTREE")
+            actions[column] = "created"
+        elif table.index_stats(indexes[column]).num_unindexed_rows:
+            actions[column] = "optimized"
+        else:
+            actions[column] = "up to date"
+    if "optimized" in actions.values():
+        table.optimize()
+    return actions
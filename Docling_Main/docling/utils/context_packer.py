@@ -0,0 +1,205 @@
+import re
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence, Set
+
+from utils.retrieval import SearchHit, format_context
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+WORD_RE = re.compile(r"\w+")
+PASSAGE_RE = re.compile(r"\n\s*\n|(?<=[.!?])\s+(?=[A-Z0-9])")
+
+
+@dataclass
+class PackedPrompt:
+    """Messages fitted into the token budget, with what packing left out."""
+
+    messages: List[dict]
+    hits: List[SearchHit]
+    prompt_tokens: int
+    unpacked_tokens: int
+    dropped_turns: int = 0
+    duplicate_chunks: int = 0
+    trimmed_chunks: int = 0
+    dropped_chunks: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.unpacked_tokens - self.prompt_tokens)
+
+
+class ContextPacker:
+    """Fits retrieved chunks and chat history into a prompt token budget.
+
+    For every turn:
+
+    - chunks that repeat a better-ranked chunk (``duplicate_overlap`` of
+      their word shingles already seen) are dropped
+    - chunks longer than ``max_chunk_tokens`` are trimmed to their passages
+      (paragraphs, then sentences) sharing the most words with the question
+    - chunks are added best first until ``context_share`` of the budget is
+      used; the last one that does not fit is cut to what is left
+    - the history is kept newest first in what remains; older turns that no
+      longer fit are replaced by a one-line note of the questions asked
+
+    Tokens are counted with the tiktoken encoding of ``tokenizer`` (an
+    ``OpenAICompatibleTokenizerWrapper``), whose counts are memoized.
+
+    Args:
+        tokenizer: OpenAICompatibleTokenizerWrapper (or anything with
+            ``count_tokens`` and a tiktoken ``tokenizer``)
+        budget: Prompt tokens per turn (system prompt, context and history)
+        context_share: Part of the budget the retrieved context may take
+        max_chunk_tokens: Longer chunks are trimmed to their most relevant passages
+        duplicate_overlap: Shingle overlap from which a chunk counts as a duplicate
+        summarize_history: Replace dropped turns with a note of their questions
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        budget: int = 6000,
+        context_share: float = 0.6,
+        max_chunk_tokens: int = 800,
+        duplicate_overlap: float = 0.8,
+        summarize_history: bool = True,
+    ):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.context_share = context_share
+        self.max_chunk_tokens = max_chunk_tokens
+        self.duplicate_overlap = duplicate_overlap
+        self.summarize_history = summarize_history
+
+    def count(self, text: str) -> int:
+        return self.tokenizer.count_tokens(text)
+
+    def count_messages(self, messages: Sequence[dict]) -> int:
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cuts ``text`` to about ``max_tokens`` tokens, ellipsis included."""
+        ids = self.tokenizer.tokenizer.encode_ordinary(text)
+        if len(ids) <= max_tokens:
+            return text
+        return self.tokenizer.tokenizer.decode(ids[: max(0, max_tokens - 2)]) + " …"
+
+    def pack(self, hits: Sequence[SearchHit], messages: Sequence[dict], system_prompt: str) -> PackedPrompt:
+        """Builds the messages for one chat turn.
+
+        Args:
+            hits: Retrieved chunks, best first
+            messages: Chat history, ending with the new question
+            system_prompt: Template with a ``{context}`` placeholder
+
+        Returns:
+            PackedPrompt with the messages to send (system message first)
+        """
+        question = messages[-1]["content"]
+        unpacked_tokens = self.count(system_prompt.format(context=format_context(hits)))
+        unpacked_tokens += MESSAGE_OVERHEAD_TOKENS + self.count_messages(messages)
+
+        fixed = (
+            self.count(system_prompt.format(context=""))
+            + MESSAGE_OVERHEAD_TOKENS
+            + self.count_messages(messages[-1:])
+        )
+        context_budget = min(int(self.budget * self.context_share), self.budget - fixed)
+        packed = PackedPrompt([], [], 0, unpacked_tokens)
+        packed.hits = self._pack_hits(hits, question, context_budget, packed)
+
+        system = {"role": "system", "content": system_prompt.format(context=format_context(packed.hits))}
+        history_budget = self.budget - self.count_messages([system]) - self.count_messages(messages[-1:])
+        history = self._pack_history(list(messages[:-1]), history_budget, packed)
+        packed.messages = [system, *history, messages[-1]]
+        packed.prompt_tokens = self.count_messages(packed.messages)
+        return packed
+
+    def _pack_hits(
+        self, hits: Sequence[SearchHit], question: str, budget: int, packed: PackedPrompt
+    ) -> List[SearchHit]:
+        kept: List[SearchHit] = []
+        seen: Set[tuple] = set()
+        used = 0
+        for index, hit in enumerate(hits):
+            shingles = _shingles(hit.text)
+            if shingles and len(shingles & seen) >= self.duplicate_overlap * len(shingles):
+                packed.duplicate_chunks += 1
+                continue
+
+            text = hit.text
+            if self.count(text) > self.max_chunk_tokens:
+                text = self._relevant_passages(text, question, self.max_chunk_tokens)
+                packed.trimmed_chunks += 1
+            hit = replace(hit, text=text)
+            # Separator and source lines count too
+            tokens = self.count(hit.to_context()) + 2
+            if used + tokens > budget:
+                remaining = budget - used - (tokens - self.count(text))
+                if remaining < 50:
+                    packed.dropped_chunks = len(hits) - index
+                    break
+                hit = replace(hit, text=self.truncate(text, remaining))
+                packed.trimmed_chunks += 1
+                tokens = self.count(hit.to_context()) + 2
+            kept.append(hit)
+            seen |= shingles
+            used += tokens
+        return kept
+
+    def _relevant_passages(self, text: str, question: str, max_tokens: int) -> str:
+        """Keeps the passages sharing most words with the question, in document order."""
+        passages = [p.strip() for p in PASSAGE_RE.split(text) if p.strip()]
+        terms = {w.lower() for w in WORD_RE.findall(question)}
+        ranked = sorted(
+            range(len(passages)),
+            key=lambda i: -len(terms & {w.lower() for w in WORD_RE.findall(passages[i])}),
+        )
+        chosen, used = set(), 0
+        for i in ranked:
+            tokens = self.count(passages[i])
+            if used + tokens <= max_tokens:
+                chosen.add(i)
+                used += tokens
+        if not chosen:
+            return self.truncate(passages[ranked[0]] if passages else text, max_tokens)
+        return " … ".join(passages[i] for i in sorted(chosen))
+
+    def _pack_history(self, history: List[dict], budget: int, packed: PackedPrompt) -> List[dict]:
+        kept: List[dict] = []
+        used = 0
+        # Newest first; a reply is only kept with the question it answers
+        i = len(history)
+        while i > 0:
+            start = i - 2 if i >= 2 and history[i - 2]["role"] == "user" else i - 1
+            turn = history[start:i]
+            tokens = self.count_messages(turn)
+            if used + tokens > budget:
+                break
+            kept[:0] = turn
+            used += tokens
+            i = start
+
+        dropped = history[:i]
+        packed.dropped_turns = sum(m["role"] == "user" for m in dropped)
+        if dropped and self.summarize_history:
+            note = self._history_note(dropped, budget - used)
+            if note is not None:
+                kept.insert(0, note)
+        return kept
+
+    def _history_note(self, dropped: List[dict], budget: int) -> Optional[dict]:
+        questions = [m["content"] for m in dropped if m["role"] == "user"]
+        if not questions or budget <= MESSAGE_OVERHEAD_TOKENS + 20:
+            return None
+        note = "Earlier in this conversation the user asked: " + "; ".join(
+            self.truncate(q, 40) for q in questions
+        )
+        return {"role": "system", "content": self.truncate(note, budget - MESSAGE_OVERHEAD_TOKENS)}
+
+
+def _shingles(text: str, size: int = 5) -> Set[tuple]:
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
@@ -0,0 +1,101 @@
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+from typing import Optional
+
+from docling_core.types.doc import DoclingDocument
+
+from utils.ingestion import hash_text, source_hash, source_stream
+from utils.metrics import metrics
+
+
+def converter_options_key(converter) -> str:
+    """Returns a short key identifying a DocumentConverter's configuration.
+
+    Covers the pipeline, backend and pipeline options of every input format
+    plus the docling version, so a store never hands out a document that
+    was converted with different settings.
+    """
+    options = {
+        str(input_format): {
+            "pipeline": option.pipeline_cls.__name__,
+            "backend": option.backend.__name__,
+            "options": (
+                option.pipeline_options.model_dump(mode="json")
+                if option.pipeline_options is not None
+                else None
+            ),
+        }
+        for input_format, option in converter.format_to_options.items()
+    }
+    try:
+        options["docling"] = version("docling")
+    except PackageNotFoundError:
+        pass
+    return hash_text(json.dumps(options, sort_keys=True, default=str))[:16]
+
+
+class DocumentStore:
+    """Persistent store of converted DoclingDocuments.
+
+    Each document is saved as its ``export_to_dict()`` JSON under
+    ``<root>/<options_key>/<source_hash>.json``, so it is reused for as long
+    as the source bytes and the converter configuration stay the same. Use it
+    to try other chunking settings without converting again: documents are
+    only deserialized when they are asked for, one at a time.
+
+    Args:
+        root: Directory holding the store
+        options_key: Converter configuration the documents belong to (see converter_options_key)
+    """
+
+    def __init__(self, root: str = "data/documents", options_key: str = "default"):
+        self.directory = os.path.join(root, options_key)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}.json")
+
+    def __contains__(self, content_hash: str) -> bool:
+        return os.path.exists(self.path(content_hash))
+
+    def load(self, content_hash: str) -> DoclingDocument:
+        with open(self.path(content_hash), encoding="utf-8") as f:
+            return DoclingDocument.model_validate_json(f.read())
+
+    def save(self, content_hash: str, document: DoclingDocument) -> str:
+        path = self.path(content_hash)
+        # Write to a temporary file first so a crash never leaves half a document behind
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(document.export_to_dict(), f)
+        os.replace(tmp, path)
+        return path
+
+    def convert(
+        self,
+        source: str,
+        converter,
+        fetch_cache=None,
+        content_hash: Optional[str] = None,
+    ) -> DoclingDocument:
+        """Returns the converted document of a source, converting and storing it only if needed.
+
+        Args:
+            source: Local path or URL of the document
+            converter: DocumentConverter matching the store's options key
+            fetch_cache: FetchCache serving remote sources (see utils/fetch_cache.py)
+            content_hash: Hash of the source bytes, if already known
+        """
+        content_hash = content_hash or source_hash(source, fetch_cache)
+        if content_hash in self:
+            with metrics.span("document_load", source=source):
+                document = self.load(content_hash)
+            metrics.count("documents_loaded")
+            return document
+
+        with metrics.span("convert", source=source):
+            document = converter.convert(source_stream(source, fetch_cache)).document
+        metrics.count("documents_converted")
+        self.save(content_hash, document)
+        return document
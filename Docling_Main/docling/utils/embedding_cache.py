@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from lancedb.embeddings import register
+from lancedb.embeddings.openai import OpenAIEmbeddings
+
+DEFAULT_CACHE_PATH = "data/embedding_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+class EmbeddingCache:
+    """Disk-backed embedding cache keyed by (model, text hash) with LRU eviction.
+
+    Vectors are stored as float32 blobs in SQLite. Every lookup refreshes the
+    entry's ``last_used`` timestamp, and once the cache grows past
+    ``max_entries`` the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """Open (or create) the cache.
+
+        Args:
+            path: Location of the SQLite database file
+            max_entries: Maximum number of vectors kept before evicting
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Look up the vectors of several texts.
+
+        Returns:
+            One vector per text, or None where the text is not cached
+        """
+        keys = [self.key(model, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        """Store (text, vector) pairs and evict the oldest entries if over capacity."""
+        now = time.time()
+        rows = [
+            (self.key(model, text), array("f", vector).tobytes(), now)
+            for text, vector in items
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+                )""",
+                (overflow,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+_caches: Dict[Tuple[str, int], EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(
+    path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES
+) -> EmbeddingCache:
+    """Returns a process-wide cache instance for the given path."""
+    with _caches_lock:
+        if (path, max_entries) not in _caches:
+            _caches[(path, max_entries)] = EmbeddingCache(path, max_entries)
+        return _caches[(path, max_entries)]
+
+
+def cached_embed(
+    cache: EmbeddingCache, model: str, texts: Sequence[str], embed
+) -> List[Optional[List[float]]]:
+    """Embeds texts through the cache, calling ``embed`` only for unseen texts.
+
+    Duplicate texts within one call are embedded once.
+
+    Args:
+        cache: Cache to read from and write to
+        model: Cache namespace, typically the model name and dimensions
+        texts: Texts to embed
+        embed: Function mapping a list of texts to a list of vectors
+
+    Returns:
+        One vector per input text (None where the embedding API returned none)
+    """
+    texts = [str(text) for text in texts]
+    vectors = cache.get_many(model, texts)
+
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None and t))
+    if missing:
+        fresh = dict(zip(missing, embed(missing)))
+        cache.put_many(model, [(t, v) for t, v in fresh.items() if v is not None])
+        vectors = [
+            v if v is not None else fresh.get(t) for t, v in zip(texts, vectors)
+        ]
+
+    return vectors
+
+
+@register("openai-cached")
+class CachedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAI embedding function that checks the on-disk embedding cache first.
+
+    Registered as ``"openai-cached"`` so tables created with it also use the
+    cache for query embeddings in ``table.search(query)``. Import this module
+    before opening such a table.
+    """
+
+    cache_path: str = DEFAULT_CACHE_PATH
+    cache_max_entries: int = DEFAULT_MAX_ENTRIES
+
+    def generate_embeddings(self, texts) -> List[Optional[List[float]]]:
+        cache = get_embedding_cache(self.cache_path, self.cache_max_entries)
+        model = f"{self.name}:{self.dim or 'default'}"
+        return cached_embed(cache, model, texts, super().generate_embeddings)
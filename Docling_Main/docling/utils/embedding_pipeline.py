@@ -0,0 +1,317 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, fields
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.metrics import metrics
+from utils.vector_storage import VECTOR_COLUMNS
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "RateLimitError"}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts and server errors are worth retrying, anything else is not."""
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Reads the server's Retry-After hint (in seconds) from an API error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def token_budgeted_batches(
+    rows: Iterable,
+    count_tokens: Callable[[str], int],
+    max_batch_tokens: int,
+    max_batch_size: int,
+    text_of: Callable[[object], str] = lambda row: row["text"],
+) -> Iterator[Tuple[list, int]]:
+    """Packs rows into batches that stay under a token and an input-count budget.
+
+    A single row larger than ``max_batch_tokens`` gets a batch of its own.
+    Rows are dicts with a ``text`` key unless ``text_of`` says otherwise.
+
+    Yields:
+        Tuples of (rows in the batch, total tokens in the batch)
+    """
+    batch: list = []
+    batch_tokens = 0
+    for row in rows:
+        tokens = count_tokens(text_of(row))
+        if batch and (
+            batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size
+        ):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(row)
+        batch_tokens += tokens
+
+    if batch:
+        yield batch, batch_tokens
+
+
+class TokenRateLimiter:
+    """Token bucket enforcing a tokens-per-minute limit across concurrent tasks.
+
+    The bucket keeps its state between event loops, so one limiter can be
+    shared by successive ``asyncio.run`` calls.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    async def acquire(self, tokens: int) -> None:
+        """Waits until ``tokens`` can be spent without exceeding the limit."""
+        tokens = min(tokens, self.capacity)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(
+                    self.capacity, self.available + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                await asyncio.sleep((tokens - self.available) / self.rate)
+
+
+@dataclass
+class EmbeddingReport:
+    """Counters collected while embedding and writing one set of rows."""
+
+    rows_written: int = 0
+    embedded: int = 0
+    tokens: int = 0
+    batches: int = 0
+    commits: int = 0
+    retries: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    # Near-duplicate chunks left out (see utils/near_duplicates.py) and what they would have cost
+    duplicates: int = 0
+    embeddings_saved: int = 0
+    tokens_saved: int = 0
+    bytes_saved: int = 0
+
+    def add(self, other: "EmbeddingReport") -> None:
+        """Accumulates the counters of another report into this one."""
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+
+class EmbeddingPipelineError(RuntimeError):
+    """Raised when some batches could not be embedded; the rest were still written."""
+
+    def __init__(self, message: str, report: EmbeddingReport):
+        super().__init__(message)
+        self.report = report
+
+
+class EmbeddingPipeline:
+    """Embeds chunk rows in token-budgeted batches, concurrently, and streams them into a table.
+
+    Rows whose chunk was embedded before reuse its stored vector. The rest are
+    packed into batches of at most ``max_batch_tokens`` tokens (counted with
+    the tokenizer) and ``max_batch_size`` inputs, and up to ``concurrency``
+    batches are embedded at once while a token bucket keeps the request rate
+    under ``tokens_per_minute``. Rate limits and transient errors are retried
+    with exponential backoff. Embedded rows are committed to the table every
+    ``commit_every`` rows, so a failure part-way through keeps earlier work.
+    """
+
+    def __init__(
+        self,
+        func,
+        tokenizer,
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 2048,
+        concurrency: int = 4,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        commit_every: int = 1000,
+        storage=None,
+    ):
+        """Configure the pipeline.
+
+        Args:
+            func: LanceDB embedding function (e.g. the table's "openai-cached" function)
+            tokenizer: Tokenizer used to count tokens per chunk, e.g. OpenAICompatibleTokenizerWrapper
+            max_batch_tokens: Token budget of a single embedding request
+            max_batch_size: Maximum number of inputs in a single embedding request
+            concurrency: Number of embedding requests in flight at once
+            tokens_per_minute: Token rate limit of the API key, or None for no limit
+            max_retries: Retries per batch on rate limits and transient errors
+            base_backoff: First retry delay in seconds, doubled on every attempt
+            max_backoff: Upper bound of the retry delay in seconds
+            commit_every: Number of embedded rows buffered before writing them to the table
+            storage: Optional VectorStorage converting each full-size embedding into
+                the stored columns (shortened vector, int8 rerank codes)
+        """
+        self.func = func
+        self.tokenizer = tokenizer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.commit_every = commit_every
+        self.storage = storage
+        self.limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+
+    def count_tokens(self, text: str) -> int:
+        if hasattr(self.tokenizer, "count_tokens"):
+            return self.tokenizer.count_tokens(text)
+        return len(self.tokenizer.tokenize(text))
+
+    async def _embed_with_retry(self, texts: List[str], report: EmbeddingReport):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.to_thread(self.func.compute_source_embeddings, texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e) or min(
+                    self.max_backoff, self.base_backoff * 2**attempt
+                ) * random.uniform(0.5, 1.0)
+                report.retries += 1
+                metrics.count("embedding_retries")
+                await asyncio.sleep(delay)
+
+    async def _embed_texts(
+        self, texts: List[str], report: EmbeddingReport
+    ) -> Tuple[List[Optional[Sequence[float]]], List[BaseException]]:
+        """Embeds texts in token-budgeted batches, ``concurrency`` requests at a time.
+
+        Returns:
+            Tuple of (one vector per text, None where it failed; exceptions of failed batches)
+        """
+        vectors: List[Optional[Sequence[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed_batch(indices: List[int], tokens: int) -> None:
+            async with semaphore:
+                if self.limiter:
+                    await self.limiter.acquire(tokens)
+                with metrics.span("embed_request", rows=len(indices), tokens=tokens):
+                    batch_vectors = await self._embed_with_retry(
+                        [texts[i] for i in indices], report
+                    )
+
+            report.batches += 1
+            report.tokens += tokens
+            metrics.count("tokens_embedded", tokens)
+            for i, vector in zip(indices, batch_vectors):
+                vectors[i] = vector
+            failed = sum(vector is None for vector in batch_vectors)
+            report.embedded += len(indices) - failed
+            report.failed += failed
+            metrics.count("rows_embedded", len(indices) - failed)
+            if failed:
+                metrics.count("embedding_failures", failed)
+
+        tasks = [
+            embed_batch(indices, tokens)
+            for indices, tokens in token_budgeted_batches(
+                range(len(texts)),
+                self.count_tokens,
+                self.max_batch_tokens,
+                self.max_batch_size,
+                text_of=texts.__getitem__,
+            )
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return vectors, [result for result in results if isinstance(result, BaseException)]
+
+    async def aembed_and_write_columns(
+        self, table, columns, known_vectors: Optional[Dict[str, dict]] = None
+    ) -> EmbeddingReport:
+        """Embeds and writes a batch of chunk rows held as columns (see utils/arrow_records.py).
+
+        Rows whose chunk hash is in ``known_vectors`` reuse those stored vector
+        columns; the others are embedded, encoded for the storage mode as one
+        matrix, and everything is written as Arrow tables of at most
+        ``commit_every`` rows. Rows whose embedding failed are left out.
+
+        Args:
+            table: LanceDB table to write to
+            columns: ChunkColumns holding the batch
+            known_vectors: Stored vector columns by chunk hash, from load_chunk_vectors
+
+        Returns:
+            EmbeddingReport with counters for the batch
+
+        Raises:
+            EmbeddingPipelineError: If any embedding request failed after all retries.
+                The other rows have been written by then.
+        """
+        start = time.perf_counter()
+        report = EmbeddingReport()
+        known_vectors = known_vectors or {}
+        stored = {
+            name: [None] * len(columns) for name in VECTOR_COLUMNS if name in table.schema.names
+        }
+
+        missing = []
+        for i, chunk_hash in enumerate(columns.chunk_hashes):
+            known = known_vectors.get(chunk_hash)
+            if known is None:
+                missing.append(i)
+                continue
+            for name, values in stored.items():
+                values[i] = known[name]
+
+        vectors, errors = await self._embed_texts([columns.text[i] for i in missing], report)
+        embedded = [(i, vector) for i, vector in zip(missing, vectors) if vector is not None]
+        if embedded:
+            matrix = np.asarray([vector for _, vector in embedded], dtype=np.float32)
+            encoded = self.storage.encode_batch(matrix) if self.storage else {"vector": matrix}
+            for name, values in stored.items():
+                for (i, _), value in zip(embedded, encoded[name]):
+                    values[i] = value
+
+        keep = [i for i, vector in enumerate(stored["vector"]) if vector is not None]
+        data = columns.to_arrow(table.schema, stored, keep)
+        for offset in range(0, data.num_rows, self.commit_every):
+            batch = data.slice(offset, self.commit_every)
+            with metrics.span("table_add", rows=batch.num_rows):
+                await asyncio.to_thread(table.add, batch)
+            report.rows_written += batch.num_rows
+            report.commits += 1
+        report.seconds = time.perf_counter() - start
+
+        if errors:
+            raise EmbeddingPipelineError(
+                f"{len(errors)} embedding batches failed: {errors[0]}", report
+            ) from errors[0]
+        return report
+
+    def embed_and_write_columns(
+        self, table, columns, known_vectors: Optional[Dict[str, dict]] = None
+    ) -> EmbeddingReport:
+        """Synchronous wrapper around aembed_and_write_columns for use in scripts."""
+        return asyncio.run(self.aembed_and_write_columns(table, columns, known_vectors))
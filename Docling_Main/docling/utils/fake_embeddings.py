@@ -0,0 +1,83 @@
+import hashlib
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+from lancedb.embeddings import TextEmbeddingFunction, register
+from pydantic import PrivateAttr
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class FakeRateLimitError(Exception):
+    """Raised by FakeEmbeddings when its simulated tokens-per-minute limit is hit."""
+
+    status_code = 429
+
+
+@lru_cache(maxsize=100_000)
+def _word_vector(word: str, ndim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(ndim).astype(np.float32)
+
+
+def fake_embed(text: str, ndim: int) -> np.ndarray:
+    """Deterministic bag-of-words embedding: the normalised sum of one random vector per word.
+
+    Texts sharing words get similar vectors, so retrieval on it behaves
+    roughly like a real (if weak) embedding model, entirely offline.
+    """
+    vector = np.zeros(ndim, dtype=np.float32)
+    for word in WORD_PATTERN.findall(text.lower()):
+        vector += _word_vector(word, ndim)
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@register("fake-embeddings")
+class FakeEmbeddings(TextEmbeddingFunction):
+    """Offline stand-in for the OpenAI embedding function.
+
+    Produces deterministic vectors without any network access, optionally
+    sleeping ``latency`` seconds per call and raising FakeRateLimitError
+    (status code 429) once more than ``tokens_per_minute`` words were embedded
+    within the last minute, so batching, retries and rate limiting can be
+    exercised locally.
+    """
+
+    ndim: int = 256
+    latency: float = 0.0
+    tokens_per_minute: Optional[int] = None
+
+    _window: deque = PrivateAttr(default_factory=deque)
+    _calls: int = PrivateAttr(default=0)
+
+    def ndims(self) -> int:
+        return self.ndim
+
+    @property
+    def calls(self) -> int:
+        """Number of generate_embeddings calls made so far."""
+        return self._calls
+
+    def generate_embeddings(self, texts) -> List[np.ndarray]:
+        self._calls += 1
+        texts = [str(text) for text in texts]
+
+        if self.tokens_per_minute:
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] > 60:
+                self._window.popleft()
+            tokens = sum(len(WORD_PATTERN.findall(text)) for text in texts)
+            if sum(t for _, t in self._window) + tokens > self.tokens_per_minute:
+                raise FakeRateLimitError("Rate limit reached for fake embeddings")
+            self._window.append((now, tokens))
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        return [fake_embed(text, self.ndim) for text in texts]
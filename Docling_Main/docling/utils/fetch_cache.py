@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from docling.datamodel.base_models import DocumentStream
+
+from utils.ingestion import hash_bytes, hash_text, to_document_stream
+
+
+@dataclass
+class FetchResult:
+    """A remote document as held in the download cache."""
+
+    url: str
+    path: str
+    content_hash: str
+    content_type: Optional[str]
+    # HTTP status of this fetch: 200, 304, or None if it was already revalidated in this run
+    status: Optional[int]
+    # Whether the bytes differ from the previously cached ones (always True on first download)
+    changed: bool
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def stream(self) -> DocumentStream:
+        """Returns the bytes as a DocumentStream, so DocumentConverter does not download them."""
+        return to_document_stream(self.url, self.read(), self.content_type)
+
+
+class FetchCache:
+    """On-disk cache of remote documents, revalidated with conditional requests.
+
+    Every URL is stored as ``<cache_dir>/<sha256(url)>.bin`` next to a
+    ``.json`` file holding its ETag, Last-Modified, content type and content
+    hash. Fetching a cached URL sends ``If-None-Match`` / ``If-Modified-Since``,
+    so an unchanged document costs a 304 and no download, and its content hash
+    is known without reading the bytes. A URL is revalidated at most once per
+    FetchCache instance (i.e. once per run). Safe to use from several threads
+    or processes at once.
+
+    Args:
+        cache_dir: Directory holding the cached documents
+        timeout: Request timeout in seconds
+    """
+
+    def __init__(self, cache_dir: str = "data/download_cache", timeout: int = 30):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        # requests.Session is not thread-safe, so each thread pools its own connections
+        self._local = threading.local()
+        self._validated = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _paths(self, url: str):
+        stem = os.path.join(self.cache_dir, hash_text(url))
+        return stem + ".bin", stem + ".json"
+
+    def _load_meta(self, meta_path: str, data_path: str) -> Optional[dict]:
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(data_path) else None
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def fetch(self, url: str) -> FetchResult:
+        """Returns the cached copy of ``url``, downloading it only if it changed.
+
+        Raises:
+            requests.RequestException: If the request fails or returns an error status
+        """
+        with self._lock:
+            if url in self._validated:
+                return self._validated[url]
+
+        data_path, meta_path = self._paths(url)
+        meta = self._load_meta(meta_path, data_path)
+
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and meta:
+            result = FetchResult(
+                url, data_path, meta["content_hash"], meta.get("content_type"), 304, changed=False
+            )
+        else:
+            response.raise_for_status()
+            content_hash = hash_bytes(response.content)
+            changed = meta is None or meta["content_hash"] != content_hash
+            if changed:
+                self._write_atomic(data_path, response.content)
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_type": response.headers.get("Content-Type"),
+                "content_hash": content_hash,
+                "fetched_at": time.time(),
+            }
+            self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+            result = FetchResult(
+                url, data_path, content_hash, meta["content_type"], response.status_code, changed
+            )
+
+        with self._lock:
+            self._validated[url] = FetchResult(**{**result.__dict__, "status": None})
+        return result
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from utils.retrieval import FTS_RESULT_COLUMNS, VECTOR_RESULT_COLUMNS
+from utils.vector_index import vector_search
+
+# Runs the vector side of hybrid searches so a slow embedding call never blocks the lexical side
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vector-search")
+
+
+def fts_index_name(table, column: str = "text") -> Optional[str]:
+    """Returns the name of the full-text index on ``column``, or None if there is none."""
+    for index in table.list_indices():
+        if getattr(index, "index_type", None) == "FTS" and column in index.columns:
+            return index.name
+    return None
+
+
+def ensure_fts_index(table, column: str = "text") -> str:
+    """Creates the full-text (BM25) index over the text column, or folds new rows into it.
+
+    Rows written after the index was built are still searchable, just more
+    slowly, so ``table.optimize()`` is only called when there are some.
+
+    Returns:
+        "created", "optimized" or "up to date"
+    """
+    name = fts_index_name(table, column)
+    if name is None:
+        table.create_fts_index(column, replace=True)
+        return "created"
+
+    if table.index_stats(name).num_unindexed_rows:
+        table.optimize()
+        return "optimized"
+    return "up to date"
+
+
+def lexical_search(table, query: str, num_results: int, where: Optional[str] = None) -> List[dict]:
+    """BM25 search over the text column; needs no embedding call.
+
+    ``where`` is an SQL filter applied before ranking (see metadata_filter).
+    """
+    search = table.search(query, query_type="fts")
+    if where:
+        search = search.where(where, prefilter=True)
+    return (
+        search.select(FTS_RESULT_COLUMNS)
+        .limit(num_results)
+        .with_row_id(True)
+        .to_list()
+    )
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[dict]], k: int = 60) -> List[dict]:
+    """Fuses ranked result lists: each row scores the sum of 1 / (k + rank) over the lists it is in.
+
+    Rows are identified by ``_rowid``. Only ranks are used, so BM25 scores
+    and vector distances never need to be put on a common scale.
+
+    Returns:
+        Rows sorted by fused score, each carrying it as ``_rrf_score``
+    """
+    scores: Dict[int, float] = {}
+    rows: Dict[int, dict] = {}
+    for results in result_lists:
+        for rank, row in enumerate(results, 1):
+            row_id = row["_rowid"]
+            scores[row_id] = scores.get(row_id, 0.0) + 1.0 / (k + rank)
+            rows.setdefault(row_id, row)
+
+    fused = []
+    for row_id in sorted(scores, key=scores.get, reverse=True):
+        row = dict(rows[row_id])
+        row["_rrf_score"] = scores[row_id]
+        fused.append(row)
+    return fused
+
+
+def hybrid_search(
+    table,
+    query: str,
+    num_results: int,
+    candidates: int = 20,
+    vector_timeout: Optional[float] = 5.0,
+    query_vector: Optional[Sequence[float]] = None,
+    where: Optional[str] = None,
+    **vector_kwargs,
+) -> List[dict]:
+    """Runs BM25 and vector search side by side and fuses them with reciprocal rank fusion.
+
+    The vector side (which has to embed the query first) runs in a worker
+    thread while the lexical side runs in the caller. If it fails or takes
+    longer than ``vector_timeout`` seconds, the lexical results are returned
+    on their own, so retrieval keeps working when the embedding API is slow.
+
+    Args:
+        table: LanceDB table with a full-text index on ``text`` (see ensure_fts_index)
+        query: User's question
+        num_results: Number of results to return
+        candidates: Results taken from each side before fusing
+        vector_timeout: Seconds to wait for the vector side, None to always wait
+        query_vector: Already computed query embedding (skips embedding ``query``)
+        where: SQL filter applied to both sides before ranking (see metadata_filter)
+        **vector_kwargs: Passed to vector_search (nprobes, refine_factor)
+
+    Returns:
+        Rows as dicts, best first
+    """
+    future = _executor.submit(
+        lambda: vector_search(
+            table,
+            query if query_vector is None else query_vector,
+            candidates,
+            where=where,
+            **vector_kwargs,
+        )
+        .select(VECTOR_RESULT_COLUMNS)
+        .with_row_id(True)
+        .to_list()
+    )
+    lexical = lexical_search(table, query, candidates, where=where)
+
+    try:
+        semantic = future.result(timeout=vector_timeout)
+    except Exception:
+        # Timed out or failed (e.g. embedding API errors): fall back to lexical results
+        semantic = []
+
+    return reciprocal_rank_fusion([semantic, lexical])[:num_results]
@@ -0,0 +1,229 @@
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import pyarrow as pa
+import requests
+from docling.datamodel.base_models import DocumentStream
+
+from utils.vector_storage import VECTOR_COLUMNS
+
+
+def hash_bytes(data: bytes) -> str:
+    """Returns the SHA-256 hex digest of raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """Returns the SHA-256 hex digest of a UTF-8 encoded string."""
+    return hash_bytes(text.encode("utf-8"))
+
+
+def is_url(source: str) -> bool:
+    return urlparse(source).scheme in ("http", "https")
+
+
+def read_source(source: str, timeout: int = 30, fetch_cache=None) -> bytes:
+    """Reads the raw bytes of a local file or remote URL.
+
+    Args:
+        source: Local path or http(s) URL of the document
+        timeout: Request timeout in seconds for remote sources
+        fetch_cache: FetchCache to serve remote sources from (see utils/fetch_cache.py)
+
+    Returns:
+        The document bytes
+    """
+    if is_url(source) and fetch_cache is not None:
+        return fetch_cache.fetch(source).read()
+    if is_url(source):
+        response = requests.get(source, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def source_hash(source: str, fetch_cache=None) -> str:
+    """Returns the content hash of a source.
+
+    With a ``fetch_cache``, an unchanged remote source is revalidated with a
+    conditional request and its hash read from the cache, without downloading it.
+    """
+    if is_url(source) and fetch_cache is not None:
+        return fetch_cache.fetch(source).content_hash
+    return hash_bytes(read_source(source))
+
+
+def to_document_stream(
+    source: str, data: bytes, content_type: Optional[str] = None
+) -> DocumentStream:
+    """Wraps already-fetched bytes so DocumentConverter does not download them again.
+
+    Args:
+        source: Local path or URL the bytes came from
+        data: The document bytes
+        content_type: HTTP Content-Type, used to add a file extension when the URL has none
+            (DocumentConverter picks the format from it)
+    """
+    name = os.path.basename(urlparse(source).path) or urlparse(source).netloc or source
+    if content_type and not os.path.splitext(name)[1]:
+        name += mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+    return DocumentStream(name=name, stream=BytesIO(data))
+
+
+def source_stream(source: str, fetch_cache=None) -> DocumentStream:
+    """Reads a source (remote ones through ``fetch_cache`` if given) into a DocumentStream."""
+    if is_url(source) and fetch_cache is not None:
+        return fetch_cache.fetch(source).stream()
+    return to_document_stream(source, read_source(source))
+
+
+def sql_quote(value: str) -> str:
+    """Quotes a string literal for a LanceDB filter expression."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def has_hash_columns(table) -> bool:
+    """Checks whether a table was created with the content-hash metadata fields."""
+    metadata_type = table.schema.field("metadata").type
+    names = {metadata_type.field(i).name for i in range(metadata_type.num_fields)}
+    return {"chunk_hash", "source", "source_hash"} <= names
+
+
+def has_metadata_fields(table, names: Iterable[str]) -> bool:
+    """Checks whether a table's metadata struct has all the given fields."""
+    metadata_type = table.schema.field("metadata").type
+    return set(names) <= {metadata_type.field(i).name for i in range(metadata_type.num_fields)}
+
+
+def open_source_manifest(db, table_name: str = "docling", rebuild: bool = False):
+    """Opens the table recording which sources were fully ingested, and with which hash.
+
+    Rows of a source are committed to the chunk table in several batches, so
+    the source is only recorded here once all of them are written. A run that
+    fails part-way leaves the source unrecorded and the next run picks it up
+    again, reusing the vectors already written.
+
+    Args:
+        db: LanceDB connection
+        table_name: Name of the chunk table the manifest belongs to
+        rebuild: Drop any existing manifest (use together with rebuilding the chunk table)
+
+    Returns:
+        LanceDB table named ``<table_name>_sources``
+    """
+    schema = pa.schema(
+        [
+            pa.field("source", pa.string()),
+            pa.field("source_hash", pa.string()),
+            pa.field("chunks", pa.int64()),
+        ]
+    )
+    name = f"{table_name}_sources"
+    if rebuild:
+        return db.create_table(name, schema=schema, mode="overwrite")
+    return db.create_table(name, schema=schema, exist_ok=True)
+
+
+def load_source_hashes(manifest) -> Dict[str, str]:
+    """Reads the content hash of every fully ingested source.
+
+    Returns:
+        Mapping of source (path or URL) to its content hash
+    """
+    rows = manifest.search().select(["source", "source_hash"]).limit(None).to_list()
+    return {row["source"]: row["source_hash"] for row in rows}
+
+
+def record_source(manifest, source: str, source_hash: str, chunks: int) -> None:
+    """Marks a source as fully ingested with the given content hash."""
+    manifest.delete(f"source = {sql_quote(source)}")
+    manifest.add([{"source": source, "source_hash": source_hash, "chunks": chunks}])
+
+
+@dataclass
+class IngestionPlan:
+    """What needs to happen to bring the table in line with the current sources."""
+
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+
+def plan_ingestion(
+    source_hashes: Dict[str, str], stored_hashes: Dict[str, str]
+) -> IngestionPlan:
+    """Compares freshly computed source hashes against the ones stored in the table.
+
+    Args:
+        source_hashes: Mapping of source to the hash of its current bytes
+        stored_hashes: Mapping of source to the hash stored at last ingestion
+
+    Returns:
+        IngestionPlan listing changed (new or modified), unchanged and removed sources
+    """
+    plan = IngestionPlan()
+    for source, source_hash in source_hashes.items():
+        if stored_hashes.get(source) == source_hash:
+            plan.unchanged.append(source)
+        else:
+            plan.changed.append(source)
+
+    plan.removed = [source for source in stored_hashes if source not in source_hashes]
+    return plan
+
+
+def load_chunk_vectors(table, source: str) -> Dict[str, dict]:
+    """Returns the stored vector columns of every chunk of a source, keyed by chunk hash.
+
+    Besides ``vector`` this includes the int8 rerank columns when the table has them.
+    """
+    columns = [name for name in VECTOR_COLUMNS if name in table.schema.names]
+    rows = (
+        table.search()
+        .where(f"metadata.source = {sql_quote(source)}")
+        .select(columns + ["metadata"])
+        .limit(None)
+        .to_arrow()
+        .to_pylist()
+    )
+    return {
+        row["metadata"]["chunk_hash"]: {name: row[name] for name in columns} for row in rows
+    }
+
+
+def delete_sources(table, sources: Iterable[str], manifest=None) -> None:
+    """Deletes every row belonging to the given sources (and their manifest entries)."""
+    sources = list(sources)
+    if sources:
+        where = f"metadata.source IN ({', '.join(sql_quote(s) for s in sources)})"
+        table.delete(where)
+        if manifest is not None:
+            manifest.delete(where.replace("metadata.source", "source", 1))
+
+
+def source_row_ids(table, source: str) -> List[int]:
+    """Returns the ``_rowid`` of every row of a source, e.g. to delete them once replaced."""
+    rows = (
+        table.search()
+        .where(f"metadata.source = {sql_quote(source)}")
+        .select([])
+        .with_row_id(True)
+        .limit(None)
+        .to_arrow()
+    )
+    return rows.column("_rowid").to_pylist()
+
+
+def delete_rows(table, row_ids: Iterable[int], batch_size: int = 10_000) -> None:
+    """Deletes rows by ``_rowid``, ``batch_size`` ids per delete."""
+    row_ids = list(row_ids)
+    for start in range(0, len(row_ids), batch_size):
+        ids = ", ".join(str(row_id) for row_id in row_ids[start : start + batch_size])
+        table.delete(f"_rowid IN ({ids})")
@@ -0,0 +1,156 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Metrics:
+    """Counters, timing histograms and spans for the pipeline stages.
+
+    - ``count(name, value)`` adds to a counter (documents, chunks, tokens)
+    - ``observe(name, value)`` records a value in a histogram (latencies)
+    - ``span(name)`` / ``timed(name)`` time a block or function into the
+      ``<name>_seconds`` histogram
+
+    Histograms keep their sum and count forever but only the last
+    ``window`` values for percentiles. When ``jsonl_path`` is set every
+    span and observation is also appended to it as one JSON line; the
+    totals can be exported with ``write_prometheus`` in the Prometheus text
+    format (e.g. for node_exporter's textfile collector). Thread-safe.
+
+    Args:
+        jsonl_path: File to append events to, or None
+        window: Number of recent values kept per histogram for percentiles
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, window: int = 10_000):
+        self.jsonl_path = jsonl_path
+        self.window = window
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, deque] = {}
+        self.sums: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, jsonl_path: Optional[str] = None) -> "Metrics":
+        """Starts appending events to ``jsonl_path`` (None stops it)."""
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+        self.jsonl_path = jsonl_path
+        return self
+
+    def _emit(self, event: dict) -> None:
+        if self.jsonl_path:
+            line = json.dumps(event, default=str) + "\n"
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, **attributes) -> None:
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = deque(maxlen=self.window)
+                self.sums[name] = 0.0
+                self.counts[name] = 0
+            self.histograms[name].append(value)
+            self.sums[name] += value
+            self.counts[name] += 1
+        self._emit({"time": time.time(), "metric": name, "value": value, **attributes})
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        """Times the block into the ``<name>_seconds`` histogram.
+
+        Yields a dict the block can add attributes to (e.g. a token count);
+        they are written with the span's JSON line.
+        """
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **attributes)
+
+    def timed(self, name: str):
+        """Decorator timing every call of a function as a ``name`` span."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def percentiles(self, name: str, quantiles: Sequence[float] = QUANTILES) -> Dict[float, float]:
+        with self._lock:
+            values = list(self.histograms.get(name, ()))
+        if not values:
+            return {}
+        return dict(zip(quantiles, np.quantile(values, quantiles).tolist()))
+
+    def rate(self, counter: str, span: str) -> float:
+        """Returns ``counter`` per second of time spent in ``span`` (e.g. chunks per second of chunking)."""
+        seconds = self.sums.get(f"{span}_seconds", 0.0)
+        return self.counters.get(counter, 0) / seconds if seconds else 0.0
+
+    def summary(self) -> str:
+        """Human-readable table of every counter and histogram."""
+        lines = [f"{name:<32}{value:>14,.0f}" for name, value in sorted(self.counters.items())]
+        if self.histograms:
+            lines.append(f"\n{'histogram':<32}{'count':>8}{'sum':>11}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for name in sorted(self.histograms):
+            p = self.percentiles(name)
+            lines.append(
+                f"{name:<32}{self.counts[name]:>8}{self.sums[name]:>11.3f}"
+                f"{p[0.5]:>10.4f}{p[0.95]:>10.4f}{p[0.99]:>10.4f}"
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix: str = "docling_") -> str:
+        """Renders counters as Prometheus counters and histograms as summaries."""
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = _metric_name(prefix + name)
+            lines += [f"# TYPE {metric}_total counter", f"{metric}_total {value}"]
+        for name in sorted(self.histograms):
+            metric = _metric_name(prefix + name)
+            lines.append(f"# TYPE {metric} summary")
+            for quantile, value in self.percentiles(name).items():
+                lines.append(f'{metric}{{quantile="{quantile}"}} {value}')
+            lines += [f"{metric}_sum {self.sums[name]}", f"{metric}_count {self.counts[name]}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "docling_") -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(path + ".tmp", path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.sums.clear()
+            self.counts.clear()
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+# Shared by the pipeline stages; scripts configure its output
+metrics = Metrics()
@@ -0,0 +1,365 @@
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+from utils.metrics import metrics
+from utils.retrieval import metadata_filter
+from utils.vector_storage import VECTOR_COLUMNS
+
+WORD_RE = re.compile(r"\w+")
+# Metadata fields listing the other places a stored (canonical) chunk was found
+DUPLICATE_FIELDS = ("duplicate_filenames", "duplicate_page_numbers", "duplicate_sources")
+
+_MASK_32 = np.uint64(0xFFFFFFFF)
+_SHINGLE_MULTIPLIER = np.uint64(1_000_003)
+
+
+def _optimal_bands(
+    threshold: float, num_perm: int, false_positive_weight: float = 0.1
+) -> Tuple[int, int]:
+    """Picks (bands, rows per band) whose LSH S-curve best separates pairs around ``threshold``.
+
+    Minimizes the weighted false positive area below the threshold plus the
+    false negative area above it, as datasketch does. Candidates are checked
+    against their signatures anyway, so a false positive only costs one
+    comparison and missed duplicates are weighted more.
+    """
+    similarities = np.linspace(0.0, 1.0, 201)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            probability = 1 - (1 - similarities**rows) ** bands
+            below = similarities < threshold
+            error = (
+                false_positive_weight * probability[below].sum()
+                + (1 - false_positive_weight) * (1 - probability[~below]).sum()
+            )
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """MinHash signatures of the word shingles of a text.
+
+    Words are lower-cased ``\\w+`` runs; every ``shingle_size`` consecutive
+    words form a shingle, hashed once and then permuted ``num_perm`` times
+    with multiply-add-shift hashing (the high 32 bits of ``a * x + b`` mod
+    2^64, which needs no modulo), all as numpy array operations. Two texts
+    agree on a signature position with probability equal to the Jaccard
+    similarity of their shingle sets.
+
+    Word hashes use Python's ``hash``, which is salted per process, so
+    signatures are only comparable within one run.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Odd multipliers; products wrap around mod 2^64
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        words = WORD_RE.findall(text.lower())
+        word_hashes = np.fromiter(map(hash, words), dtype=np.int64, count=len(words)).view(np.uint64)
+        size = min(self.shingle_size, len(words))
+        if size == 0:
+            return word_hashes
+        count = len(words) - size + 1
+        shingles = word_hashes[:count].copy()
+        for offset in range(1, size):
+            shingles = shingles * _SHINGLE_MULTIPLIER + word_hashes[offset : offset + count]
+        return (shingles ^ (shingles >> np.uint64(32))) & _MASK_32
+
+    def signature(self, text: str) -> np.ndarray:
+        """The ``num_perm`` minimum permuted shingle hashes, as uint32."""
+        shingles = self.shingle_hashes(text)
+        if len(shingles) == 0:
+            return np.zeros(self.num_perm, dtype=np.uint32)
+        # The high bits of the minimum are the minimum of the high bits
+        permuted = shingles[:, None] * self._a + self._b
+        return (permuted.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """Finds chunks whose text is a near duplicate of a chunk seen before.
+
+    Exact repeats are caught by their chunk hash; the rest go through
+    MinHash LSH: signatures are cut into bands, chunks sharing any band are
+    candidates, and a candidate counts as a duplicate once the share of
+    equal signature positions (the estimated Jaccard similarity of their
+    shingles) reaches ``threshold``. The first chunk of a group is its
+    canonical chunk; later ones are reported as its duplicates.
+
+    Args:
+        threshold: Estimated shingle Jaccard similarity from which chunks are duplicates
+        num_perm: MinHash signature length
+        shingle_size: Words per shingle
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = _optimal_bands(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+        self._exact: Dict[str, Hashable] = {}
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def add(self, key: Hashable, text: str, chunk_hash: str) -> Optional[Hashable]:
+        """Indexes a chunk, unless it duplicates one already indexed.
+
+        Returns:
+            Key of the canonical chunk if this one is a (near) duplicate, else None
+        """
+        canonical = self._exact.get(chunk_hash)
+        if canonical is not None:
+            return canonical
+
+        signature = self.hasher.signature(text)
+        band_keys = [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+        checked: Set[Hashable] = set()
+        for buckets, band_key in zip(self._buckets, band_keys):
+            for candidate in buckets.get(band_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                agreement = np.count_nonzero(self._signatures[candidate] == signature)
+                if agreement >= self.threshold * len(signature):
+                    return candidate
+
+        self._exact[chunk_hash] = key
+        self._signatures[key] = signature
+        for buckets, band_key in zip(self._buckets, band_keys):
+            buckets.setdefault(band_key, []).append(key)
+        return None
+
+    def remove(self, keys: Iterable[Hashable]) -> None:
+        """Forgets indexed chunks, e.g. those of a source whose rows were deleted again."""
+        keys = {key for key in keys if key in self._signatures}
+        if not keys:
+            return
+        for key in keys:
+            signature = self._signatures.pop(key)
+            for band, buckets in enumerate(self._buckets):
+                band_key = signature[band * self.rows : (band + 1) * self.rows].tobytes()
+                members = buckets.get(band_key)
+                if members is not None and key in members:
+                    members.remove(key)
+                    if not members:
+                        del buckets[band_key]
+        self._exact = {h: key for h, key in self._exact.items() if key not in keys}
+
+
+@dataclass
+class DuplicateLocation:
+    """Where a duplicate of a stored chunk was found."""
+
+    source: str
+    filename: Optional[str]
+    page_numbers: Optional[List[int]]
+
+
+def has_duplicate_columns(table) -> bool:
+    """Checks whether a table was created with the duplicate location metadata fields."""
+    metadata_type = table.schema.field("metadata").type
+    names = {metadata_type.field(i).name for i in range(metadata_type.num_fields)}
+    return set(DUPLICATE_FIELDS) <= names
+
+
+def seed_index(
+    index: NearDuplicateIndex, table, skip_sources: Iterable[str] = (), batch_size: int = 10_000
+) -> int:
+    """Indexes the chunks already stored, so new chunks are also matched against them.
+
+    Args:
+        index: NearDuplicateIndex to fill
+        table: LanceDB chunk table
+        skip_sources: Sources about to be re-ingested (their rows are replaced)
+        batch_size: Rows read at a time
+
+    Returns:
+        Number of chunks indexed
+    """
+    skip = set(skip_sources)
+    count = 0
+    with metrics.span("dedup_seed"):
+        query = (
+            table.search()
+            .select({"text": "text", "source": "metadata.source", "chunk_hash": "metadata.chunk_hash"})
+            .limit(None)
+        )
+        for batch in query.to_batches(batch_size):
+            texts = batch.column("text").to_pylist()
+            sources = batch.column("source").to_pylist()
+            hashes = batch.column("chunk_hash").to_pylist()
+            for text, source, chunk_hash in zip(texts, sources, hashes):
+                if source not in skip:
+                    index.add((source, chunk_hash), text, chunk_hash)
+                    count += 1
+    return count
+
+
+def sources_sharing_rows(table, sources: Sequence[str]) -> List[str]:
+    """The given sources plus every source sharing a deduplicated row with them, transitively.
+
+    A stored row belongs to the source its canonical chunk came from and
+    lists the sources of its duplicates. When any of them changes or is
+    removed, the others must be re-ingested too, so each of their chunks is
+    stored (or listed) exactly once again.
+    """
+    if not has_duplicate_columns(table):
+        return list(sources)
+    found = list(dict.fromkeys(sources))
+    frontier = list(found)
+    while frontier:
+        rows = (
+            table.search()
+            .where(metadata_filter(sources=frontier, include_duplicates=True))
+            .select({"source": "metadata.source", "duplicate_sources": "metadata.duplicate_sources"})
+            .limit(None)
+            .to_arrow()
+            .to_pylist()
+        )
+        related = {row["source"] for row in rows}
+        related.update(s for row in rows for s in row["duplicate_sources"] or ())
+        frontier = [s for s in related if s not in found]
+        found.extend(frontier)
+    return found
+
+
+def attach_duplicates(table, locations: Dict[Tuple[str, str], List[DuplicateLocation]]) -> int:
+    """Adds duplicate locations to the metadata of their canonical rows, in one merge.
+
+    Args:
+        table: LanceDB chunk table
+        locations: Duplicate locations by canonical (source, chunk hash)
+
+    Returns:
+        Number of rows updated
+    """
+    if not locations:
+        return 0
+    # Chunk hashes are hex digests, safe to quote as they are
+    quoted = ", ".join(f"'{h}'" for h in {chunk_hash for _, chunk_hash in locations})
+    schema = table.schema.remove_metadata()
+    rows = []
+    for row in (
+        table.search()
+        .where(f"metadata.chunk_hash IN ({quoted})")
+        .limit(None)
+        .to_arrow()
+        .select(schema.names)
+        .to_pylist()
+    ):
+        metadata = row["metadata"]
+        found = locations.get((metadata["source"], metadata["chunk_hash"]))
+        if found is None:
+            continue
+        for location in found:
+            for field, value in zip(
+                DUPLICATE_FIELDS, (location.filename, location.page_numbers, location.source)
+            ):
+                metadata[field] = (metadata[field] or []) + [value]
+        rows.append(row)
+
+    if rows:
+        # Chunk texts are unique once deduplicated; the source check keeps
+        # the update to the canonical rows even if they are not
+        (
+            table.merge_insert("text")
+            .when_matched_update_all(where="target.metadata.source = source.metadata.source")
+            .execute(pa.Table.from_pylist(rows, schema=schema))
+        )
+    return len(rows)
+
+
+def vector_bytes_per_row(table) -> int:
+    """Bytes the vector columns of one stored row take (0 for an empty table)."""
+    columns = [name for name in VECTOR_COLUMNS if name in table.schema.names]
+    sample = table.search().select(columns).limit(100).to_arrow()
+    return sample.nbytes // sample.num_rows if sample.num_rows else 0
+
+
+class ChunkDeduplicator:
+    """The dedup stage between chunking and writing: drops near-duplicate chunks.
+
+    Each chunk is looked up in a NearDuplicateIndex. Duplicates are not
+    embedded or stored; their source, filename and pages are collected per
+    canonical row and attached to its metadata once ``flush_rows`` rows
+    have some pending (each attach is one merge over the table, so it is
+    not done per source), and at the end of the write stage. The write
+    stage records a source in the manifest only once its duplicates are
+    attached, so a run failing before that ingests it again.
+
+    Args:
+        index: NearDuplicateIndex, seeded with the stored chunks (see seed_index)
+        flush_rows: Canonical rows with pending locations that trigger an attach
+    """
+
+    def __init__(self, index: NearDuplicateIndex, flush_rows: int = 1000):
+        self.index = index
+        self.flush_rows = flush_rows
+        self.pending: Dict[Tuple[str, str], List[DuplicateLocation]] = defaultdict(list)
+        self.seconds = 0.0
+        # Chunks of the source being written that became canonical, for discard
+        self._source: Optional[str] = None
+        self._source_keys: List[Tuple[str, str]] = []
+
+    def is_duplicate(self, source: str, chunk_hash: str, text: str, filename, page_numbers) -> bool:
+        start = time.perf_counter()
+        if source != self._source:
+            self._source, self._source_keys = source, []
+        canonical = self.index.add((source, chunk_hash), text, chunk_hash)
+        if canonical is not None:
+            self.pending[canonical].append(DuplicateLocation(source, filename, page_numbers))
+        else:
+            self._source_keys.append((source, chunk_hash))
+        self.seconds += time.perf_counter() - start
+        return canonical is not None
+
+    def discard(self, source: str) -> None:
+        """Forgets the source being written after its rows were deleted again (it failed).
+
+        Its chunks leave the index, so later chunks are not dropped as
+        duplicates of rows that no longer exist, and the duplicate locations
+        found in it or pointing at it are dropped.
+        """
+        if source == self._source:
+            self.index.remove(self._source_keys)
+            self._source, self._source_keys = None, []
+        for canonical in list(self.pending):
+            if canonical[0] == source:
+                del self.pending[canonical]
+                continue
+            locations = [loc for loc in self.pending[canonical] if loc.source != source]
+            if locations:
+                self.pending[canonical] = locations
+            else:
+                del self.pending[canonical]
+
+    def flush(self, table, force: bool = False) -> int:
+        """Attaches the pending duplicate locations to their (written) canonical rows.
+
+        Without ``force`` this only happens once ``flush_rows`` rows have some.
+        """
+        if not self.pending or (not force and len(self.pending) < self.flush_rows):
+            return 0
+        start = time.perf_counter()
+        with metrics.span("dedup_attach", rows=len(self.pending)):
+            updated = attach_duplicates(table, self.pending)
+        self.pending.clear()
+        self.seconds += time.perf_counter() - start
+        return updated
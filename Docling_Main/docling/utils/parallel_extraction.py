@@ -0,0 +1,133 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator, Optional
+
+from docling.document_converter import DocumentConverter
+
+from utils.fetch_cache import FetchCache
+from utils.ingestion import hash_text, is_url
+from utils.metrics import metrics
+
+# One converter (and download cache) per worker process, created once by the pool initializer
+_converter: Optional[DocumentConverter] = None
+_fetch_cache: Optional[FetchCache] = None
+
+
+@dataclass
+class ExtractionResult:
+    """Outcome of converting one source in a worker process."""
+
+    source: str
+    path: Optional[str]
+    seconds: float
+    pages: int = 0
+    error: Optional[str] = None
+    # The download cache reported the source unchanged and its JSON was kept
+    unchanged: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _init_worker(cache_dir: Optional[str]) -> None:
+    global _converter, _fetch_cache
+    _converter = DocumentConverter()
+    _fetch_cache = FetchCache(cache_dir) if cache_dir else None
+
+
+def _convert_one(source: str, output_dir: str) -> ExtractionResult:
+    start = time.perf_counter()
+    try:
+        path = os.path.join(output_dir, f"{hash_text(source)[:16]}.json")
+        if is_url(source) and _fetch_cache is not None:
+            fetched = _fetch_cache.fetch(source)
+            if not fetched.changed and os.path.exists(path):
+                return ExtractionResult(source, path, time.perf_counter() - start, unchanged=True)
+            document = _converter.convert(fetched.stream()).document
+        else:
+            document = _converter.convert(source).document
+        # Write to a temporary file first so a crash never leaves half a document behind
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(document.export_to_dict(), f)
+        os.replace(path + ".tmp", path)
+        return ExtractionResult(
+            source, path, time.perf_counter() - start, pages=len(document.pages)
+        )
+    except Exception as e:
+        return ExtractionResult(
+            source, None, time.perf_counter() - start, error=f"{type(e).__name__}: {e}"
+        )
+
+
+def extract_parallel(
+    sources: Iterable[str],
+    output_dir: str = "data/extracted",
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    cache_dir: Optional[str] = "data/download_cache",
+) -> Iterator[ExtractionResult]:
+    """Converts many documents across a pool of worker processes.
+
+    Every worker holds its own DocumentConverter. Each converted document is
+    written to ``output_dir`` as ``export_to_dict()`` JSON as soon as it is
+    done, and a line per source (path, timing, error) is appended to
+    ``output_dir/index.jsonl``. A failing source is reported and skipped, it
+    never aborts the batch. Sources are submitted lazily, at most
+    ``max_pending`` at a time, so a long list (or generator) of URLs is not
+    queued up front.
+
+    Remote sources are downloaded through a FetchCache in ``cache_dir``. A
+    URL that answers 304 Not Modified (or returns the same bytes) and was
+    converted before is not converted again; its result has ``unchanged``
+    set and points at the existing JSON.
+
+    The calling script must guard its entry point with
+    ``if __name__ == "__main__":`` because worker processes re-import it.
+
+    Args:
+        sources: Paths or URLs of the documents to convert
+        output_dir: Directory receiving one JSON file per converted document
+        max_workers: Number of worker processes (default: number of CPUs)
+        max_pending: Maximum number of sources submitted but not finished
+            (default: four per worker)
+        cache_dir: Download cache directory, None to fetch through DocumentConverter
+
+    Yields:
+        ExtractionResult per source, in completion order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or max_workers * 4
+    sources = iter(sources)
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(cache_dir,)
+    ) as pool, open(os.path.join(output_dir, "index.jsonl"), "a", encoding="utf-8") as index:
+        pending = set()
+        while True:
+            for source in sources:
+                pending.add(pool.submit(_convert_one, source, output_dir))
+                if len(pending) >= max_pending:
+                    break
+
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result.unchanged:
+                    metrics.count("documents_unchanged")
+                elif result.ok:
+                    metrics.count("documents_converted")
+                    metrics.count("pages_converted", result.pages)
+                    metrics.observe("convert_seconds", result.seconds, source=result.source)
+                else:
+                    metrics.count("documents_failed")
+                index.write(json.dumps(asdict(result)) + "\n")
+                index.flush()
+                yield result
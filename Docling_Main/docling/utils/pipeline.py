@@ -0,0 +1,381 @@
+import logging
+import os
+import queue
+import threading
+import time
+from itertools import chain, groupby, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+from utils.arrow_records import ChunkColumns, chunk_page_numbers
+from utils.embedding_pipeline import EmbeddingReport
+from utils.metrics import metrics
+from utils.ingestion import (
+    delete_rows,
+    hash_text,
+    is_url,
+    load_chunk_vectors,
+    record_source,
+    source_row_ids,
+    source_stream,
+)
+from utils.near_duplicates import ChunkDeduplicator, vector_bytes_per_row
+
+T = TypeVar("T")
+
+_DONE = object()
+# Markers the chunk stages yield after each source's chunks: it is complete
+# (possibly with no chunks at all), or it failed and must not be recorded
+SOURCE_END = object()
+SOURCE_FAILED = object()
+
+_log = logging.getLogger(__name__)
+
+
+def bounded(iterable: Iterable[T], maxsize: int) -> Iterator[T]:
+    """Runs ``iterable`` in a background thread, at most ``maxsize`` items ahead of the consumer.
+
+    This is the queue between two pipeline stages: the producer keeps working
+    while the consumer is busy, but blocks once ``maxsize`` items are waiting,
+    so memory stays bounded however large the input is. Exceptions raised by
+    the producer are re-raised in the consumer.
+    """
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Lets the producer exit if the consumer stops early
+        stop.set()
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Groups an iterable into lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def convert_stage(
+    sources: Iterable[str],
+    converter,
+    fetch_cache=None,
+    document_store=None,
+    source_hashes: Optional[Dict[str, str]] = None,
+) -> Iterator[Tuple[str, object]]:
+    """Converts sources one at a time, reading remote ones through ``fetch_cache`` if given.
+
+    With a ``document_store``, documents converted before (same bytes, same
+    converter options) are loaded from it instead, and new ones are saved to it.
+    A source that fails to download or convert is logged and yielded with
+    SOURCE_FAILED instead of a document, so the other sources still go through.
+
+    Yields:
+        Tuples of (source, DoclingDocument or SOURCE_FAILED)
+    """
+    source_hashes = source_hashes or {}
+    for source in sources:
+        try:
+            if document_store is not None:
+                document = document_store.convert(
+                    source, converter, fetch_cache, source_hashes.get(source)
+                )
+            else:
+                with metrics.span("convert", source=source):
+                    document = converter.convert(source_stream(source, fetch_cache)).document
+                metrics.count("documents_converted")
+        except Exception:
+            _log.exception("Failed to convert %s; it is left for the next run", source)
+            metrics.count("sources_failed")
+            document = SOURCE_FAILED
+        yield source, document
+
+
+def chunk_stage(documents: Iterable[Tuple[str, object]], chunker) -> Iterator[Tuple[str, object]]:
+    """Chunks documents lazily, without materialising the chunk list.
+
+    Yields:
+        Tuples of (source, chunk), then (source, SOURCE_END) after each
+        document's chunks, or (source, SOURCE_FAILED) for a failed one
+    """
+    for source, document in documents:
+        if document is SOURCE_FAILED:
+            yield source, SOURCE_FAILED
+            continue
+        # Only time spent inside the chunker counts, not time waiting on the consumer.
+        # The call is timed too: HybridChunker chunks the whole document up front.
+        start = time.perf_counter()
+        chunks = chunker.chunk(dl_doc=document)
+        seconds = time.perf_counter() - start
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            seconds += time.perf_counter() - start
+            if chunk is None:
+                break
+            metrics.count("chunks")
+            yield source, chunk
+        metrics.observe("chunk_seconds", seconds, source=source)
+        yield source, SOURCE_END
+
+
+def spreadsheet_chunk_stage(
+    sources: Iterable[str], chunker, fetch_cache=None
+) -> Iterator[Tuple[str, object]]:
+    """Streams the row windows of spreadsheets (see SpreadsheetChunker), skipping conversion.
+
+    Remote workbooks are read from the download cache file, so no workbook
+    is ever held in memory as a whole. A workbook that fails to download or
+    parse is logged and ends with SOURCE_FAILED; windows already yielded for
+    it may have been written, and it is ingested again on the next run.
+
+    Yields:
+        Tuples of (source, RowWindow), then (source, SOURCE_END) or
+        (source, SOURCE_FAILED) after each workbook's windows
+    """
+    for source in sources:
+        seconds, end = 0.0, SOURCE_END
+        try:
+            path = fetch_cache.fetch(source).path if is_url(source) and fetch_cache is not None else source
+            windows = chunker.chunk(path, filename=os.path.basename(urlparse(source).path))
+            while True:
+                start = time.perf_counter()
+                window = next(windows, None)
+                seconds += time.perf_counter() - start
+                if window is None:
+                    break
+                metrics.count("chunks")
+                yield source, window
+        except Exception:
+            _log.exception("Failed to read %s; it is left for the next run", source)
+            metrics.count("sources_failed")
+            end = SOURCE_FAILED
+        metrics.observe("chunk_seconds", seconds, source=source)
+        yield source, end
+
+
+def _discard_new_rows(
+    table, source: str, old_rows: List[int], dedup: Optional[ChunkDeduplicator]
+) -> None:
+    """Deletes the rows written for a source that failed part-way, keeping its previous ones."""
+    old = set(old_rows)
+    delete_rows(table, [row_id for row_id in source_row_ids(table, source) if row_id not in old])
+    if dedup is not None:
+        dedup.discard(source)
+
+
+def write_stage(
+    chunks: Iterable[Tuple[str, object]],
+    table,
+    pipeline,
+    manifest,
+    source_hashes: Dict[str, str],
+    write_batch_rows: int = 1000,
+    dedup: Optional[ChunkDeduplicator] = None,
+) -> Iterator[Tuple[str, EmbeddingReport]]:
+    """Embeds and writes chunks source by source, in batches of ``write_batch_rows``.
+
+    Each batch is collected straight into Arrow columns (ChunkColumns) and
+    written as one Arrow table. Before the first batch of a source its stored
+    vectors are loaded (so unchanged chunks are not re-embedded) and the
+    ``_rowid`` of its current rows noted. Those rows stay searchable until
+    its last batch is written; only then are they deleted and the source
+    recorded in the manifest, so a re-ingested source is never missing from
+    search (both versions are, briefly, there together). The chunk stages end
+    every source with SOURCE_END, so a source that now yields no chunks still
+    has its old rows deleted and is recorded with 0 rows. If a source ends
+    with SOURCE_FAILED, or embedding it fails, the rows written for it so far
+    are deleted instead and it is not recorded: its previous version stays
+    as it was and the next run tries it again.
+
+    With a ``dedup`` stage, near duplicates of chunks seen before are neither
+    embedded nor stored; their locations are added to the metadata of the
+    rows they duplicate (see ChunkDeduplicator).
+
+    Yields:
+        Tuples of (source, EmbeddingReport summed over the source's batches)
+    """
+    vector_bytes = None
+    unrecorded: List[Tuple[str, int]] = []
+    for source, items in groupby(chunks, key=lambda item: item[0]):
+        items = (item for _, item in items)
+        first = next(items)
+        if first is SOURCE_FAILED:
+            continue
+        known_vectors = load_chunk_vectors(table, source)
+        old_rows = source_row_ids(table, source)
+
+        failed = []
+
+        def source_chunks(first=first, items=items, failed=failed):
+            for item in chain([first], items):
+                if item is SOURCE_FAILED:
+                    failed.append(True)
+                if item is SOURCE_END or item is SOURCE_FAILED:
+                    return
+                yield item
+
+        total = EmbeddingReport()
+        text_bytes_saved = 0
+        try:
+            for batch in batched(source_chunks(), write_batch_rows):
+                columns = ChunkColumns()
+                for chunk in batch:
+                    text = chunk.text
+                    chunk_hash = hash_text(text)
+                    if dedup is not None and dedup.is_duplicate(
+                        source,
+                        chunk_hash,
+                        text,
+                        chunk.meta.origin.filename,
+                        chunk_page_numbers(chunk),
+                    ):
+                        total.duplicates += 1
+                        text_bytes_saved += len(text.encode("utf-8"))
+                        if chunk_hash not in known_vectors:
+                            total.embeddings_saved += 1
+                            total.tokens_saved += pipeline.count_tokens(text)
+                        continue
+                    columns.append(chunk, source, source_hashes[source], chunk_hash)
+                if len(columns):
+                    total.add(pipeline.embed_and_write_columns(table, columns, known_vectors))
+        except Exception:
+            _discard_new_rows(table, source, old_rows, dedup)
+            raise
+        if failed:
+            _discard_new_rows(table, source, old_rows, dedup)
+            continue
+        # Before the dedup flush, which would also update the old copies of its rows
+        delete_rows(table, old_rows)
+        if dedup is None:
+            record_source(manifest, source, source_hashes[source], total.rows_written)
+        else:
+            # Recorded once the locations of its duplicates are attached, so a
+            # run failing before that ingests the source again
+            unrecorded.append((source, total.rows_written))
+            dedup.flush(table)
+            if not dedup.pending:
+                for done, rows in unrecorded:
+                    record_source(manifest, done, source_hashes[done], rows)
+                unrecorded.clear()
+
+        if total.duplicates:
+            if vector_bytes is None:
+                vector_bytes = vector_bytes_per_row(table)
+            total.bytes_saved = text_bytes_saved + total.duplicates * vector_bytes
+            metrics.count("duplicate_chunks", total.duplicates)
+            metrics.count("duplicate_tokens_saved", total.tokens_saved)
+        yield source, total
+
+    if dedup is not None:
+        dedup.flush(table, force=True)
+        for done, rows in unrecorded:
+            record_source(manifest, done, source_hashes[done], rows)
+
+
+def run_ingestion(
+    sources: Iterable[str],
+    converter,
+    chunker,
+    table,
+    pipeline,
+    manifest,
+    source_hashes: Dict[str, str],
+    queue_size: int = 256,
+    write_batch_rows: int = 1000,
+    fetch_cache=None,
+    document_store=None,
+    dedup: Optional[ChunkDeduplicator] = None,
+) -> Iterator[Tuple[str, EmbeddingReport]]:
+    """Streams sources through convert -> chunk -> dedup -> embed -> write.
+
+    Conversion and chunking each run in their own thread behind a bounded
+    queue, so the next documents are converted while earlier chunks are being
+    embedded, the first rows reach LanceDB before later documents are
+    converted, and at most ``queue_size`` chunks (plus two documents and one
+    write batch) are held in memory at any time.
+
+    Args:
+        sources: Sources to (re-)ingest, e.g. the changed sources of an IngestionPlan
+        converter: DocumentConverter
+        chunker: HybridChunker
+        table: LanceDB table to write to
+        pipeline: EmbeddingPipeline that embeds and writes each batch
+        manifest: Source manifest from open_source_manifest
+        source_hashes: Content hash of every source
+        queue_size: Maximum number of chunks waiting between chunking and writing
+        write_batch_rows: Number of rows handed to the embedding pipeline at once
+        fetch_cache: FetchCache serving remote sources (skips downloading them again)
+        document_store: DocumentStore of converted documents (skips converting them again)
+        dedup: ChunkDeduplicator dropping near-duplicate chunks before they are embedded
+
+    Yields:
+        Tuples of (source, EmbeddingReport) as each source is fully written
+    """
+    documents = bounded(
+        convert_stage(sources, converter, fetch_cache, document_store, source_hashes), maxsize=1
+    )
+    chunks = bounded(chunk_stage(documents, chunker), maxsize=queue_size)
+    yield from write_stage(
+        chunks, table, pipeline, manifest, source_hashes, write_batch_rows, dedup
+    )
+
+
+def run_spreadsheet_ingestion(
+    sources: Iterable[str],
+    chunker,
+    table,
+    pipeline,
+    manifest,
+    source_hashes: Dict[str, str],
+    queue_size: int = 256,
+    write_batch_rows: int = 1000,
+    fetch_cache=None,
+    dedup: Optional[ChunkDeduplicator] = None,
+) -> Iterator[Tuple[str, EmbeddingReport]]:
+    """Streams spreadsheets through row windows -> embed -> write.
+
+    Like run_ingestion, but workbooks are read row by row with a
+    SpreadsheetChunker instead of being converted to one document, so
+    memory stays bounded by ``queue_size`` windows plus one write batch
+    however many rows they have.
+
+    Args:
+        sources: Spreadsheet paths or URLs to (re-)ingest
+        chunker: SpreadsheetChunker
+        (the rest as in run_ingestion)
+
+    Yields:
+        Tuples of (source, EmbeddingReport) as each workbook is fully written
+    """
+    chunks = bounded(spreadsheet_chunk_stage(sources, chunker, fetch_cache), maxsize=queue_size)
+    yield from write_stage(
+        chunks, table, pipeline, manifest, source_hashes, write_batch_rows, dedup
+    )
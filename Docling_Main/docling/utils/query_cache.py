@@ -0,0 +1,175 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases a query, collapses whitespace and drops trailing punctuation."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    context: Any  # Whatever the caller retrieved, e.g. a list of SearchHit
+    vector: Optional[np.ndarray]
+    context_seconds: float
+    answer: Optional[str] = None
+    answer_seconds: float = 0.0
+
+
+@dataclass
+class CacheStats:
+    lookups: int = 0
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    answers_reused: int = 0
+    seconds_saved: float = 0.0
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.semantic_hits
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class QueryCache:
+    """Caches retrieved context (and optionally answers) per query.
+
+    A lookup first tries the normalized query text, then, if an ``embed``
+    function is given, the cached query whose embedding is most similar,
+    as long as the cosine similarity reaches ``threshold``. Entries are
+    scoped by table name, table version and retrieval mode, so anything
+    cached before a re-ingestion is dropped the first time the new table
+    version is seen.
+
+    Safe to share between threads (Streamlit sessions).
+
+    Args:
+        embed: Function returning the embedding of a query, None for exact matching only
+        threshold: Minimum cosine similarity for a semantic hit
+        max_entries: Least recently used entries beyond this are evicted
+        embed_timeout: Seconds to wait for ``embed`` before treating the lookup as a miss
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        embed_timeout: Optional[float] = None,
+    ):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embed_timeout = embed_timeout
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Tuple[tuple, str], CacheEntry]" = OrderedDict()
+        self._versions: dict = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-cache")
+
+    def scope(self, table, mode: str) -> tuple:
+        """Returns the cache scope of a search and drops entries of older table versions."""
+        name, version = table.name, table.version
+        with self._lock:
+            if self._versions.get(name) != version:
+                self._versions[name] = version
+                for key in [key for key in self._entries if key[0][0] == name and key[0][1] != version]:
+                    del self._entries[key]
+        return (name, version, mode)
+
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        try:
+            vector = self._executor.submit(self.embed, query).result(timeout=self.embed_timeout)
+        except Exception:
+            # A slow or failing embedding API must not hold up the chat
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(
+        self, query: str, scope: tuple, semantic: bool = True
+    ) -> Tuple[Optional[CacheEntry], Optional[np.ndarray]]:
+        """Finds the cached entry for a query.
+
+        Args:
+            query: User's question
+            scope: From ``scope()``
+            semantic: Whether to fall back to embedding similarity (costs an embedding call)
+
+        Returns:
+            Tuple of (entry or None, query embedding if one was computed); pass
+            the embedding on to ``store`` so a miss is not embedded twice
+        """
+        key = (scope, normalize_query(query))
+        with self._lock:
+            self.stats.lookups += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats.exact_hits += 1
+                self.stats.seconds_saved += entry.context_seconds
+                return entry, None
+
+        if not (semantic and self.embed):
+            return None, None
+        vector = self._embed(query)
+        if vector is None:
+            return None, None
+
+        with self._lock:
+            candidates = [
+                (k, e) for k, e in self._entries.items() if k[0] == scope and e.vector is not None
+            ]
+            if not candidates:
+                return None, vector
+            similarities = np.stack([e.vector for _, e in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None, vector
+            best_key, entry = candidates[best]
+            self._entries.move_to_end(best_key)
+            self.stats.semantic_hits += 1
+            self.stats.seconds_saved += entry.context_seconds
+            return entry, vector
+
+    def store(
+        self,
+        query: str,
+        scope: tuple,
+        context: Any,
+        context_seconds: float,
+        vector: Optional[Sequence[float]] = None,
+    ) -> CacheEntry:
+        """Caches the context retrieved for a query, with the seconds it took to retrieve."""
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        entry = CacheEntry(query, context, vector, context_seconds)
+        with self._lock:
+            self._entries[(scope, normalize_query(query))] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def store_answer(self, entry: CacheEntry, answer: str, answer_seconds: float):
+        entry.answer, entry.answer_seconds = answer, answer_seconds
+
+    def answer_reused(self, entry: CacheEntry):
+        """Counts the chat call saved by answering from ``entry.answer``."""
+        with self._lock:
+            self.stats.answers_reused += 1
+            self.stats.seconds_saved += entry.answer_seconds
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
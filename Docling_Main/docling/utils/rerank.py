@@ -0,0 +1,162 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import replace
+from typing import List, Optional, Sequence
+
+from utils.metrics import metrics
+from utils.query_cache import normalize_query
+from utils.retrieval import SearchHit
+
+TOKEN_RE = re.compile(r"\w+(?:[.\-/]\w+)*")
+
+
+def _terms(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class LexicalScorer:
+    """BM25 over the candidate set, with a bonus for identifier-like terms.
+
+    Term statistics come from the candidates themselves, so no index is
+    needed and scoring 50 candidates takes a few milliseconds.
+
+    Query terms containing digits (clause numbers, account ids, dates) count
+    ``identifier_weight`` times, since a chunk that contains them is almost
+    always the one asked about.
+    """
+
+    # Scores depend on the whole candidate set, so it is scored in one call
+    needs_candidate_set = True
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, identifier_weight: float = 3.0):
+        self.k1 = k1
+        self.b = b
+        self.identifier_weight = identifier_weight
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        documents = [Counter(_terms(text)) for text in texts]
+        if not documents:
+            return []
+        lengths = [sum(d.values()) for d in documents]
+        average_length = sum(lengths) / len(lengths) or 1.0
+        query_terms = set(_terms(query))
+        idf = {}
+        for term in query_terms:
+            frequency = sum(term in d for d in documents)
+            weight = self.identifier_weight if any(c.isdigit() for c in term) else 1.0
+            idf[term] = weight * math.log(1 + (len(documents) - frequency + 0.5) / (frequency + 0.5))
+
+        scores = []
+        for document, length in zip(documents, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            scores.append(
+                sum(
+                    idf[term] * document[term] * (self.k1 + 1) / (document[term] + norm)
+                    for term in query_terms
+                    if term in document
+                )
+            )
+        return scores
+
+
+class CrossEncoderScorer:
+    """Scores (query, chunk) pairs with a local sentence-transformers cross-encoder.
+
+    Needs ``pip install sentence-transformers``; the default MiniLM model
+    runs on CPU in a few milliseconds per pair.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", max_length: int = 512):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "CrossEncoderScorer needs sentence-transformers: pip install sentence-transformers"
+            ) from e
+        self.model = CrossEncoder(model_name, max_length=max_length)
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        return [float(s) for s in self.model.predict([(query, text) for text in texts])]
+
+
+class Reranker:
+    """Re-orders over-fetched candidates with a more precise scorer.
+
+    Candidates are scored in retrieval order, ``batch_size`` at a time, and
+    scores are cached per (normalized query, chunk text). Once
+    ``latency_budget`` seconds are spent, the remaining candidates keep
+    their retrieval order behind the scored ones, so a slow scorer degrades
+    to plain retrieval instead of holding up the answer.
+
+    Args:
+        scorer: LexicalScorer, CrossEncoderScorer or anything with ``score(query, texts)``
+        batch_size: Candidates scored per call
+        latency_budget: Seconds per rerank, None for no limit
+        cache_size: Number of cached scores (least recently used first out)
+    """
+
+    def __init__(
+        self,
+        scorer,
+        batch_size: int = 16,
+        latency_budget: Optional[float] = 0.3,
+        cache_size: int = 100_000,
+    ):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.latency_budget = latency_budget
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key: tuple) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _remember(self, keys: Sequence[tuple], scores: Sequence[float]) -> None:
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, hits: Sequence[SearchHit], k: int) -> List[SearchHit]:
+        """Returns the ``k`` best candidates, each carrying its rerank score."""
+        start = time.perf_counter()
+        normalized = normalize_query(query)
+        keys = [(normalized, hashlib.sha1(hit.text.encode("utf-8")).digest()) for hit in hits]
+        scores: List[Optional[float]] = [self._cached(key) for key in keys]
+        metrics.count("rerank_cache_hits", sum(s is not None for s in scores))
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        batch_size = self.batch_size
+        if missing and getattr(self.scorer, "needs_candidate_set", False):
+            missing, batch_size = list(range(len(hits))), len(hits)
+        for offset in range(0, len(missing), max(1, batch_size)):
+            if (
+                self.latency_budget is not None
+                and offset
+                and time.perf_counter() - start > self.latency_budget
+            ):
+                metrics.count("rerank_budget_exceeded")
+                break
+            batch = missing[offset : offset + batch_size]
+            batch_scores = self.scorer.score(query, [hits[i].text for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+            self._remember([keys[i] for i in batch], batch_scores)
+
+        scored = sorted(
+            (i for i, score in enumerate(scores) if score is not None), key=lambda i: -scores[i]
+        )
+        unscored = [i for i, score in enumerate(scores) if score is None]
+        reranked = [replace(hits[i], score=scores[i]) for i in scored] + [hits[i] for i in unscored]
+        metrics.observe("rerank_seconds", time.perf_counter() - start, candidates=len(hits))
+        return reranked[:k]
@@ -0,0 +1,169 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+
+# Retrieval modes selectable per query (here so HTTP clients such as
+# Step4-chat.py can list them without importing the chat service):
+#   "vector"  - semantic search only
+#   "hybrid"  - BM25 full-text + vector search fused with reciprocal rank fusion;
+#               falls back to BM25 alone if the embedding call exceeds
+#               the chat service's VECTOR_TIMEOUT
+#   "lexical" - BM25 only, no embedding call (exact terms, clause numbers, names)
+RETRIEVAL_MODES = ["hybrid", "vector", "lexical"]
+
+RESULT_COLUMNS = ["text", "metadata"]
+# The result columns plus the score each query type ranks by, which LanceDB
+# only returns with an explicit select when given one
+VECTOR_RESULT_COLUMNS = RESULT_COLUMNS + ["_distance"]
+FTS_RESULT_COLUMNS = RESULT_COLUMNS + ["_score"]
+# Score columns LanceDB and the fusion/rerank helpers attach to result rows
+SCORE_COLUMNS = ("_rrf_score", "_score", "_distance")
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    """One retrieved chunk with its citation metadata.
+
+    ``score`` is higher-is-better whatever the search mode: the fused score
+    for hybrid search, the BM25 score for lexical search and
+    ``1 - distance`` for vector search (the cosine similarity with the
+    cosine metric).
+    """
+
+    text: str
+    score: float
+    filename: Optional[str] = None
+    pages: Tuple[int, ...] = ()
+    title: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SearchHit":
+        """Inverse of ``dataclasses.asdict``, e.g. for hits received as JSON."""
+        return cls(**{**data, "pages": tuple(data.get("pages") or ())})
+
+    @property
+    def source(self) -> str:
+        """Citation such as ``report.pdf - p. 3, 4``."""
+        parts = []
+        if self.filename:
+            parts.append(self.filename)
+        if self.pages:
+            parts.append(f"p. {', '.join(str(p) for p in self.pages)}")
+        return " - ".join(parts)
+
+    def to_context(self) -> str:
+        """The chunk followed by its source (and title) lines, as given to the model."""
+        context = f"{self.text}\nSource: {self.source}"
+        if self.title:
+            context += f"\nTitle: {self.title}"
+        return context
+
+
+def _score(row: dict) -> float:
+    for column in SCORE_COLUMNS:
+        value = row.get(column)
+        if value is not None:
+            return 1.0 - value if column == "_distance" else float(value)
+    return 0.0
+
+
+def hits_from_rows(rows: Iterable[dict]) -> List[SearchHit]:
+    """Converts result rows (``to_list()`` output, fused or reranked rows) to hits."""
+    hits = []
+    for row in rows:
+        metadata = row.get("metadata") or {}
+        hits.append(
+            SearchHit(
+                text=row["text"],
+                score=_score(row),
+                filename=metadata.get("filename"),
+                pages=tuple(metadata.get("page_numbers") or ()),
+                title=metadata.get("title"),
+            )
+        )
+    return hits
+
+
+def hits_from_arrow(results: pa.Table) -> List[SearchHit]:
+    """Converts a ``to_arrow()`` result to hits column by column, without per-row dicts."""
+    if results.num_rows == 0:
+        return []
+    metadata = results.column("metadata").combine_chunks()
+    score_column = next((c for c in SCORE_COLUMNS if c in results.column_names), None)
+    if score_column is None:
+        scores: Sequence[float] = [0.0] * results.num_rows
+    else:
+        scores = results.column(score_column).to_pylist()
+        if score_column == "_distance":
+            scores = [1.0 - value for value in scores]
+    return [
+        SearchHit(text, score, filename, tuple(pages or ()), title)
+        for text, score, filename, pages, title in zip(
+            results.column("text").to_pylist(),
+            scores,
+            metadata.field("filename").to_pylist(),
+            metadata.field("page_numbers").to_pylist(),
+            metadata.field("title").to_pylist(),
+        )
+    ]
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def metadata_filter(
+    filenames: Optional[Sequence[str]] = None,
+    pages: Optional[Tuple[int, int]] = None,
+    sources: Optional[Sequence[str]] = None,
+    include_duplicates: bool = False,
+) -> Optional[str]:
+    """Builds the SQL ``where`` clause restricting a search to some documents and pages.
+
+    Args:
+        filenames: Keep chunks of these files (``metadata.filename``)
+        pages: Keep chunks with any page in this inclusive (first, last) range
+        sources: Keep chunks of these sources (``metadata.source``)
+        include_duplicates: Also keep deduplicated rows whose duplicates came
+            from these files or sources, or from these pages (tables with
+            ``duplicate_*`` metadata, see utils/near_duplicates.py). The OR
+            over the duplicate lists cannot be resolved from the scalar
+            indexes, so such a filter scans the rows instead. Duplicate pages
+            are not paired with their filenames, and their first and last
+            page across all duplicates are compared with the range, so this
+            may keep extra rows but never drops a matching one.
+
+    Returns:
+        The filter, or None when nothing is restricted
+    """
+    clauses = []
+    for field, values in (("filename", filenames), ("source", sources)):
+        if not values:
+            continue
+        quoted = ", ".join(_sql_string(v) for v in values)
+        clause = f"metadata.{field} IN ({quoted})"
+        if include_duplicates:
+            clause = f"({clause} OR array_has_any(metadata.duplicate_{field}s, [{quoted}]))"
+        clauses.append(clause)
+    if pages:
+        # A chunk's pages are consecutive, so it overlaps the range when its
+        # first page is at most ``last`` and its last page at least ``first``
+        first, last = int(pages[0]), int(pages[1])
+        clause = (
+            f"(array_min(metadata.page_numbers) <= {last} "
+            f"AND array_max(metadata.page_numbers) >= {first})"
+        )
+        if include_duplicates:
+            duplicate_pages = "flatten(metadata.duplicate_page_numbers)"
+            clause = (
+                f"({clause} OR (array_min({duplicate_pages}) <= {last} "
+                f"AND array_max({duplicate_pages}) >= {first}))"
+            )
+        clauses.append(clause)
+    return " AND ".join(clauses) or None
+
+
+def format_context(hits: Sequence[SearchHit]) -> str:
+    """Joins the hits into the context block of the system prompt."""
+    return "\n\n".join(hit.to_context() for hit in hits)
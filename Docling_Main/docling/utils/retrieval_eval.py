@@ -0,0 +1,233 @@
+"""Retrieval evaluation: recall@k, MRR and latency over a labelled question set.
+
+Questions are JSON lines naming the chunks that answer them by filename
+and, optionally, pages:
+
+    {"query": "What is the notice period?", "relevant": [{"filename": "contract.pdf", "pages": [3]}]}
+
+A hit counts for a label when its filename matches and, if the label has
+pages, it covers one of them. Quality comes from one ``retrieve_batch``
+over all questions; latency from timing single ``retrieve`` calls, as a
+chat turn makes them. Run from the Docling_Main/docling directory against
+a collection (the query embeddings need the OpenAI API; for an offline run
+on a synthetic corpus see benchmarks/eval_retrieval.py):
+
+    python -m utils.retrieval_eval --questions data/eval/questions.jsonl --modes vector hybrid lexical
+"""
+
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.chat_service import make_reranker, retrieve, retrieve_batch
+from utils.metrics import QUANTILES
+from utils.retrieval import SearchHit
+
+
+@dataclass(frozen=True)
+class RelevantChunk:
+    """A chunk that answers a question, identified by its file and (optionally) pages."""
+
+    filename: str
+    pages: Tuple[int, ...] = ()
+
+    def matches(self, hit: SearchHit) -> bool:
+        if hit.filename != self.filename:
+            return False
+        return not self.pages or any(page in hit.pages for page in self.pages)
+
+
+@dataclass
+class LabelledQuestion:
+    query: str
+    relevant: List[RelevantChunk]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LabelledQuestion":
+        relevant = [
+            RelevantChunk(label["filename"], tuple(label.get("pages") or ()))
+            for label in data["relevant"]
+        ]
+        return cls(data["query"], relevant)
+
+
+def load_questions(path: str) -> List[LabelledQuestion]:
+    with open(path, encoding="utf-8") as f:
+        return [LabelledQuestion.from_dict(json.loads(line)) for line in f if line.strip()]
+
+
+def save_questions(questions: Sequence[LabelledQuestion], path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for question in questions:
+            f.write(json.dumps(asdict(question)) + "\n")
+
+
+def relevant_ranks(
+    hits: Sequence[SearchHit], relevant: Sequence[RelevantChunk]
+) -> List[Optional[int]]:
+    """The 1-based rank of the first hit matching each label, None where no hit does."""
+    return [
+        next((rank for rank, hit in enumerate(hits, 1) if label.matches(hit)), None)
+        for label in relevant
+    ]
+
+
+def recall_at(ranks: Sequence[Optional[int]], k: int) -> float:
+    """Share of a question's labels found in its top ``k`` hits."""
+    return sum(rank is not None and rank <= k for rank in ranks) / len(ranks) if ranks else 0.0
+
+
+def reciprocal_rank(ranks: Sequence[Optional[int]]) -> float:
+    """1 / rank of the first relevant hit, 0 when none was retrieved."""
+    found = [rank for rank in ranks if rank is not None]
+    return 1.0 / min(found) if found else 0.0
+
+
+@dataclass
+class QuestionResult:
+    query: str
+    ranks: List[Optional[int]]
+    seconds: Optional[float] = None  # Latency of a single retrieve call, if timed
+
+
+@dataclass
+class EvalReport:
+    """Quality and speed of one retrieval mode over a question set.
+
+    ``recall`` maps k to the mean share of each question's labels found in
+    its top k hits; ``mrr`` is the mean reciprocal rank of the first
+    relevant hit (0 when none is in the top max(k)). ``latency`` holds the
+    single-query percentiles in seconds, ``batch_seconds`` the time
+    retrieve_batch took for all questions.
+    """
+
+    mode: str
+    questions: int
+    recall: Dict[int, float]
+    mrr: float
+    latency: Dict[float, float]
+    batch_seconds: float
+    results: List[QuestionResult] = field(default_factory=list, repr=False)
+
+    @property
+    def batch_queries_per_second(self) -> float:
+        return self.questions / self.batch_seconds if self.batch_seconds else 0.0
+
+
+def evaluate(
+    table,
+    questions: Sequence[LabelledQuestion],
+    mode: str = "vector",
+    ks: Sequence[int] = (1, 5, 10),
+    latency_sample: Optional[int] = 200,
+    **retrieve_kwargs,
+) -> EvalReport:
+    """Scores one retrieval mode against a labelled question set.
+
+    Args:
+        table: LanceDB table to search
+        questions: Labelled questions (see load_questions)
+        mode: "vector", "hybrid" or "lexical"
+        ks: Cut-offs to report recall at; max(ks) hits are retrieved per question
+        latency_sample: Questions timed one ``retrieve`` call at a time, None for all
+        **retrieve_kwargs: Passed to retrieve and retrieve_batch (where, reranker, full_func, ...)
+
+    Returns:
+        EvalReport with a QuestionResult per question
+    """
+    max_k = max(ks)
+    queries = [question.query for question in questions]
+    start = time.perf_counter()
+    hits = retrieve_batch(table, queries, max_k, mode, **retrieve_kwargs)
+    batch_seconds = time.perf_counter() - start
+
+    results = [
+        QuestionResult(question.query, relevant_ranks(question_hits, question.relevant))
+        for question, question_hits in zip(questions, hits)
+    ]
+    timed = results if latency_sample is None else results[:latency_sample]
+    for result in timed:
+        start = time.perf_counter()
+        retrieve(table, result.query, max_k, mode, **retrieve_kwargs)
+        result.seconds = time.perf_counter() - start
+
+    recall = {k: float(np.mean([recall_at(r.ranks, k) for r in results])) for k in ks}
+    mrr = float(np.mean([reciprocal_rank(r.ranks) for r in results]))
+    latencies = [r.seconds for r in timed]
+    latency = dict(zip(QUANTILES, np.quantile(latencies, QUANTILES).tolist())) if latencies else {}
+    return EvalReport(mode, len(results), recall, mrr, latency, batch_seconds, results)
+
+
+def format_reports(reports: Sequence[EvalReport]) -> str:
+    """One table row per report: recall@k, MRR, latency percentiles and batch throughput."""
+    ks = sorted(reports[0].recall) if reports else []
+    header = f"{'mode':<10}" + "".join(f"{'R@' + str(k):>7}" for k in ks)
+    header += f"{'MRR':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'batch q/s':>11}"
+    lines = [header]
+    for report in reports:
+        line = f"{report.mode:<10}" + "".join(f"{report.recall[k]:>7.3f}" for k in ks)
+        line += f"{report.mrr:>7.3f}"
+        line += "".join(f"{report.latency.get(q, float('nan')) * 1000:>9.1f}" for q in QUANTILES)
+        line += f"{report.batch_queries_per_second:>11,.0f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def write_results(reports: Sequence[EvalReport], path: str) -> None:
+    """Writes every question's ranks and latency per mode as JSON lines, e.g. to diff runs."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for report in reports:
+            for result in report.results:
+                f.write(json.dumps({"mode": report.mode, **asdict(result)}) + "\n")
+
+
+def main():
+    import lancedb
+    from dotenv import load_dotenv
+    from lancedb.embeddings import get_registry
+
+    from utils.collection_manager import DEFAULT_COLLECTION, CollectionManager
+    from utils.embedding_cache import CachedOpenAIEmbeddings  # noqa: F401 (registers "openai-cached")
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data/lancedb")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--questions", required=True, help="Labelled questions (JSON lines)")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid", "lexical"])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--latency-sample", type=int, default=200, help="Questions timed one at a time")
+    parser.add_argument("--reranker", default="none", choices=["lexical", "cross-encoder", "none"])
+    parser.add_argument("--results", help="Write per-question ranks and latency to this .jsonl")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+    table = CollectionManager(lancedb.connect(args.db)).open(args.collection)
+    full_func = get_registry().get("openai-cached").create(name="text-embedding-3-large")
+    questions = load_questions(args.questions)
+    print(f"{len(questions):,} questions, collection {args.collection}\n")
+    reports = [
+        evaluate(
+            table,
+            questions,
+            mode,
+            args.k,
+            args.latency_sample,
+            full_func=full_func,
+            reranker=make_reranker(args.reranker),
+        )
+        for mode in args.modes
+    ]
+    print(format_reports(reports))
+    if args.results:
+        write_results(reports, args.results)
+
+
+if __name__ == "__main__":
+    main()
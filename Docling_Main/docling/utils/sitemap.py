@@ -1,59 +1,177 @@
+import asyncio
 import xml.etree.ElementTree as ET
-from typing import List
+import zlib
+from typing import AsyncIterator, List, Tuple
 from urllib.parse import urljoin
 
-import requests
+import aiohttp
 
+READ_CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
 
-def get_sitemap_urls(base_url: str, sitemap_filename: str = "sitemap.xml") -> List[str]:
-    """Fetches and parses a sitemap XML file to extract URLs.
+# Marks the end of the crawl on the output queue
+_DONE = object()
+
+
+def _namespace(tag: str) -> str:
+    """The ``{...}`` namespace prefix of a tag, or "" if it has none."""
+    return tag[: tag.index("}") + 1] if tag.startswith("{") else ""
+
+
+async def _parse_sitemap(
+    session: aiohttp.ClientSession, url: str
+) -> AsyncIterator[Tuple[str, str]]:
+    """Streams one sitemap and yields its ``<loc>`` entries as they are parsed.
+
+    The body is read in chunks, gunzipped on the fly if it is a ``.xml.gz``
+    file, and fed to an incremental parser whose finished elements are
+    dropped straight away, so memory stays flat however long the sitemap is.
+
+    Yields:
+        ("sitemap", url) for the children of a ``<sitemapindex>``,
+        ("url", url) for the pages of a ``<urlset>``
+    """
+    async with session.get(url) as response:
+        response.raise_for_status()
+        parser = ET.XMLPullParser(events=("start", "end"))
+        decompressor = None
+        root = None
+        # Open elements, so a <loc> is only taken directly under <url> / <sitemap>
+        # and not from extensions such as <image:loc>
+        open_tags: List[str] = []
+        first = True
+
+        async for data in response.content.iter_chunked(READ_CHUNK_SIZE):
+            # aiohttp already undoes Content-Encoding: gzip; this catches gzipped files
+            if first and data.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            first = False
+            parser.feed(decompressor.decompress(data) if decompressor else data)
+
+            for event, element in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = element
+                        ns = _namespace(root.tag)
+                        kind = "sitemap" if root.tag == ns + "sitemapindex" else "url"
+                    open_tags.append(element.tag)
+                    continue
+                open_tags.pop()
+                if element.tag == ns + "loc":
+                    if element.text and open_tags and open_tags[-1] in (ns + "url", ns + "sitemap"):
+                        yield kind, element.text.strip()
+                elif element.tag in (ns + "url", ns + "sitemap"):
+                    # Drop finished entries so the tree never grows
+                    root.clear()
+
+        if decompressor:
+            parser.feed(decompressor.flush())
+        parser.close()
+
+
+async def iter_sitemap_urls(
+    base_url: str,
+    sitemap_filename: str = "sitemap.xml",
+    max_concurrency: int = 8,
+    timeout: float = 10,
+    max_depth: int = 5,
+) -> AsyncIterator[str]:
+    """Crawls a sitemap and yields page URLs as soon as they are parsed.
+
+    ``<sitemapindex>`` files are expanded recursively, up to ``max_depth``
+    levels, with up to ``max_concurrency`` child sitemaps fetched at once
+    over one pooled HTTP session. Each sitemap is fetched only once, even if
+    several indexes list it.
 
     Args:
         base_url: The base URL of the website
         sitemap_filename: The filename of the sitemap (default: sitemap.xml)
+        max_concurrency: Maximum number of sitemaps fetched at the same time
+        timeout: Seconds allowed to connect and between two reads
+        max_depth: Maximum nesting of sitemap indexes
 
-    Returns:
-        List of URLs found in the sitemap. If sitemap is not found, returns a list
-        containing only the base URL.
+    Yields:
+        Page URLs, in no particular order across child sitemaps. If the top
+        sitemap is not found, only the base URL.
 
     Raises:
-        ValueError: If there's an error fetching (except 404) or parsing the sitemap
+        ValueError: If there's an error fetching (except a 404 of the top
+            sitemap) or parsing any of the sitemaps
     """
-    try:
-        sitemap_url = urljoin(base_url, sitemap_filename)
-
-        # Fetch sitemap URL
-        response = requests.get(sitemap_url, timeout=10)
-
-        # # Return just the base URL if sitemap not found
-        if response.status_code == 404:
-            return [base_url.rstrip("/")]
+    sitemap_url = urljoin(base_url, sitemap_filename)
+    todo: asyncio.Queue = asyncio.Queue()
+    output: asyncio.Queue = asyncio.Queue(maxsize=10_000)
+    seen = {sitemap_url}
+    todo.put_nowait((sitemap_url, 0))
+
+    async def worker(session: aiohttp.ClientSession):
+        while True:
+            url, depth = await todo.get()
+            try:
+                async for kind, loc in _parse_sitemap(session, url):
+                    if kind == "url":
+                        await output.put(loc)
+                    elif depth < max_depth and loc not in seen:
+                        seen.add(loc)
+                        todo.put_nowait((loc, depth + 1))
+            except aiohttp.ClientResponseError as e:
+                if e.status == 404 and depth == 0:
+                    # Return just the base URL if sitemap not found
+                    await output.put(base_url.rstrip("/"))
+                else:
+                    await output.put(ValueError(f"Failed to fetch sitemap {url}: {e}"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                await output.put(ValueError(f"Failed to fetch sitemap {url}: {e!r}"))
+            except ET.ParseError as e:
+                await output.put(ValueError(f"Failed to parse sitemap XML {url}: {e}"))
+            except zlib.error as e:
+                await output.put(ValueError(f"Failed to decompress sitemap {url}: {e}"))
+            finally:
+                todo.task_done()
+
+    async def finish():
+        await todo.join()
+        await output.put(_DONE)
+
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    async with aiohttp.ClientSession(timeout=client_timeout, connector=connector) as session:
+        tasks = [asyncio.create_task(worker(session)) for _ in range(max_concurrency)]
+        tasks.append(asyncio.create_task(finish()))
+        try:
+            while (item := await output.get()) is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def get_sitemap_urls(base_url: str, sitemap_filename: str = "sitemap.xml", **kwargs) -> List[str]:
+    """Fetches and parses a sitemap XML file to extract URLs.
 
-        response.raise_for_status()
+    Blocking wrapper around ``iter_sitemap_urls`` (which takes the same
+    keyword arguments); call that one directly from async code.
 
-        # Parse XML content
-        root = ET.fromstring(response.content)
+    Args:
+        base_url: The base URL of the website
+        sitemap_filename: The filename of the sitemap (default: sitemap.xml)
 
-        # Handle different XML namespaces that sitemaps might use
-        namespaces = (
-            {"ns": root.tag.split("}")[0].strip("{")} if "}" in root.tag else ""
-        )
+    Returns:
+        List of URLs found in the sitemap and its child sitemaps. If sitemap
+        is not found, returns a list containing only the base URL.
 
-        # Extract URLs using namespace if present
-        if namespaces:
-            urls = [elem.text for elem in root.findall(".//ns:loc", namespaces)]
-        else:
-            urls = [elem.text for elem in root.findall(".//loc")]
+    Raises:
+        ValueError: If there's an error fetching (except 404) or parsing the sitemap
+    """
 
-        return urls
+    async def collect():
+        return [url async for url in iter_sitemap_urls(base_url, sitemap_filename, **kwargs)]
 
-    except requests.RequestException as e:
-        raise ValueError(f"Failed to fetch sitemap: {str(e)}")
-    except ET.ParseError as e:
-        raise ValueError(f"Failed to parse sitemap XML: {str(e)}")
-    except Exception as e:
-        raise ValueError(f"Unexpected error processing sitemap: {str(e)}")
+    return asyncio.run(collect())
 
 
 if __name__ == "__main__":
-    print(get_sitemap_urls("https://ds4sd.github.io/docling/"))
\ No newline at end of file
+    print(get_sitemap_urls("https://ds4sd.github.io/docling/"))
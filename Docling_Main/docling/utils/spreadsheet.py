@@ -0,0 +1,225 @@
+import datetime
+import os
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from utils.ingestion import is_url
+from utils.metrics import metrics
+
+SPREADSHEET_EXTENSIONS = (".xlsx", ".xlsm")
+
+
+def is_spreadsheet(source: str) -> bool:
+    """Whether a source is an Excel workbook openpyxl can stream."""
+    path = urlparse(source).path if is_url(source) else source
+    return os.path.splitext(path)[1].lower() in SPREADSHEET_EXTENSIONS
+
+
+@dataclass
+class RowWindowMeta:
+    """Where a row window comes from, shaped like a docling chunk's ``meta``."""
+
+    filename: str
+    sheet: str
+    row_start: int
+    row_end: int
+    # Sheets have no pages
+    doc_items: Sequence = ()
+
+    @property
+    def origin(self) -> "RowWindowMeta":
+        # Docling chunks expose the filename as meta.origin.filename
+        return self
+
+    @property
+    def headings(self) -> List[str]:
+        return [self.sheet]
+
+
+@dataclass
+class RowWindow:
+    """Consecutive rows of one sheet, as a markdown table under the sheet's header row."""
+
+    text: str
+    meta: RowWindowMeta = field(repr=False)
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value).replace("|", "\\|").replace("\r", " ").replace("\n", " ").strip()
+
+
+def _table_line(cells: Sequence[str]) -> str:
+    return "| " + " | ".join(cells) + " |"
+
+
+def _parse_rows(archive, worksheet_path: str, shared_strings, workbook) -> Iterator[Tuple[int, List[dict]]]:
+    """Parses the rows of one sheet with openpyxl's WorkSheetParser, one at a time.
+
+    openpyxl's read-only ``iter_rows`` keeps every parsed ``<row>`` (emptied,
+    but still a child of ``<sheetData>``) and the attributes of every
+    formatted row until the sheet ends. Here both are cleared after each
+    row, so nothing accumulates.
+
+    Yields:
+        Tuples of (1-based row number, cells as openpyxl's parser returns them)
+    """
+    from openpyxl.worksheet._reader import DATA_TAG, ROW_TAG, WorkSheetParser
+    from openpyxl.xml.functions import iterparse
+
+    with archive.open(worksheet_path) as source:
+        parser = WorkSheetParser(
+            source,
+            shared_strings,
+            data_only=True,
+            epoch=workbook.epoch,
+            date_formats=workbook._date_formats,
+            timedelta_formats=workbook._timedelta_formats,
+        )
+        sheet_data = None
+        for event, element in iterparse(source, events=("start", "end")):
+            if event == "start":
+                if element.tag == DATA_TAG:
+                    sheet_data = element
+            elif element.tag == ROW_TAG:
+                row = parser.parse_row(element)
+                sheet_data.clear()
+                parser.row_dimensions.clear()
+                yield row
+
+
+def iter_sheet_rows(
+    path, sheets: Optional[Sequence[str]] = None
+) -> Iterator[Tuple[str, int, List[str]]]:
+    """Streams the non-empty rows of a workbook, sheet by sheet, as cell texts.
+
+    Only the workbook parts (sheet list, shared strings, number formats) are
+    loaded up front, once; each sheet's XML is then parsed row by row (see
+    _parse_rows), so memory stays flat however many rows it has. This skips
+    ``load_workbook(read_only=True)``, which sizes every sheet lacking a
+    ``<dimension>`` element by parsing all of it into one tree.
+
+    Args:
+        path: Path (or binary file object) of the .xlsx workbook
+        sheets: Names of the sheets to read, None for all
+
+    Yields:
+        Tuples of (sheet name, 1-based row number, cell texts)
+    """
+    try:
+        from openpyxl.reader.excel import ExcelReader
+        from openpyxl.styles.stylesheet import apply_stylesheet
+    except ImportError as e:
+        raise ImportError("Spreadsheet ingestion needs openpyxl: pip install openpyxl") from e
+
+    reader = ExcelReader(path, read_only=True, data_only=True)
+    try:
+        reader.read_manifest()
+        reader.read_strings()
+        reader.read_workbook()
+        apply_stylesheet(reader.archive, reader.wb)
+        for sheet, rel in reader.parser.find_sheets():
+            if rel.target not in reader.valid_files or "chartsheet" in rel.Type:
+                continue
+            if sheets is not None and sheet.name not in sheets:
+                continue
+            rows = _parse_rows(reader.archive, rel.target, reader.shared_strings, reader.wb)
+            for row_number, parsed in rows:
+                if not parsed:
+                    continue
+                # Cells are sparse: empty ones are missing from the XML
+                cells = [""] * max(cell["column"] for cell in parsed)
+                for cell in parsed:
+                    cells[cell["column"] - 1] = _cell_text(cell["value"])
+                while cells and not cells[-1]:
+                    cells.pop()
+                if cells:
+                    yield sheet.name, row_number, cells
+    finally:
+        reader.archive.close()
+
+
+class SpreadsheetChunker:
+    """Cuts sheets into token-bounded windows of consecutive rows.
+
+    The first non-empty row of every sheet is its header. Each window is a
+    markdown table: a line naming the sheet and row range, the header row,
+    then as many rows as fit in ``max_tokens``, so every chunk carries the
+    column names its values belong to. Rows are counted with the tiktoken
+    encoding directly, since memoizing millions of distinct rows would only
+    churn the tokenizer's count cache. A row too long for a window on its
+    own is cut to fit. Only the current window is held in memory, however
+    many rows the workbook has.
+
+    Args:
+        tokenizer: OpenAICompatibleTokenizerWrapper (or anything with ``count_tokens``
+            and a tiktoken ``tokenizer``)
+        max_tokens: Tokens per window, header included
+        sheets: Names of the sheets to read, None for all
+    """
+
+    def __init__(self, tokenizer, max_tokens: int = 512, sheets: Optional[Sequence[str]] = None):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.sheets = sheets
+
+    def _count(self, text: str) -> int:
+        return len(self.tokenizer.tokenizer.encode_ordinary(text))
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        ids = self.tokenizer.tokenizer.encode_ordinary(text)
+        return self.tokenizer.tokenizer.decode(ids[: max(0, max_tokens - 2)]) + " …"
+
+    def chunk(self, path, filename: Optional[str] = None) -> Iterator[RowWindow]:
+        """Streams the row windows of a workbook.
+
+        Args:
+            path: Path (or binary file object) of the .xlsx workbook
+            filename: Filename recorded in the chunks' metadata (defaults to the path's)
+        """
+        filename = filename or os.path.basename(str(path))
+        sheet = header = None
+        lines: List[str] = []
+        tokens = first_row = last_row = 0
+
+        def window() -> RowWindow:
+            title = f"Sheet {sheet}, rows {first_row}-{last_row}"
+            text = "\n".join([title, header, *lines])
+            return RowWindow(text, RowWindowMeta(filename, sheet, first_row, last_row))
+
+        for row_sheet, row_number, cells in iter_sheet_rows(path, self.sheets):
+            metrics.count("spreadsheet_rows")
+            if row_sheet != sheet:
+                if lines:
+                    yield window()
+                sheet, lines = row_sheet, []
+                columns = [cell or f"Column {i}" for i, cell in enumerate(cells, 1)]
+                header = "\n".join([_table_line(columns), _table_line(["---"] * len(columns))])
+                # The title line is counted with a generous row range
+                header_tokens = self.tokenizer.count_tokens(
+                    f"Sheet {sheet}, rows {row_number}-{row_number + 10**6}\n{header}"
+                )
+                continue
+
+            line = _table_line(cells)
+            line_tokens = self._count(line) + 1
+            if lines and header_tokens + tokens + line_tokens > self.max_tokens:
+                yield window()
+                lines = []
+            if not lines:
+                tokens, first_row = 0, row_number
+                if header_tokens + line_tokens > self.max_tokens:
+                    line = self._truncate(line, self.max_tokens - header_tokens - 1)
+                    line_tokens = self._count(line) + 1
+            lines.append(line)
+            tokens += line_tokens
+            last_row = row_number
+
+        if lines:
+            yield window()
@@ -0,0 +1,232 @@
+"""Streaming export of a chunk table to Parquet or Arrow IPC, plus a capped Excel preview.
+
+Record batches are read from LanceDB and written one at a time, so only
+``batch_size`` rows are in memory however large the table is. Arrow IPC
+files are uncompressed and can be memory-mapped by downstream tools
+(``pyarrow.ipc.open_file(pyarrow.memory_map(path))``, polars, DuckDB);
+Parquet files are smaller. Vector columns are left out unless asked for.
+
+Run from the Docling_Main/docling directory:
+
+    python -m utils.table_export --collection docling --out data/exports/docling.parquet
+    python -m utils.table_export --out data/exports/docling.arrow --columns text metadata.filename vector
+    python -m utils.table_export --out data/exports/docling.parquet --excel-preview data/exports/docling.xlsx
+"""
+
+import argparse
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.vector_storage import VECTOR_COLUMNS
+
+EXPORT_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+# Text and the metadata fields worth reading in a spreadsheet
+PREVIEW_COLUMNS = (
+    "text",
+    "metadata.filename",
+    "metadata.page_numbers",
+    "metadata.title",
+    "metadata.source",
+)
+EXCEL_MAX_ROWS = 1_048_575  # Excel's row limit, minus the header row
+EXCEL_MAX_CELL_CHARS = 32_767
+
+
+@dataclass
+class ExportReport:
+    path: str
+    rows: int
+    bytes: int
+    seconds: float
+
+
+def export_columns(
+    table, columns: Optional[Sequence[str]] = None, include_vectors: bool = False
+) -> Union[List[str], Dict[str, str]]:
+    """Resolves the columns to export into a LanceDB ``select``.
+
+    Args:
+        table: LanceDB table
+        columns: Column names; nested fields such as ``metadata.filename`` are
+            exported as top-level columns named after their last part. None
+            for every top-level column.
+        include_vectors: With ``columns=None``, also export the vector columns
+
+    Returns:
+        A list of top-level columns, or an {output name: column path} mapping
+    """
+    if columns is None:
+        return [
+            name for name in table.schema.names if include_vectors or name not in VECTOR_COLUMNS
+        ]
+    if all("." not in column for column in columns):
+        return list(columns)
+    selection = {}
+    for column in columns:
+        name = column.rsplit(".", 1)[-1]
+        if name in selection:
+            name = column.replace(".", "_")
+        selection[name] = column
+    return selection
+
+
+def _format_of(path: str, format: Optional[str]) -> str:
+    if format is not None:
+        return format
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Cannot tell the export format of {path!r}; use one of "
+            f"{', '.join(EXPORT_FORMATS)} or pass format='parquet' / 'arrow'"
+        )
+    return EXPORT_FORMATS[extension]
+
+
+def export_table(
+    table,
+    path: str,
+    columns: Optional[Sequence[str]] = None,
+    include_vectors: bool = False,
+    where: Optional[str] = None,
+    format: Optional[str] = None,
+    batch_size: int = 10_000,
+    compression: str = "zstd",
+) -> ExportReport:
+    """Streams a table's rows into a Parquet or Arrow IPC file.
+
+    The file is written next to ``path`` and renamed into place once
+    complete, so readers never see a partial export.
+
+    Args:
+        table: LanceDB table
+        path: Output file; ``.parquet``, or ``.arrow`` / ``.feather`` / ``.ipc`` for Arrow IPC
+        columns: Columns to export (see export_columns), None for all but the vectors
+        include_vectors: With ``columns=None``, also export the vector columns
+        where: SQL filter on the rows to export (see metadata_filter)
+        format: "parquet" or "arrow", None to go by the extension
+        batch_size: Rows read and written at a time
+        compression: Parquet compression codec (Arrow IPC files stay uncompressed
+            so they can be memory-mapped)
+
+    Returns:
+        ExportReport with the rows and bytes written
+    """
+    format = _format_of(path, format)
+    start = time.perf_counter()
+    query = table.search().select(export_columns(table, columns, include_vectors)).limit(None)
+    if where:
+        query = query.where(where)
+    batches = query.to_batches(batch_size)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial = f"{path}.partial"
+    rows = 0
+    if format == "parquet":
+        writer = pq.ParquetWriter(partial, batches.schema, compression=compression)
+    else:
+        writer = pa.ipc.new_file(partial, batches.schema)
+    try:
+        for batch in batches:
+            if format == "parquet":
+                writer.write_batch(batch, row_group_size=batch_size)
+            else:
+                writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    os.replace(partial, path)
+    return ExportReport(path, rows, os.path.getsize(path), time.perf_counter() - start)
+
+
+def _excel_value(value):
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    if isinstance(value, str) and len(value) > EXCEL_MAX_CELL_CHARS:
+        value = value[: EXCEL_MAX_CELL_CHARS - 1] + "…"
+    return value
+
+
+def export_excel_preview(
+    table,
+    path: str,
+    max_rows: int = 1000,
+    columns: Sequence[str] = PREVIEW_COLUMNS,
+    where: Optional[str] = None,
+) -> ExportReport:
+    """Writes the first ``max_rows`` rows' text and metadata to an Excel sheet.
+
+    Meant for eyeballing chunks, not for analysis: vectors are never
+    included, lists are joined into one cell, long texts are cut to
+    Excel's cell limit and rows are streamed with openpyxl's write-only mode.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise ImportError("The Excel preview needs openpyxl: pip install openpyxl") from e
+
+    start = time.perf_counter()
+    max_rows = min(max_rows, EXCEL_MAX_ROWS)
+    available = [c for c in columns if c.split(".", 1)[0] in table.schema.names]
+    query = table.search().select(export_columns(table, available)).limit(max_rows)
+    if where:
+        query = query.where(where)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("chunks")
+    rows = 0
+    header_written = False
+    for batch in query.to_batches(1000):
+        if not header_written:
+            sheet.append(batch.schema.names)
+            header_written = True
+        columns_data = [column.to_pylist() for column in batch.columns]
+        for values in zip(*columns_data):
+            sheet.append([_excel_value(v) for v in values])
+        rows += batch.num_rows
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    workbook.save(path)
+    return ExportReport(path, rows, os.path.getsize(path), time.perf_counter() - start)
+
+
+def main():
+    import lancedb
+
+    from utils.collection_manager import DEFAULT_COLLECTION, CollectionManager
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data/lancedb")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--out", required=True, help="Output file (.parquet, or .arrow for Arrow IPC)")
+    parser.add_argument("--columns", nargs="+", help="Columns to export, e.g. text metadata.filename")
+    parser.add_argument("--include-vectors", action="store_true", help="Export the vector columns too")
+    parser.add_argument("--where", help="SQL filter on the rows to export")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--excel-preview", help="Also write the first rows' text and metadata to this .xlsx")
+    parser.add_argument("--excel-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    table = CollectionManager(lancedb.connect(args.db)).open(args.collection)
+    report = export_table(
+        table,
+        args.out,
+        columns=args.columns,
+        include_vectors=args.include_vectors,
+        where=args.where,
+        batch_size=args.batch_size,
+    )
+    print(
+        f"Exported {report.rows:,} rows to {report.path} "
+        f"({report.bytes / 1e6:.1f} MB, {report.seconds:.1f}s)"
+    )
+    if args.excel_preview:
+        preview = export_excel_preview(table, args.excel_preview, args.excel_rows, where=args.where)
+        print(f"Excel preview of {preview.rows:,} rows written to {preview.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
-from typing import Dict, List, Tuple
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from tiktoken import get_encoding
 from transformers.tokenization_utils_base import PreTrainedTokenizerBase
@@ -9,22 +12,90 @@ class OpenAICompatibleTokenizerWrapper(PreTrainedTokenizerBase):
     """Minimal wrapper for OpenAI's tokenizer."""
 
     def __init__(
-        self, model_name: str = "cl100k_base", max_length: int = 8191, **kwargs
+        self,
+        model_name: str = "cl100k_base",
+        max_length: int = 8191,
+        count_cache_size: int = 65536,
+        **kwargs,
     ):
         """Initialize the tokenizer.
 
         Args:
             model_name: The name of the OpenAI encoding to use
             max_length: Maximum sequence length
+            count_cache_size: Number of token counts memoized by count_tokens
+                (keyed by a 16-byte digest of the text, not the text itself)
         """
         super().__init__(model_max_length=max_length, **kwargs)
         self.tokenizer = get_encoding(model_name)
         self._vocab_size = self.tokenizer.max_token_value
+        self._vocab: Optional[Dict[str, int]] = None
+        self._count_cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._count_cache_size = count_cache_size
+        # Shared by the chunk and write threads of Step3 and the chat service's packing threads
+        self._count_lock = threading.Lock()
 
     def tokenize(self, text: str, **kwargs) -> List[str]:
         """Main method used by HybridChunker."""
         return [str(t) for t in self.tokenizer.encode(text)]
 
+    def encode(self, text: str, *args, **kwargs) -> List[int]:
+        """Fast path returning tiktoken ids directly.
+
+        Skips the tokenize -> str -> int round-trip of PreTrainedTokenizerBase;
+        this is what semchunk uses to measure spans when HybridChunker splits
+        oversized chunks. The encoding adds no special tokens.
+        """
+        return self.tokenizer.encode_ordinary(text)
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens without building a list of token strings.
+
+        Counts are memoized (least recently used first out), since the
+        chunker measures the same spans repeatedly while merging peers.
+        Safe to call from several threads.
+        """
+        key = self._count_key(text)
+        count = self._cached_count(key)
+        if count is None:
+            count = len(self.tokenizer.encode_ordinary(text))
+            self._remember_count(key, count)
+        return count
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: int = 8) -> List[int]:
+        """Count tokens of many texts, encoding the uncached ones with tiktoken's threaded batch API."""
+        keys = [self._count_key(text) for text in texts]
+        counts = [self._cached_count(key) for key in keys]
+        missing = {key: text for key, text, count in zip(keys, texts, counts) if count is None}
+        if missing:
+            encoded = self.tokenizer.encode_ordinary_batch(
+                list(missing.values()), num_threads=num_threads
+            )
+            found = dict(zip(missing, (len(ids) for ids in encoded)))
+            for key, count in found.items():
+                self._remember_count(key, count)
+            counts = [found[key] if count is None else count for key, count in zip(keys, counts)]
+        return counts
+
+    @staticmethod
+    def _count_key(text: str) -> bytes:
+        # Chunks can be tens of KB; the cache keeps a digest instead of the text
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _cached_count(self, key: bytes) -> Optional[int]:
+        with self._count_lock:
+            count = self._count_cache.get(key)
+            if count is not None:
+                self._count_cache.move_to_end(key)
+            return count
+
+    def _remember_count(self, key: bytes, count: int) -> None:
+        with self._count_lock:
+            self._count_cache[key] = count
+            self._count_cache.move_to_end(key)
+            while len(self._count_cache) > self._count_cache_size:
+                self._count_cache.popitem(last=False)
+
     def _tokenize(self, text: str) -> List[str]:
         return self.tokenize(text)
 
@@ -35,7 +106,10 @@ class OpenAICompatibleTokenizerWrapper(PreTrainedTokenizerBase):
         return str(index)
 
     def get_vocab(self) -> Dict[str, int]:
-        return dict(enumerate(range(self.vocab_size)))
+        # Built once; the vocabulary has ~100k entries
+        if self._vocab is None:
+            self._vocab = dict(enumerate(range(self.vocab_size)))
+        return self._vocab
 
     @property
     def vocab_size(self) -> int:
@@ -47,4 +121,4 @@ class OpenAICompatibleTokenizerWrapper(PreTrainedTokenizerBase):
     @classmethod
     def from_pretrained(cls, *args, **kwargs):
         """Class method to match HuggingFace's interface."""
-        return cls()
\ No newline at end of file
+        return cls()
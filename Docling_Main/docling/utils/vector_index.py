@@ -0,0 +1,113 @@
+import math
+from typing import Optional
+
+DEFAULT_INDEX_THRESHOLD = 20_000  # Below this, brute-force search is fast enough
+
+
+def has_vector_index(table, column: str = "vector") -> bool:
+    """Checks whether the table already has an index on the vector column."""
+    for index in table.list_indices():
+        columns = getattr(index, "columns", None)
+        if columns is None and isinstance(index, dict):
+            columns = index.get("columns", [])
+        if column in (columns or []):
+            return True
+    return False
+
+
+def num_sub_vectors_for(ndims: int) -> int:
+    """Picks a PQ sub-vector count that divides ``ndims``, aiming for 16 dimensions per sub-vector."""
+    for dims_per_sub_vector in (16, 8, 32, 4, 2, 1):
+        if ndims % dims_per_sub_vector == 0:
+            return ndims // dims_per_sub_vector
+    return 1
+
+
+def ensure_vector_index(
+    table,
+    min_rows: int = DEFAULT_INDEX_THRESHOLD,
+    metric: str = "cosine",
+    index_type: str = "IVF_PQ",
+    column: str = "vector",
+    num_partitions: Optional[int] = None,
+) -> str:
+    """Builds the ANN index once the table is large enough, and keeps it up to date.
+
+    - Below ``min_rows`` rows nothing happens; exact search is cheap enough.
+    - Without an index, one is trained with ~sqrt(rows) IVF partitions (at
+      most rows / 256) and 16-dimension PQ sub-vectors for IVF_PQ.
+    - With an index, ``table.optimize()`` compacts the data and adds rows
+      written since the last run to the existing index incrementally, so they
+      are not left to a brute-force scan.
+
+    Call this after every ingestion run.
+
+    Args:
+        table: LanceDB table object
+        min_rows: Row count from which an index is built
+        metric: Distance metric ("cosine", "l2" or "dot"); cosine matches OpenAI embeddings
+        index_type: "IVF_PQ" or an HNSW variant such as "IVF_HNSW_SQ"
+        column: Vector column to index
+        num_partitions: Override the number of IVF partitions
+
+    Returns:
+        "skipped", "created" or "optimized"
+    """
+    num_rows = table.count_rows()
+    if num_rows < min_rows:
+        return "skipped"
+
+    if has_vector_index(table, column):
+        table.optimize()
+        return "optimized"
+
+    ndims = table.schema.field(column).type.list_size
+    params = {
+        "metric": metric,
+        "vector_column_name": column,
+        "index_type": index_type,
+        # ~sqrt(rows) partitions, but k-means needs a few hundred rows per partition to train
+        "num_partitions": num_partitions or max(1, min(int(math.sqrt(num_rows)), num_rows // 256)),
+    }
+    if "PQ" in index_type:
+        params["num_sub_vectors"] = num_sub_vectors_for(ndims)
+
+    table.create_index(**params)
+    return "created"
+
+
+def vector_search(
+    table,
+    query,
+    num_results: int,
+    nprobes: Optional[int] = None,
+    refine_factor: Optional[int] = None,
+    exact: bool = False,
+    where: Optional[str] = None,
+):
+    """Builds a vector query with the ANN tuning knobs applied.
+
+    Args:
+        table: LanceDB table object
+        query: Query text (embedded by the table's embedding function) or vector
+        num_results: Number of results to return
+        nprobes: IVF partitions to scan; more partitions raise recall and latency
+        refine_factor: Re-rank ``num_results * refine_factor`` candidates with
+            full-precision vectors, recovering recall lost to PQ compression
+        exact: Bypass the index and do a brute-force scan (ground truth)
+        where: SQL filter applied before the vector search (see metadata_filter);
+            scalar indexes on the filtered columns keep it from scanning every row
+
+    Returns:
+        LanceDB query builder
+    """
+    search = table.search(query).limit(num_results)
+    if where:
+        search = search.where(where, prefilter=True)
+    if exact:
+        return search.bypass_vector_index()
+    if nprobes:
+        search = search.nprobes(nprobes)
+    if refine_factor:
+        search = search.refine_factor(refine_factor)
+    return search
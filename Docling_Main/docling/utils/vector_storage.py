@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.vector_index import vector_search
+
+VECTOR_COLUMNS = ("vector", "vector_q8", "vector_scale")
+
+
+def truncate_embedding(vector: Sequence[float], dims: Optional[int]) -> np.ndarray:
+    """Shortens a text-embedding-3 vector to its first ``dims`` dimensions and re-normalises it.
+
+    text-embedding-3 models are trained so that this equals requesting
+    ``dimensions=dims`` from the API, so one full-size embedding serves both
+    the reduced search vector and the full-precision rerank.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    if dims is None or dims >= len(vector):
+        return vector
+    shortened = vector[:dims]
+    norm = np.linalg.norm(shortened)
+    return shortened / norm if norm else shortened
+
+
+def quantize_int8(vector: Sequence[float]) -> tuple:
+    """Symmetric scalar quantization of a vector to int8.
+
+    Returns:
+        Tuple of (int8 codes as bytes, scale to multiply the codes by)
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    codes = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+    return codes.tobytes(), scale
+
+
+def dequantize_int8(codes: bytes, scale: float) -> np.ndarray:
+    return np.frombuffer(codes, dtype=np.int8).astype(np.float32) * scale
+
+
+@dataclass
+class VectorStorage:
+    """How embeddings are stored in the table.
+
+    - ``dims=None, int8_rerank=False``: full float32 vectors (3072 dims, ~12 KB per chunk)
+    - ``dims=256`` or ``1024``: shortened float32 vectors, searched directly
+    - ``int8_rerank=True``: additionally keeps the full vector as int8 codes
+      (``vector_q8`` plus ``vector_scale``, ~3 KB per chunk) to rerank the
+      top candidates of the shortened search at near full precision
+
+    Rows are embedded at full size once and converted with ``encode``.
+    """
+
+    dims: Optional[int] = None
+    int8_rerank: bool = False
+
+    @property
+    def reduces(self) -> bool:
+        return self.dims is not None or self.int8_rerank
+
+    def encode(self, vector: Sequence[float]) -> Dict[str, object]:
+        """Turns a full-size embedding into the columns stored for it."""
+        columns: Dict[str, object] = {"vector": truncate_embedding(vector, self.dims).tolist()}
+        if self.int8_rerank:
+            columns["vector_q8"], columns["vector_scale"] = quantize_int8(vector)
+        return columns
+
+    def encode_batch(self, matrix: np.ndarray) -> Dict[str, object]:
+        """Vectorised ``encode`` of a (rows, dims) matrix of full-size embeddings.
+
+        Returns:
+            Per stored column, one value per row: the (shortened) vectors as a
+            matrix, and in int8 rerank mode the codes as bytes and the scales
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        vectors = matrix
+        if self.dims is not None and self.dims < matrix.shape[1]:
+            vectors = matrix[:, : self.dims]
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+        columns: Dict[str, object] = {"vector": vectors}
+        if self.int8_rerank:
+            scales = np.abs(matrix).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.round(matrix / scales[:, None]), -127, 127).astype(np.int8)
+            columns["vector_q8"] = [row.tobytes() for row in codes]
+            columns["vector_scale"] = scales.astype(float)
+        return columns
+
+
+def has_int8_rerank(table) -> bool:
+    return "vector_q8" in table.schema.names
+
+
+def rerank_int8(query_vector: Sequence[float], rows: List[dict], k: int) -> List[dict]:
+    """Re-scores candidate rows by cosine similarity to their int8 full-size vectors.
+
+    Args:
+        query_vector: Full-size query embedding
+        rows: Candidates from the shortened-vector search, with ``vector_q8`` and ``vector_scale``
+        k: Number of rows to keep
+
+    Returns:
+        The ``k`` best rows, each with its ``_distance`` replaced by the rerank cosine distance
+    """
+    if not rows:
+        return rows
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= np.linalg.norm(query) or 1.0
+    matrix = np.stack([dequantize_int8(row["vector_q8"], row["vector_scale"]) for row in rows])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    similarities = matrix @ query
+
+    order = np.argsort(-similarities)[:k]
+    reranked = []
+    for i in order:
+        row = dict(rows[i])
+        row["_distance"] = float(1 - similarities[i])
+        reranked.append(row)
+    return reranked
+
+
+def search_with_int8_rerank(
+    table,
+    full_func,
+    query: str,
+    num_results: int,
+    candidates: int = 50,
+    **search_kwargs,
+) -> List[dict]:
+    """Searches the shortened vectors, then reranks the top candidates with the int8 full vectors.
+
+    The query is embedded once at full size (through ``full_func``, e.g. the
+    cached text-embedding-3-large function without ``dim``) and shortened
+    locally for the first-stage search.
+
+    Args:
+        table: LanceDB table stored with ``VectorStorage(int8_rerank=True)``
+        full_func: Embedding function producing full-size vectors
+        query: User's question
+        num_results: Number of results to return
+        candidates: Number of first-stage candidates to rerank
+        **search_kwargs: Passed to vector_search (nprobes, refine_factor, where)
+
+    Returns:
+        Rows as dicts, best first
+    """
+    full_vector = full_func.compute_query_embeddings(query)[0]
+    dims = table.schema.field("vector").type.list_size
+    rows = vector_search(
+        table, truncate_embedding(full_vector, dims), max(candidates, num_results), **search_kwargs
+    ).to_list()
+    return rerank_int8(full_vector, rows, num_results)